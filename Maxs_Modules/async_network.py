@@ -0,0 +1,774 @@
+# - - - - - - - Imports - - - - - - -#
+import time
+import types
+import asyncio
+import threading
+import collections
+import concurrent.futures
+
+from Maxs_Modules.debug import debug_message, debug_enabled
+from Maxs_Modules.network import QuizServer, QuizClient, QuizGameServer, QuizGameClient, QuizSpectatorClient, \
+    QuizMessage, QuizMessageBuffer, QuizTimingWheel, QuizTimeHistogram, QuizConnectionStats, QuizIngressLimiter, \
+    QuizLimitExceeded, RECEIVE_CHUNK_SIZE, COMPRESSION_THRESHOLD, OUTBOUND_HIGH_WATER_MARK, SLOW_CLIENT_POLICY, \
+    HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, CLOCK_SYNC_INTERVAL, MAX_FRAME_SIZE, INGRESS_RATE, INGRESS_CAPACITY, \
+    INGRESS_TYPE_LIMITS, SESSION_RECONNECT_ATTEMPTS, SESSION_RECONNECT_DELAY, network_endpoints, setup_tcp_server, \
+    connect_to_server, get_ip, FRAME_HEADER_SIZE, QuizJsonCodec
+from Maxs_Modules.websocket_network import QuizWebSocketBuffer, WEBSOCKET_REQUEST_START, WEBSOCKET_MAX_REQUEST_SIZE, \
+    WEBSOCKET_OPCODE_TEXT, WEBSOCKET_OPCODE_BINARY, WEBSOCKET_OPCODE_CLOSE, WEBSOCKET_OPCODE_PING, \
+    WEBSOCKET_OPCODE_PONG, create_handshake_response, create_frame, create_frame_header
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class AsyncQuizServer(QuizServer):
+    """
+    A version of QuizServer that runs on an asyncio event loop using streams instead of a selector. Each connection is
+    a task on the loop so there are no extra threads per player. The sync functions (send_message, close_connection
+    etc.) can still be called from the game thread, they are handed over to the loop so the connections are only ever
+    touched from one thread. Browsers can connect on the same port with a WebSocket, the messages are the same but
+    each is sent as a WebSocket message instead of a frame, see open_transport().
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the server and create the listening socket, the loop isn't started until run() is called. The
+        socket is created here so any errors binding are raised to the caller in the same way as QuizServer.
+
+        @param host: The host to listen on
+        @param port: The port to listen on
+        """
+        self.host = host
+        self.port = port
+
+        self.clients = []
+        self.client_names = []
+        self.client_codecs = {}
+        self.client_compression = {}
+        self.compression_threshold = COMPRESSION_THRESHOLD
+        self.high_water_mark = OUTBOUND_HIGH_WATER_MARK
+        self.slow_client_policy = SLOW_CLIENT_POLICY
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.heartbeat_timeout = HEARTBEAT_TIMEOUT
+        self.heartbeat_wheel = QuizTimingWheel()
+        self.max_frame_size = MAX_FRAME_SIZE
+        self.ingress_rate = INGRESS_RATE
+        self.ingress_capacity = INGRESS_CAPACITY
+        self.ingress_type_limits = INGRESS_TYPE_LIMITS
+        self.clock_estimates = {}
+        self.clock_sync_interval = CLOCK_SYNC_INTERVAL
+        self.encode_times = QuizTimeHistogram()
+        self.decode_times = QuizTimeHistogram()
+        self.connections = {}
+
+        self.loop = None
+        self.server = None
+        self.server_socket = setup_tcp_server(self.port)
+
+        network_endpoints.add(self)
+
+    def run(self) -> None:
+        """
+        Run the event loop until the server is killed, this blocks so should be called on its own thread in the same
+        way as QuizServer.run()
+        """
+        try:
+            asyncio.run(self.serve())
+
+        # Closing the server cancels serve_forever, this is expected when the server is killed
+        except asyncio.CancelledError:
+            pass
+
+    async def serve(self) -> None:
+        """
+        Start accepting connections on the listening socket and serve them until the server is closed
+        """
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.accept_connection, sock=self.server_socket)
+
+        heartbeat_task = None
+        if self.heartbeat_timeout is not None:
+            heartbeat_task = asyncio.create_task(self.run_heartbeats())
+
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            if heartbeat_task is not None:
+                heartbeat_task.cancel()
+
+    async def run_heartbeats(self) -> None:
+        """
+        Check the heartbeats once a tick until the server is closed, see QuizServer.check_heartbeats()
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_wheel.tick_length)
+            self.check_heartbeats()
+
+    async def accept_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Handles a connection from a client for as long as it is open. The writer is used in place of the socket when
+        calling the handler functions, so it is what gets stored in the list of clients. The data (sometimes called
+        key_data) is a namespace with the address of the client, the reader and the buffer for the received data.
+
+        @param reader: The stream to read from the client
+        @param writer: The stream to write to the client
+        """
+        address = writer.get_extra_info("peername")
+        debug_message(f"Accepted connection from {address}", "network_server")
+
+        try:
+            websocket, received = await asyncio.wait_for(self.open_transport(reader, writer), self.heartbeat_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                ValueError) as e:
+            debug_message(f"Couldn't open connection from {address}: {e!r}", "network_server")
+            writer.close()
+            return
+
+        # Create the data object
+        data = types.SimpleNamespace(socket_adress=address, reader=reader, websocket=websocket,
+                                     recieved_bytes=QuizMessageBuffer(self.max_frame_size),
+                                     pending=collections.deque(), last_seen=time.monotonic(),
+                                     stats=QuizConnectionStats(), limiter=QuizIngressLimiter(
+                                         self.ingress_rate, self.ingress_capacity, self.ingress_type_limits))
+
+        # Add the connection to the list of clients
+        self.connections[writer] = data
+        self.clients.append(writer)
+        self.client_names.append(address)
+        self.start_heartbeat(writer)
+
+        try:
+            # The start of a normal client's first message was read to check it isn't a WebSocket
+            data.pending.extend(data.recieved_bytes.feed(received))
+
+            # Keep handling messages until the connection is closed by either side
+            while writer in self.connections:
+                recv_data = await self.recv_bytes(writer)
+
+                # If there is no data then the connection has been closed
+                if recv_data is None:
+                    debug_message(f"Closing connection on {data.socket_adress}", "network_server")
+                    self.close_connection(writer)
+                    break
+
+                self.handle_data_received(writer, data, recv_data)
+
+        except QuizLimitExceeded as e:
+            self.reject_client(writer, str(e))
+
+        except Exception as e:
+            self.handle_error(writer, data, e)
+
+    def adopt_connection(self, connection: object, address: object, received: bytes) -> None:
+        """
+        Start serving a connection that another process accepted and handed over, see QuizServer.adopt_connection().
+        The data already received is put back into the stream so the connection is handled the same as any other.
+
+        @param connection: The socket of the client
+        @param address: The address of the client
+        @param received: The data already received from the client
+        """
+        if self.loop is None or not self.loop.is_running():
+            debug_message(f"Server isn't running, closing the connection from {address}", "network_server")
+            connection.close()
+            return
+
+        asyncio.run_coroutine_threadsafe(self.adopt(connection, received), self.loop)
+
+    async def adopt(self, connection: object, received: bytes) -> None:
+        """
+        Open the streams of an adopted connection and handle it for as long as it is open, see adopt_connection()
+
+        @param connection: The socket of the client
+        @param received: The data already received from the client
+        """
+        reader, writer = await asyncio.open_connection(sock=connection)
+        reader.feed_data(received)
+        await self.accept_connection(reader, writer)
+
+    async def open_transport(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> tuple:
+        """
+        Works out what has connected from how the connection starts. A browser opens a WebSocket with an HTTP GET,
+        which is answered here to finish the handshake, anything else is a normal client's first frame.
+
+        @param reader: The stream to read from the client
+        @param writer: The stream to write to the client
+        @return: The QuizWebSocketBuffer to read the WebSocket with (None for a normal client) and the data that has
+        been read of the first message
+        """
+        start = await reader.readexactly(len(WEBSOCKET_REQUEST_START))
+        if start != WEBSOCKET_REQUEST_START:
+            return None, start
+
+        request = start + await reader.readuntil(b"\r\n\r\n")
+        if len(request) > WEBSOCKET_MAX_REQUEST_SIZE:
+            raise ValueError("WebSocket request is too big")
+
+        response = create_handshake_response(request)
+        if response is None:
+            raise ValueError("Not a WebSocket request")
+
+        writer.write(response)
+        debug_message(f"Opened a WebSocket to {writer.get_extra_info('peername')}", "network_server")
+
+        return QuizWebSocketBuffer(self.max_frame_size), b""
+
+    async def recv_bytes(self, writer: asyncio.StreamWriter) -> bytes | None:
+        """
+        Wait for the next complete message from a client
+
+        @param writer: The client to receive from
+        @return: The data of the message (the frame header is already removed), or None if the connection was closed
+        """
+        data = self.connections[writer]
+
+        # Read until the buffer has at least one full message
+        while not data.pending:
+            chunk = await data.reader.read(RECEIVE_CHUNK_SIZE)
+            if not chunk:
+                return None
+
+            data.last_seen = time.monotonic()
+
+            if data.websocket is None:
+                data.pending.extend(data.recieved_bytes.feed(chunk))
+            elif not self.handle_websocket_data(writer, data, chunk):
+                return None
+
+        return data.pending.popleft()
+
+    def handle_websocket_data(self, writer: asyncio.StreamWriter, data: object, chunk: bytes) -> bool:
+        """
+        Add the messages in data received on a WebSocket to the connection's pending messages, pings are answered
+        straight away. Must be called on the loop.
+
+        @param writer: The client the data came from
+        @param data: The data of the connection
+        @param chunk: The data received
+        @return: False if the client has closed the WebSocket, True otherwise
+        """
+        for opcode, payload in data.websocket.feed(chunk):
+            if opcode in (WEBSOCKET_OPCODE_TEXT, WEBSOCKET_OPCODE_BINARY):
+                data.pending.append(payload)
+            elif opcode == WEBSOCKET_OPCODE_PING:
+                writer.write(create_frame(payload, WEBSOCKET_OPCODE_PONG))
+            elif opcode == WEBSOCKET_OPCODE_CLOSE:
+                return False
+
+        return True
+
+    async def recv(self, writer: asyncio.StreamWriter) -> QuizMessage | None:
+        """
+        Wait for the next message from a client and decode it. Note this is what the connection's task already does,
+        so only use this for a connection that is not being handled by accept_connection()
+
+        @param writer: The client to receive from
+        @return: The message, or None if the connection was closed
+        """
+        recv_data = await self.recv_bytes(writer)
+        if recv_data is None:
+            return None
+
+        return self.decode_message(writer, recv_data)
+
+    async def send(self, writer: asyncio.StreamWriter, message: str, message_type: str) -> None:
+        """
+        Send a message to a client and wait until it has been handed to the OS, this gives backpressure when the client
+        is slow to read
+
+        @param writer: The client to send the message to
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        message = QuizMessage(message, get_ip(), self.host, message_type)
+        frame = self.encode_frame(message, self.get_client_encoding(writer))
+        self.write_frame(writer, frame)
+        self.record_sent(writer, message, frame)
+        self.handle_message_sent(writer, message)
+        await writer.drain()
+
+    async def broadcast(self, message: str, message_type: str) -> None:
+        """
+        Send a message to all clients. The message is only encoded once per encoding and all the clients are drained
+        at the same time, so one slow client doesn't hold up the others
+
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        clients = self.clients.copy()
+        self.write_to_all(QuizMessage(message, get_ip(), self.host, message_type))
+
+        await asyncio.gather(*[writer.drain() for writer in clients], return_exceptions=True)
+
+    def send_message(self, sock: asyncio.StreamWriter, message: str, message_type: str) -> None:
+        """
+        Send a message to the client specified, can be called from any thread.
+
+        @param sock: The client (writer) to send the message on
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        message = QuizMessage(message, get_ip(), self.host, message_type)
+        frame = self.encode_frame(message, self.get_client_encoding(sock))
+        call_on_loop(self.loop, self.write_frame, sock, frame)
+        self.record_sent(sock, message, frame)
+        self.handle_message_sent(sock, message)
+
+        # Only build the debug message if it is going to be shown, as the message can be large
+        if debug_enabled():
+            debug_message(f"Sent {message}", "network_server")
+
+    def send_message_to_all(self, message: str, message_type: str) -> None:
+        """
+        Send a message to all clients, can be called from any thread.
+
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        call_on_loop(self.loop, self.write_to_all, QuizMessage(message, get_ip(), self.host, message_type))
+
+    def send_message_to_clients(self, clients: list, message: str, message_type: str) -> None:
+        """
+        Send the same message to many clients, can be called from any thread. See write_to_clients()
+
+        @param clients: The clients (writers) to send the message on
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        call_on_loop(self.loop, self.write_to_clients, clients, QuizMessage(message, get_ip(), self.host, message_type))
+
+    def write_to_all(self, message: QuizMessage) -> None:
+        """
+        Write a message to every client, must be called on the loop. See write_to_clients()
+
+        @param message: The message to write
+        """
+        # Loop over a copy as a slow client can be disconnected while writing
+        self.write_to_clients(self.clients.copy(), message)
+
+    def write_to_clients(self, clients: list, message: QuizMessage) -> None:
+        """
+        Write a message to many clients, must be called on the loop. The message is only encoded once for each
+        encoding (codec and compression) the clients are using, and the same bytes are written to each client that
+        uses it.
+
+        @param clients: The clients (writers) to write to
+        @param message: The message to write
+        """
+        frames = {}
+
+        for writer in clients:
+            encoding = self.get_client_encoding(writer)
+
+            if encoding not in frames:
+                frames[encoding] = self.encode_frame(message, encoding)
+
+            self.write_frame(writer, frames[encoding])
+            self.record_sent(writer, message, frames[encoding])
+            self.handle_message_sent(writer, message)
+
+    def write_frame(self, writer: asyncio.StreamWriter, frame: bytes) -> None:
+        """
+        Write a framed message to a client, must be called on the loop. If the client already has more than the
+        high-water mark waiting to be sent then the slow client policy is used instead, see
+        QuizServer.handle_slow_client()
+
+        @param writer: The client to write to
+        @param frame: The framed message
+        """
+        if writer not in self.connections:
+            return
+
+        # A message bigger than the mark can still be sent on its own, otherwise it would never be sent
+        waiting = writer.transport.get_write_buffer_size()
+        if waiting and waiting + len(frame) > self.high_water_mark:
+            if self.slow_client_policy == "drop":
+                debug_message(f"Client {self.connections[writer].socket_adress} is too slow, dropping message",
+                              "network_server")
+                self.handle_dropped_message(writer)
+            else:
+                debug_message(f"Client {self.connections[writer].socket_adress} is too slow, disconnecting",
+                              "network_server")
+                self.close_connection(writer)
+            return
+
+        # A WebSocket already says how long each message is, so the frame's header is swapped for a WebSocket one
+        if self.connections[writer].websocket is not None:
+            payload = memoryview(frame)[FRAME_HEADER_SIZE:]
+            opcode = WEBSOCKET_OPCODE_TEXT if payload[:1] == QuizJsonCodec.magic else WEBSOCKET_OPCODE_BINARY
+            writer.write(create_frame_header(len(payload), opcode))
+            writer.write(payload)
+            return
+
+        writer.write(frame)
+
+    def get_connection_data(self, sock: asyncio.StreamWriter) -> object:
+        """
+        Gets the data (sometimes called key_data) of a connection
+
+        @param sock: The client (writer) of the connection
+        @return: The data, or None if the client isn't connected
+        """
+        return self.connections.get(sock)
+
+    def get_queue_depth(self, sock: asyncio.StreamWriter) -> int:
+        """
+        Gets how much is waiting to be sent to a client, the transport's write buffer is used as the queue
+
+        @param sock: The client (writer)
+        @return: The number of bytes queued
+        """
+        if sock not in self.connections:
+            return 0
+
+        return sock.transport.get_write_buffer_size()
+
+    def flush_connection(self, sock: asyncio.StreamWriter) -> None:
+        """
+        Nothing to do, closing the stream sends anything already written first
+
+        @param sock: The client (writer)
+        """
+
+    def close_connection(self, sock: asyncio.StreamWriter) -> None:
+        """
+        Close a connection from a client and remove it from the list of clients, can be called from any thread.
+
+        @param sock: The client (writer) to close the connection on.
+        """
+        call_on_loop(self.loop, self.remove_connection, sock)
+
+    def remove_connection(self, writer: asyncio.StreamWriter) -> None:
+        """
+        Remove a client from the list of clients and close its stream, must be called on the loop. Does nothing if the
+        client has already been removed.
+
+        @param writer: The client to remove
+        """
+        if writer not in self.connections:
+            return
+
+        debug_message(f"Closing connection on {self.connections[writer].socket_adress}", "network_server")
+
+        # Let a browser know the WebSocket is being closed on purpose
+        if self.connections[writer].websocket is not None:
+            writer.write(create_frame(b"", WEBSOCKET_OPCODE_CLOSE))
+
+        # Remove the client and name (spectators have already been taken out of the clients)
+        del self.connections[writer]
+        if writer in self.clients:
+            client_index = self.clients.index(writer)
+            self.clients.pop(client_index)
+            self.client_names.pop(client_index)
+        self.client_codecs.pop(writer, None)
+        self.client_compression.pop(writer, None)
+        self.clock_estimates.pop(writer, None)
+        self.heartbeat_wheel.cancel(writer)
+
+        # Close the stream, any data already written is still sent first
+        writer.close()
+
+    def kill(self) -> None:
+        """
+        Kill the server, closing all the clients and then the server which stops the loop
+        """
+        # Close the clients (loop over a copy as closing a connection removes it from the list)
+        for client in self.clients.copy():
+            self.close_connection(client)
+
+        # Close the server, if the loop is running this ends serve_forever()
+        if self.server is not None:
+            call_on_loop(self.loop, self.server.close)
+        else:
+            self.server_socket.close()
+
+        network_endpoints.discard(self)
+
+
+class AsyncQuizClient(QuizClient):
+    """
+    A version of QuizClient that runs on an asyncio event loop using streams instead of a selector. The sync
+    send_message and close_connection functions can still be called from the game thread.
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the client and connect to the server. The socket is connected here so any errors connecting are
+        raised to the caller in the same way as QuizClient, it is handed to the loop when run() is called.
+
+        @param host: The host ip to connect to
+        @param port: The port to connect to
+        """
+        self.host = host
+        self.port = port
+
+        self.client = connect_to_server(self.host, self.port)
+        self.recieved_bytes = QuizMessageBuffer()
+        self.pending = collections.deque()
+
+        # Messages are sent in JSON without compression until the server says otherwise
+        self.codec = "json"
+        self.compress_threshold = None
+
+        # The room to join, only used when the server is a QuizLobbyServer
+        self.room = None
+
+        # The server pings quiet clients, so if nothing has been received for the timeout the server has gone
+        self.heartbeat_timeout = HEARTBEAT_TIMEOUT
+        self.last_received = time.monotonic()
+
+        # Given by the server once joined, used to rejoin where this client left off if the connection is lost
+        self.session = None
+        self.received_count = 0
+        self.reconnect_attempts = SESSION_RECONNECT_ATTEMPTS
+        self.reconnect_delay = SESSION_RECONNECT_DELAY
+
+        # The counters for the connection to the server, kept across reconnects
+        self.stats = QuizConnectionStats()
+        self.encode_times = QuizTimeHistogram()
+        self.decode_times = QuizTimeHistogram()
+
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self.ready = threading.Event()
+        self.closing = False
+
+        network_endpoints.add(self)
+
+    def run(self) -> None:
+        """
+        Run the event loop until the connection is closed, this blocks so should be called on its own thread in the
+        same way as QuizClient.run()
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:
+        """
+        Hand the socket to the loop and then pass each message from the server to the handle_data_received function
+        until the connection closes. If handle_error() reconnects then the new socket is served in the same way.
+        """
+        self.loop = asyncio.get_running_loop()
+        client = None
+
+        while client is not self.client:
+            reconnected = client is not None
+            client = self.client
+
+            try:
+                self.reader, self.writer = await asyncio.open_connection(sock=client)
+            finally:
+                # Let anything waiting to send carry on, even if the connection failed
+                self.ready.set()
+
+            if reconnected:
+                self.handle_reconnect()
+
+            try:
+                while True:
+                    recv_data = await self.recv_bytes()
+
+                    # If there is no data then the connection has been closed
+                    if recv_data is None:
+                        if not self.closing:
+                            raise ConnectionError("Server Closed")
+                        break
+
+                    self.handle_data_received(self.writer, None, recv_data)
+
+            except Exception as e:
+                if not self.closing:
+                    # Reconnecting blocks while it retries (see reconnect()), so the error is handled off the loop to
+                    # keep it free for anything else scheduled on it
+                    await self.loop.run_in_executor(None, self.handle_error, self.writer, None, e)
+
+    async def recv_bytes(self) -> bytes | None:
+        """
+        Wait for the next complete message from the server
+
+        @return: The data of the message (the frame header is already removed), or None if the connection was closed
+        """
+        while not self.pending:
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(RECEIVE_CHUNK_SIZE), self.heartbeat_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Server timed out")
+
+            if not chunk:
+                return None
+
+            self.last_received = time.monotonic()
+            self.pending.extend(self.recieved_bytes.feed(chunk))
+
+        return self.pending.popleft()
+
+    async def recv(self) -> QuizMessage | None:
+        """
+        Wait for the next message from the server and decode it. Note this is what serve() already does, so only use
+        this when the client is being driven without serve()
+
+        @return: The message, or None if the connection was closed
+        """
+        recv_data = await self.recv_bytes()
+        if recv_data is None:
+            return None
+
+        return self.decode_message(self.writer, recv_data)
+
+    async def send(self, message: str, message_type: str) -> None:
+        """
+        Send a message to the server and wait until it has been handed to the OS
+
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        self.writer.write(self.encode_frame(self.create_message(message, message_type)))
+        await self.writer.drain()
+
+    def send_message(self, sock: object, message: str, message_type: str) -> None:
+        """
+        Send a message to the server enclosed in a QuizMessage object, can be called from any thread. If the loop
+        hasn't connected yet then this waits for it.
+
+        @param sock: Unused as there is only one connection, kept so this can be called the same way as QuizClient
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        self.ready.wait()
+
+        # The connection failed or has been closed
+        if self.writer is None or self.closing:
+            debug_message(f"Not connected, dropping {message_type}", "network_client")
+            return
+
+        message = self.create_message(message, message_type)
+
+        if debug_enabled():
+            debug_message(f"Sending {message}", "network_client")
+
+        call_on_loop(self.loop, self.writer.write, self.encode_frame(message))
+
+    def get_queue_depth(self) -> int:
+        """
+        Gets how much is waiting to be sent to the server, the transport's write buffer is used as the queue
+
+        @return: The number of bytes queued
+        """
+        if self.writer is None:
+            return 0
+
+        return self.writer.transport.get_write_buffer_size()
+
+    def reconnect(self) -> bool:
+        """
+        Connect a new socket to the server after the connection has been lost, see QuizClient.reconnect(). This
+        blocks between the attempts so must not be called on the loop, serve() calls handle_error() (which calls this)
+        in an executor. serve() then hands the new socket to the loop and calls handle_reconnect().
+
+        @return: True if connected, False if every attempt failed
+        """
+        for attempt in range(self.reconnect_attempts):
+            try:
+                client = connect_to_server(self.host, self.port)
+                break
+            except OSError as e:
+                debug_message(f"Reconnect attempt {attempt + 1} failed: {e}", "network_client")
+                time.sleep(self.reconnect_delay)
+        else:
+            return False
+
+        # Start again as if this was a new client, the server negotiates everything again when rejoining
+        self.ready.clear()
+        self.writer = None
+        self.closing = False
+        self.recieved_bytes = QuizMessageBuffer()
+        self.pending = collections.deque()
+        self.codec = "json"
+        self.compress_threshold = None
+        self.client = client
+        return True
+
+    def close_connection(self, sock: object) -> None:
+        """
+        Close the connection to the server, can be called from any thread
+
+        @param sock: Unused as there is only one connection, kept so this can be called the same way as QuizClient
+        """
+        self.closing = True
+
+        if self.writer is not None:
+            call_on_loop(self.loop, self.writer.close)
+        else:
+            self.client.close()
+
+
+class AsyncQuizGameServer(QuizGameServer, AsyncQuizServer):
+    """
+    QuizGameServer running on the asyncio transport. The game logic is the same, the syncs are run on the loop so the
+    game data isn't read by the loop and the game thread at the same time.
+    """
+
+    def sync_game(self) -> None:
+        """
+        Sync the game data to all clients, see QuizGameServer.sync_game()
+        """
+        call_on_loop(self.loop, super().sync_game)
+
+    def sync_players(self) -> None:
+        """
+        Sync the player data to all clients, see QuizGameServer.sync_players()
+        """
+        call_on_loop(self.loop, super().sync_players)
+
+    def sync_bots(self) -> None:
+        """
+        Sync the bot data to all clients, see QuizGameServer.sync_bots()
+        """
+        call_on_loop(self.loop, super().sync_bots)
+
+
+class AsyncQuizGameClient(QuizGameClient, AsyncQuizClient):
+    """
+    QuizGameClient running on the asyncio transport, the game logic is the same.
+    """
+
+
+class AsyncQuizSpectatorClient(QuizSpectatorClient, AsyncQuizClient):
+    """
+    QuizSpectatorClient running on the asyncio transport.
+    """
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def call_on_loop(loop: asyncio.AbstractEventLoop, function: callable, *args) -> object:
+    """
+    Runs the function on the event loop and returns the result. If this is called from the loop (or the loop isn't
+    running) then it is called straight away, otherwise it is scheduled on the loop and this thread waits for it to
+    finish.
+
+    @param loop: The loop to run the function on
+    @param function: The function to run
+    @param args: The args to pass to the function
+    @return: What the function returned
+    """
+    if loop is None or not loop.is_running():
+        return function(*args)
+
+    # Check if this is already on the loop
+    try:
+        if asyncio.get_running_loop() is loop:
+            return function(*args)
+    except RuntimeError:
+        pass
+
+    future = concurrent.futures.Future()
+
+    def run_function():
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    loop.call_soon_threadsafe(run_function)
+    return future.result()
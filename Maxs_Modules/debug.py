@@ -113,15 +113,21 @@ def init_debug() -> None:
 
         def command_database(self, *args: tuple) -> None:
             """
-            Handles the database command. This will be updated in the future when the local database is implemented
+            Handles the database command, which controls the local question bank. Currently supports -h, -info,
+            -store, -use, -clear and -forget.
             @param args: A tuple of arguments to be passed to the handler, to get a list of viable arguments use -h
             """
+            from Maxs_Modules.files import UserData
+            from Maxs_Modules.question_bank import QuestionBank
+            from Maxs_Modules.tools import get_user_input_of_type, string_bool
             from Maxs_Modules.renderer import render_text
 
             # If there is no arguments, add the help argument as the default
             if len(args) == 0:
                 args = ["-h"]
 
+            user_data = UserData()
+
             # Loop through the arguments
             for arg in args:
 
@@ -130,16 +136,53 @@ def init_debug() -> None:
                     case "-h":
                         render_text("Params:")
                         render_text(" -h: Shows this help message")
+                        render_text(" -info: Shows how many questions are in the local database")
                         render_text(" -store: Store the API data in a local database?")
                         render_text(" -use: Use the local database?")
                         render_text(" -clear: Clear the local database?")
+                        render_text(" -forget: Forget which questions have been played?")
+
+                    case "-info":
+                        with QuestionBank() as bank:
+                            render_text(f"Questions: {bank.count_questions()}")
+                            for difficulty in ("easy", "medium", "hard"):
+                                render_text(f" {difficulty}: {bank.count_questions(difficulty=difficulty)}")
+                            render_text(f"Played: {len(bank.get_seen())}")
+                        render_text(f"Store: {user_data.question_bank_store}, Use: {user_data.question_bank_use}")
+
+                    case "-store":
+                        user_data.question_bank_store = get_user_input_of_type(string_bool,
+                                                                               "Store the API data (True/False): ")
+                        user_data.save()
+
+                    case "-use":
+                        user_data.question_bank_use = get_user_input_of_type(string_bool,
+                                                                             "Use the local database (True/False): ")
+                        user_data.save()
+
+                    case "-clear":
+                        if get_user_input_of_type(string_bool, "Clear the local database (True/False): "):
+                            with QuestionBank() as bank:
+                                bank.clear()
+                            render_text("Cleared the local database")
+
+                    case "-forget":
+                        if get_user_input_of_type(string_bool, "Forget the played questions (True/False): "):
+                            with QuestionBank() as bank:
+                                bank.clear_seen()
+                            render_text("Forgot the played questions")
+
+                    case _:
+                        render_text("Unknown arg: " + arg)
 
         def command_server(self, *args: tuple) -> None:
             """
-            Handles the server command. Currently only supports -h, -ip.
+            Handles the server command. Currently supports -h, -ip, -stats, -stats-dump and -lobby.
             @param args: A tuple of arguments to be passed to the handler, to get a list of viable arguments use -h
             """
-            from Maxs_Modules.network import get_ip
+            from Maxs_Modules.network import get_ip, get_network_stats, format_network_stats, start_network_stats_dump
+            from Maxs_Modules.lobby_network import get_lobby
+            from Maxs_Modules.tools import get_user_input_of_type
             from Maxs_Modules.renderer import render_text
 
             # If there is no arguments, add the help argument as the default
@@ -155,10 +198,39 @@ def init_debug() -> None:
                         render_text("Params:")
                         render_text(" -h: Shows this help message")
                         render_text(" -ip: Gets this devices ip address")
+                        render_text(" -stats: Shows the traffic, queues and timings of each server and client")
+                        render_text(" -stats-dump: Sets how often to write the stats to a file (0 to stop)")
+                        render_text(" -lobby: Runs a lobby on a port, games hosted in a room by other processes on "
+                                    "this machine are handed its players")
 
                     case "-ip":
                         render_text("IP: " + get_ip())
 
+                    case "-stats":
+                        stats = get_network_stats()
+                        if not stats:
+                            render_text("No servers or clients running")
+
+                        for line in format_network_stats(stats):
+                            render_text(line)
+
+                    case "-stats-dump":
+                        interval = get_user_input_of_type(int, "Seconds between writing the stats (0 to stop): ")
+                        file_name = start_network_stats_dump(self.save_logs_location, interval)
+                        render_text("Stopped writing the stats" if file_name is None else "Writing to " + file_name)
+
+                    case "-lobby":
+                        port = get_user_input_of_type(int, "Port: ")
+                        lobby = get_lobby(port)
+                        if lobby is None:
+                            render_text(f"Port {port} is already in use")
+                            continue
+
+                        # Kept running with no rooms, so it is there for the games started after it
+                        lobby.stop_when_empty = False
+                        render_text(f"Lobby running on {lobby.host}:{lobby.port}, see -stats for the health of its "
+                                    f"rooms")
+
                     case _:
                         render_text("Unknown arg: " + arg)
 
@@ -404,6 +476,15 @@ def debug_cli(command: list) -> None:
         QUIZ_DEBUGGER.handle(command)
 
 
+def debug_enabled() -> bool:
+    """
+    Checks if the debugger is initialized, use this to skip building debug messages that are expensive to create (i.e.
+    printing a whole network message)
+    @return: True if debug messages will be shown, False if not
+    """
+    return QUIZ_DEBUGGER is not None
+
+
 def debug_message(message: str, log_type: str = "info") -> None:
     """
     If the debugger is initialized and debug is enabled, print a debug message via the log() function of the debugger
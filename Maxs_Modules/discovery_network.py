@@ -0,0 +1,240 @@
+# - - - - - - - Imports - - - - - - -#
+import json
+import time
+import socket
+import secrets
+import selectors
+import threading
+
+from Maxs_Modules.files import SaveFile, DATA_FOLDER
+from Maxs_Modules.debug import debug_message
+
+# - - - - - - - Variables - - - - - - -#
+
+# The UDP port the servers listen for discovery requests on, next to the default game port
+DISCOVERY_PORT = 1235
+DISCOVERY_REQUEST = "discover"
+DISCOVERY_RESPONSE = "server"
+DISCOVERY_PACKET_SIZE = 1024
+
+# How long to collect responses for (seconds), long enough for any server on the LAN to reply
+DISCOVERY_TIMEOUT = 0.3
+
+# How often the responder checks if it should stop (seconds)
+DISCOVERY_POLL_INTERVAL = 0.5
+
+# Servers that have replied recently are kept so they can be asked directly as well as by broadcast (seconds)
+DISCOVERY_CACHE_FILE = DATA_FOLDER + "servers.json"
+DISCOVERY_CACHE_TIME = 60 * 60
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class QuizDiscoveryResponder:
+    """
+    Answers discovery requests from clients on the LAN with the name, player count and port of a game that is waiting
+    for players. Runs on its own thread beside the game's server, see start() and stop().
+    """
+
+    def __init__(self, game: object, port: int, discovery_port: int = DISCOVERY_PORT):
+        """
+        Create the responder, it doesn't listen until start() is called
+
+        @param game: The game to advertise
+        @param port: The port the game's server is listening on
+        @param discovery_port: The UDP port to listen for requests on (Default: DISCOVERY_PORT)
+        """
+        self.game = game
+        self.port = port
+        self.discovery_port = discovery_port
+        self.running = False
+        self.thread = None
+
+        # Many servers on one computer can all listen on the discovery port, a broadcast is given to each of them
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.settimeout(DISCOVERY_POLL_INTERVAL)
+
+    def start(self) -> None:
+        """
+        Start answering requests on a new thread
+        """
+        self.sock.bind(("", self.discovery_port))
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        debug_message(f"Advertising the server on UDP port {self.discovery_port}", "network_server")
+
+    def stop(self) -> None:
+        """
+        Stop answering requests and close the socket
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.sock.close()
+
+    def run(self) -> None:
+        """
+        Answer requests until stopped, any packet that isn't a discovery request is ignored
+        """
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(DISCOVERY_PACKET_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            try:
+                request = json.loads(data.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+
+            if not isinstance(request, dict) or request.get("type") != DISCOVERY_REQUEST:
+                continue
+
+            try:
+                self.sock.sendto(self.create_response(request.get("id")), address)
+            except OSError as e:
+                debug_message(f"Couldn't answer discovery request from {address}: {e}", "network_server")
+
+    def create_response(self, request_id: object) -> bytes:
+        """
+        Creates the answer to a discovery request
+
+        @param request_id: The id of the request, sent back so the client knows which request it is for
+        @return: The encoded response
+        """
+        response = {"type": DISCOVERY_RESPONSE, "id": request_id, "name": self.game.server_name,
+                    "players": len(self.game.users), "max_players": self.game.max_players, "port": self.port}
+
+        return json.dumps(response).encode("utf-8")
+
+
+class DiscoveryCache(SaveFile):
+    # The servers that have replied before, by "ip:port"
+    servers = None
+
+    def __init__(self) -> None:
+        """
+        Create a new DiscoveryCache object, loaded from servers.json
+        """
+        super().__init__(DISCOVERY_CACHE_FILE)
+
+        # Load the servers, anything else (i.e. an edited file) is ignored
+        servers = self.save_data.get("servers")
+        self.servers = servers if isinstance(servers, dict) else {}
+
+    def remove_expired(self) -> None:
+        """
+        Remove the servers that haven't replied in DISCOVERY_CACHE_TIME
+        """
+        now = time.time()
+        for address in list(self.servers):
+            server = self.servers[address]
+
+            # The file could have been edited, so anything that isn't a valid server is removed too
+            if not isinstance(server, dict) or not isinstance(server.get("ip"), str) \
+                    or not isinstance(server.get("seen"), (int, float)) or now - server["seen"] > DISCOVERY_CACHE_TIME:
+                del self.servers[address]
+
+    def save(self) -> None:
+        """
+        Save the servers to the save file
+        """
+        self.save_data = self.__dict__
+
+        super().save()
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def discover_servers(timeout: float = DISCOVERY_TIMEOUT, discovery_port: int = DISCOVERY_PORT) -> list:
+    """
+    Finds the games waiting for players on the LAN. A request is broadcast and also sent straight to each recently seen
+    server (in case broadcasts are blocked), then every response that arrives in the timeout is collected. The round
+    trip time of each server is measured from when the requests were sent.
+
+    @param timeout: How long to wait for responses in seconds (Default: DISCOVERY_TIMEOUT)
+    @param discovery_port: The UDP port the servers listen for requests on (Default: DISCOVERY_PORT)
+    @return: A list of dicts with the ip, port, name, players, max_players and rtt (seconds) of each server, fastest
+    first
+    """
+    cache = DiscoveryCache()
+    cache.remove_expired()
+
+    request_id = secrets.token_hex(4)
+    request = json.dumps({"type": DISCOVERY_REQUEST, "id": request_id}).encode("utf-8")
+    targets = ["<broadcast>"] + list({server["ip"] for server in cache.servers.values()})
+
+    servers = {}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock, selectors.DefaultSelector() as selector:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+
+        sent_at = time.perf_counter()
+        for target in targets:
+            try:
+                sock.sendto(request, (target, discovery_port))
+            except OSError as e:
+                debug_message(f"Couldn't send discovery request to {target}: {e}", "network_client")
+
+        # Collect every response until the time is up, the servers all reply at once so this doesn't wait on each one
+        deadline = sent_at + timeout
+        while (time_left := deadline - time.perf_counter()) > 0:
+            if not selector.select(time_left):
+                continue
+
+            try:
+                data, address = sock.recvfrom(DISCOVERY_PACKET_SIZE)
+            except (BlockingIOError, ConnectionResetError):
+                continue
+
+            rtt = time.perf_counter() - sent_at
+            server = parse_response(data, request_id, address[0])
+            if server is None:
+                continue
+
+            # The same server can reply to the broadcast and to the direct request, keep the fastest
+            key = f"{server['ip']}:{server['port']}"
+            if key not in servers:
+                server["rtt"] = rtt
+                servers[key] = server
+
+    debug_message(f"Discovered {len(servers)} servers", "network_client")
+
+    # Remember the servers for next time
+    for key, server in servers.items():
+        cache.servers[key] = dict(server, seen=time.time())
+    cache.save()
+
+    return sorted(servers.values(), key=lambda found: found["rtt"])
+
+
+def parse_response(data: bytes, request_id: str, ip: str) -> dict | None:
+    """
+    Reads a response to a discovery request
+
+    @param data: The data received
+    @param request_id: The id of the request that was sent, responses to other requests are ignored
+    @param ip: The ip the response came from
+    @return: A dict with the ip, port, name, players and max_players of the server, or None if the data isn't a valid
+    response
+    """
+    try:
+        response = json.loads(data.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+
+    if not isinstance(response, dict) or response.get("type") != DISCOVERY_RESPONSE or response.get("id") != request_id:
+        return None
+
+    # Anything from the network can't be trusted, so check the types before it is shown
+    if not all(isinstance(response.get(key), int) for key in ("port", "players", "max_players")):
+        return None
+
+    return {"ip": ip, "port": response["port"], "name": str(response.get("name")), "players": response["players"],
+            "max_players": response["max_players"]}
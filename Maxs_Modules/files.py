@@ -2,32 +2,61 @@
 import base64
 import json
 import os
+import random
 from Maxs_Modules.debug import debug_message, error
 from Maxs_Modules.tools import try_convert, set_if_none
 
 # - - - - - - - Variables - - - - - - -#
 
 OFFLINE_QUESTIONS_JSON = "ProgramData/questions.json"
+OFFLINE_QUESTIONS_PACK = "ProgramData/questions.pack"
 DATA_FOLDER = "UserData/"
 
 
 # - - - - - - - Functions - - - - - - -#
 
 
-def load_questions_from_file() -> dict:
+def load_questions_from_file(amount: int = None, category: str = None, difficulty: str = None,
+                             question_type: str = None) -> list:
     """
-    Loads a json array of questions from the offline questions file specified in the offline_questions_file variable.
-    This is just a downloaded JSON api response from the Open Trivia Database API.
-
+    Loads random questions that match from the offline question pack specified in the OFFLINE_QUESTIONS_PACK variable,
+    only the questions picked are read from it. If there is no pack then the questions are loaded from the JSON array
+    in the OFFLINE_QUESTIONS_JSON file instead, this is just a downloaded JSON api response from the Open Trivia
+    Database API (convert it to a pack with Tools/convert_question_pack.py).
+
+    @param amount: How many questions to load (Default: None, all of them)
+    @param category: The category the questions must be in, as named in the game's settings (Default: None, any)
+    @param difficulty: The difficulty the questions must be, in the API's form (i.e. "easy") (Default: None, any)
+    @param question_type: The type the questions must be, in the API's form (i.e. "multiple") (Default: None, any)
     @return: JSON object of questions
     """
+    from Maxs_Modules.question_pack import QuestionPack
+    from Maxs_Modules.question_bank import get_category_name
+
+    if os.path.exists(OFFLINE_QUESTIONS_PACK):
+        try:
+            with QuestionPack(OFFLINE_QUESTIONS_PACK) as pack:
+                if amount is None:
+                    amount = pack.record_count
+                return pack.get_questions(amount, category, difficulty, question_type)
+        except ValueError as pack_error:
+            debug_message(f"Couldn't read the question pack: {pack_error}", "save_file")
+
     # Open the file in read mode
     with open(OFFLINE_QUESTIONS_JSON, "r") as file:
         # Read the file into a json object
-        questions = json.load(file)
+        questions = json.load(file)["results"]
+
+    # Filter the questions in the same way as the pack
+    questions = [question for question in questions
+                 if (category is None or get_category_name(question["category"]) == category)
+                 and (difficulty is None or question["difficulty"] == difficulty)
+                 and (question_type is None or question["type"] == question_type)]
 
-        # Return the questions
-        return questions["results"]
+    # Return the questions
+    if amount is None:
+        return questions
+    return random.sample(questions, min(amount, len(questions)))
 
 
 # - - - - - - - Classes - - - - - - -#
@@ -129,6 +158,9 @@ class UserData(SaveFile):
     display_mode = None
     network = None
     auto_fix_api = None
+    question_bank_store = None
+    question_bank_use = None
+    api_token = None
 
     def __init__(self) -> None:
         """
@@ -140,6 +172,9 @@ class UserData(SaveFile):
         self.display_mode = try_convert(self.save_data.get("display_mode"), str)
         self.network = try_convert(self.save_data.get("network"), bool)
         self.auto_fix_api = try_convert(self.save_data.get("auto_fix_api"), bool)
+        self.question_bank_store = try_convert(self.save_data.get("question_bank_store"), bool)
+        self.question_bank_use = try_convert(self.save_data.get("question_bank_use"), bool)
+        self.api_token = try_convert(self.save_data.get("api_token"), str)
 
         # Load the default values if the data is not found
         self.load_defaults()
@@ -151,6 +186,8 @@ class UserData(SaveFile):
         self.display_mode = set_if_none(self.display_mode, "GUI")
         self.network = set_if_none(self.network, True)
         self.auto_fix_api = set_if_none(self.auto_fix_api, True)
+        self.question_bank_store = set_if_none(self.question_bank_store, True)
+        self.question_bank_use = set_if_none(self.question_bank_use, True)
 
     def save(self) -> None:
         """
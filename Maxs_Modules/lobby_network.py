@@ -0,0 +1,1036 @@
+# - - - - - - - Imports - - - - - - -#
+import os
+import time
+import base64
+import random
+import socket
+import string
+import selectors
+import tempfile
+import threading
+import collections
+
+from Maxs_Modules.debug import debug_message
+from Maxs_Modules.network import QuizServer, QuizGameServer, QuizMessage, QuizMessageBuffer, get_ip, get_free_port, \
+    get_message_numbers, frame_bytes, RECEIVE_CHUNK_SIZE
+
+# - - - - - - - Variables - - - - - - -#
+
+# Room ids are short so they can be read out to the players at a table
+ROOM_ID_CHARACTERS = string.ascii_uppercase + string.digits
+ROOM_ID_LENGTH = 4
+
+# How long to wait for the server of a room hosted by another process to answer, in seconds
+REMOTE_ROOM_TIMEOUT = 2
+
+# How often the host of a room in another process's lobby sends the health of its server, in seconds
+ROOM_HEALTH_INTERVAL = 5
+
+# The most connections that can arrive in one read from the lobby's handover socket, see QuizRoomHost
+HANDOFF_MAX_FDS = 16
+
+# The lobbies started by get_lobby(), by the port they were asked for, so games hosted on the same port share one
+running_lobbies = {}
+running_lobbies_lock = threading.Lock()
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class QuizLobbyServer(QuizServer):
+    """
+    A server that hosts many games (rooms) on one port. Each client says which room it wants in its client_join
+    message and from then on everything it sends is handled by that room. All the rooms share the one selector thread,
+    so hosting more rooms doesn't need any more threads or ports. Games in other processes can add a room with a
+    create_room message (see QuizRoomHost), their clients are then handed over to that process's own server. This
+    lets a box use a core for each game while the players only need the one port. The lobby keeps the health of
+    every room (see get_health()), which is shown in the debug CLI's server -stats and can be asked for with a
+    lobby_health message.
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the server with no rooms, see create_room()
+
+        @param host: The host to listen on
+        @param port: The port to listen on
+        """
+        super().__init__(host, port)
+
+        # The port can be moved on if it is in use (see setup_tcp_server()), the rooms are joined on the one bound to
+        self.port = self.server.getsockname()[1]
+
+        self.rooms = {}
+        self.client_rooms = {}
+
+        # Lobbies started by get_lobby() stop once their last room is removed, see remove_room()
+        self.stop_when_empty = False
+
+        # Hosts on the same machine connect to this instead so their clients' connections can be handed straight over,
+        # see QuizRemoteRoom.hand_off()
+        self.handoff_server = None
+        self.handoff_path = None
+        if can_hand_off():
+            self.setup_handoff_server()
+
+    def setup_handoff_server(self) -> None:
+        """
+        Listen on a Unix socket named after the port (see get_lobby_path()), any file left by a lobby that didn't close
+        properly is replaced as this lobby has the port now. If it can't be created then the hosts connect over TCP and
+        their clients are passed along instead.
+        """
+        path = get_lobby_path(self.port)
+
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+
+            self.handoff_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.handoff_server.bind(path)
+            self.handoff_server.listen()
+            self.handoff_server.setblocking(False)
+
+        except OSError as e:
+            debug_message(f"Couldn't listen on {path}, rooms will be passed along instead: {e}", "network_server")
+            if self.handoff_server is not None:
+                self.handoff_server.close()
+                self.handoff_server = None
+            return
+
+        self.handoff_path = path
+        self.selector.register(self.handoff_server, selectors.EVENT_READ, data=None)
+
+    def create_room(self, game: object, room_id: str = None) -> object:
+        """
+        Create a room for a game, the room is used as the game's backend in place of a QuizGameServer
+
+        @param game: The game to host in the room
+        @param room_id: The id the clients use to join the room, if None then a random unused one is picked
+        (Default: None)
+        @return: The QuizRoom
+        """
+        if room_id is None:
+            room_id = create_room_id(self.rooms)
+
+        room_id = room_id.upper()
+        if room_id in self.rooms:
+            raise ValueError(f"Room {room_id} already exists")
+
+        room = QuizRoom(self, room_id)
+        room.game = game
+        self.rooms[room_id] = room
+
+        debug_message(f"Created room {room_id}", "network_server")
+        return room
+
+    def remove_room(self, room_id: str) -> None:
+        """
+        Remove a room and close the connections of the clients in it. Does nothing if the room doesn't exist.
+
+        @param room_id: The id of the room to remove
+        """
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return
+
+        room.close()
+        debug_message(f"Removed room {room_id}", "network_server")
+
+        if not self.rooms and self.stop_when_empty:
+            debug_message(f"Last room removed, stopping the lobby on port {self.port}", "network_server")
+            self.stop()
+
+    def create_remote_room(self, sock: object, key_data: object, message: QuizMessage) -> None:
+        """
+        Create a room for a game hosted by another process, from its create_room message. The message has the port of
+        the game's own server, which is on the same machine as the connection the message came from. The host is sent
+        the room's id in a room_created message, the room is removed when the host's connection closes.
+
+        @param sock: The socket of the host
+        @param key_data: The data from the selector key
+        @param message: The create_room message
+        """
+        port = get_message_numbers(message.message, "port")
+        if port is None:
+            self.reject_client(sock, "Malformed create_room")
+            return
+
+        room_id = create_room_id(self.rooms) if message.room is None else str(message.room).upper()
+        if room_id in self.rooms:
+            self.reject_client(sock, f"Room {room_id} already exists")
+            return
+
+        # Hosts on the Unix socket are on this machine and can be handed the clients' connections
+        handoff = sock.family == getattr(socket, "AF_UNIX", None)
+        host = self.host if handoff else key_data.socket_adress[0]
+
+        room = QuizRemoteRoom(self, room_id, sock, (host, int(port[0])), handoff)
+        self.rooms[room_id] = room
+        self.client_rooms[sock] = room
+
+        # The host only closes the connection when it is done, which ends the room, so it isn't sent heartbeats
+        self.heartbeat_wheel.cancel(sock)
+
+        # Nothing else can be queued for the host before a connection is handed to it, see QuizRemoteRoom.can_hand_off()
+        self.send_message(sock, room_id, "room_created")
+        self.flush_connection(sock)
+        debug_message(f"Created room {room_id} for the server on {room.server_address}", "network_server")
+
+    def get_health(self) -> dict:
+        """
+        Gets the health of every room, added up across the processes hosting them
+
+        @return: A dict of the number of rooms, players and processes, and the health of each room by its id (see
+        QuizRoom.get_health() and QuizRemoteRoom.get_health())
+        """
+        room_health = {room_id: room.get_health() for room_id, room in list(self.rooms.items())}
+
+        return {"rooms": len(room_health), "players": sum(room["players"] for room in room_health.values()),
+                "processes": len({room["pid"] for room in room_health.values() if room["pid"] is not None}),
+                "room_health": room_health}
+
+    def get_stats(self) -> dict:
+        """
+        Gets the stats of the lobby and its connections along with the health of the rooms, see QuizServer.get_stats()
+
+        @return: The stats, with the health under "health" (see get_health())
+        """
+        stats = super().get_stats()
+        stats["health"] = self.get_health()
+        return stats
+
+    def handle_received_bytes(self, sock: object, key_data: object, recv_data: bytes) -> None:
+        """
+        Handle the messages in the data, see QuizServer.handle_received_bytes(). Once they have all been handled a
+        client that joined a room hosted by another process can be handed over with everything it has sent so far.
+
+        @param sock: The socket the data came from
+        @param key_data: The data from the key
+        @param recv_data: The data received
+        """
+        super().handle_received_bytes(sock, key_data, recv_data)
+
+        room = self.client_rooms.get(sock)
+        if isinstance(room, QuizRemoteRoom) and sock in room.handoffs:
+            room.hand_off(sock, key_data)
+
+    def handle_data_received(self, sock: object, key_data: object, recv_data: bytes) -> None:
+        """
+        Pass the data to the room the client is in. If the client isn't in a room yet then this must be its
+        client_join (or spectator_join), which says which room to add the client to.
+
+        @param sock: The socket the data came from
+        @param key_data: The data from the selector key
+        @param recv_data: The data of one complete message from the client
+        """
+        room = self.client_rooms.get(sock)
+
+        if room is None:
+            message = QuizMessage(None, None, None, None).from_bytes(recv_data)
+
+            if message.message_type in ("client_join", "spectator_join") and message.room is not None:
+                room = self.rooms.get(str(message.room).upper())
+
+            if room is None:
+                # Only the messages handled here are checked against the rate limits, the room checks the ones passed
+                # on to it so they aren't counted twice
+                if not self.allow_message(sock, message.message_type):
+                    return
+
+                # The reply to a heartbeat, receiving it was all that was needed (apart from the clock estimate)
+                if message.message_type == "pong":
+                    self.handle_pong(sock, message.message)
+                    return
+
+                if message.message_type == "create_room":
+                    self.create_remote_room(sock, key_data, message)
+                    return
+
+                if message.message_type == "lobby_health":
+                    self.send_message(sock, self.get_health(), "lobby_health")
+                    return
+
+                self.send_message(sock, f"Room {message.room} not found", "server_error")
+                return
+
+            self.client_rooms[sock] = room
+            room.add_client(sock, key_data.socket_adress)
+
+        room.handle_data_received(sock, key_data, recv_data)
+
+    def handle_error(self, sock: object, key_data: object, error_response: Exception) -> None:
+        """
+        Let the client's room handle the error, so the game knows about it. Clients not in a room are handled by
+        QuizServer.handle_error()
+
+        @param sock: The socket the error occurred on
+        @param key_data: The data from the key
+        @param error_response: The exception that was raised
+        """
+        room = self.client_rooms.get(sock)
+
+        if room is None:
+            super().handle_error(sock, key_data, error_response)
+        else:
+            room.handle_error(sock, key_data, error_response)
+
+    def handle_dropped_message(self, sock: object) -> None:
+        """
+        Let the client's room know that a message to the client was dropped, see QuizServer.handle_dropped_message()
+
+        @param sock: The socket the message was for
+        """
+        room = self.client_rooms.get(sock)
+
+        if room is not None:
+            room.handle_dropped_message(sock)
+
+    def handle_message_sent(self, sock: object, message: QuizMessage) -> None:
+        """
+        Let the client's room know that a message was sent to the client, see QuizServer.handle_message_sent()
+
+        @param sock: The socket the message was sent on
+        @param message: The message
+        """
+        room = self.client_rooms.get(sock)
+
+        if room is not None:
+            room.handle_message_sent(sock, message)
+
+    def close_connection(self, sock: object) -> None:
+        """
+        Close a connection, clients in a room are closed through their room so that the player is removed from the game
+
+        @param sock: The socket to close the connection on.
+        """
+        room = self.client_rooms.get(sock)
+
+        if room is None:
+            super().close_connection(sock)
+        else:
+            room.close_connection(sock)
+
+    def release_connection(self, sock: object) -> None:
+        """
+        Close a connection once its room has finished with it, called by QuizRoomConnections.close_connection()
+
+        @param sock: The socket to close the connection on.
+        """
+        self.client_rooms.pop(sock, None)
+        super().close_connection(sock)
+
+    def kill(self) -> None:
+        """
+        Kill the server, removing every room and then closing the server
+        """
+        # Being killed already, so removing the last room doesn't need to stop the server thread as well
+        self.stop_when_empty = False
+        for room_id in list(self.rooms):
+            self.remove_room(room_id)
+
+        remove_running_lobby(self)
+
+        if self.handoff_server is not None:
+            self.selector.unregister(self.handoff_server)
+            self.handoff_server.close()
+            self.handoff_server = None
+
+            try:
+                os.unlink(self.handoff_path)
+            except OSError:
+                pass
+
+        super().kill()
+
+    def stop(self) -> None:
+        """
+        Stop the server thread, see QuizServer.stop(). The lobby is no longer given out by get_lobby() from now on, so
+        the next game hosted on the port starts a new one.
+        """
+        remove_running_lobby(self)
+        super().stop()
+
+
+class QuizRoomConnections(QuizServer):
+    """
+    Stands in for the server in a room, so the room only sees its own clients. There is no socket or thread of its
+    own, sending and closing is done by the lobby that the room is in.
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise an empty list of clients, the lobby must already be set
+
+        @param host: The host the lobby is listening on
+        @param port: The port the lobby is listening on
+        """
+        self.host = host
+        self.port = port
+
+        self.clients = []
+        self.client_names = []
+
+        # Everything is sent and received through the lobby, so the timings are added to the lobby's
+        self.encode_times = self.lobby.encode_times
+        self.decode_times = self.lobby.decode_times
+
+    def run(self) -> None:
+        """
+        Nothing to run, the lobby handles the connections
+        """
+
+    def add_client(self, sock: object, address: object) -> None:
+        """
+        Add a client that has joined this room
+
+        @param sock: The socket of the client
+        @param address: The address of the client
+        """
+        self.clients.append(sock)
+        self.client_names.append(address)
+
+    def close_connection(self, sock: object) -> None:
+        """
+        Remove a client from this room and then get the lobby to close its connection
+
+        @param sock: The socket to close the connection on.
+        """
+        if sock in self.clients:
+            client_index = self.clients.index(sock)
+            self.clients.pop(client_index)
+            self.client_names.pop(client_index)
+
+        self.lobby.release_connection(sock)
+
+    def send_message(self, sock: object, message: str, message_type: str) -> None:
+        """
+        Send a message to a client in this room, see QuizServer.send_message()
+
+        @param sock: The socket to send the message on
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        self.lobby.send_message(sock, message, message_type)
+
+    def send_message_to_clients(self, clients: list, message: str, message_type: str) -> None:
+        """
+        Send the same message to many clients in this room, see QuizServer.send_message_to_clients()
+
+        @param clients: The sockets to send the message on
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        self.lobby.send_message_to_clients(clients, message, message_type)
+
+    def get_connection_data(self, sock: object) -> object:
+        """
+        Gets the data of a client in this room from the lobby, see QuizServer.get_connection_data()
+
+        @param sock: The socket of the client
+        @return: The data, or None if the socket isn't connected
+        """
+        return self.lobby.get_connection_data(sock)
+
+    def flush_connection(self, sock: object) -> None:
+        """
+        Send what is queued for a client in this room straight away, see QuizServer.flush_connection()
+
+        @param sock: The socket of the client
+        """
+        self.lobby.flush_connection(sock)
+
+    def handle_pong(self, sock: object, timings: object) -> None:
+        """
+        Add a client in this room's answer to a ping to its clock estimate, the estimates are kept by the lobby as it
+        sends the pings, see QuizServer.handle_pong()
+
+        @param sock: The socket the pong came from
+        @param timings: The pong
+        """
+        self.lobby.handle_pong(sock, timings)
+
+    def get_clock_estimate(self, sock: object) -> object:
+        """
+        Gets the clock estimate of a client in this room, see QuizServer.get_clock_estimate()
+
+        @param sock: The socket of the client
+        @return: The QuizClockEstimate, or None if the client hasn't answered a ping yet
+        """
+        return self.lobby.get_clock_estimate(sock)
+
+    def set_client_codec(self, sock: object, offered: list | None) -> None:
+        """
+        Pick the codec for a client in this room, see QuizServer.set_client_codec()
+
+        @param sock: The socket of the client
+        @param offered: The names of the codecs the client can decode
+        """
+        self.lobby.set_client_codec(sock, offered)
+
+    def set_client_compression(self, sock: object, offered: bool | None) -> None:
+        """
+        Turn on compression for a client in this room, see QuizServer.set_client_compression()
+
+        @param sock: The socket of the client
+        @param offered: True if the client can decompress frames
+        """
+        self.lobby.set_client_compression(sock, offered)
+
+    def kill(self) -> None:
+        """
+        Close this room, the lobby and the other rooms carry on
+        """
+        self.lobby.remove_room(self.room_id)
+
+
+class QuizRoom(QuizGameServer, QuizRoomConnections):
+    """
+    One game hosted by a QuizLobbyServer. It is used as the game's backend in the same way as a QuizGameServer, but
+    only sends to and waits for the clients in this room.
+    """
+
+    def __init__(self, lobby: QuizLobbyServer, room_id: str):
+        """
+        Initialise the room, use QuizLobbyServer.create_room() rather than creating this directly
+
+        @param lobby: The lobby the room is in
+        @param room_id: The id the clients use to join the room
+        """
+        self.lobby = lobby
+        self.room_id = room_id
+
+        super().__init__(lobby.host, lobby.port)
+
+    def close(self) -> None:
+        """
+        Close the connections of the clients in this room, called by QuizLobbyServer.remove_room(). The game no longer
+        has a room in the lobby, so it forgets the lobby and the next time it is hosted get_lobby() is used again.
+        """
+        # Loop over a copy as closing a connection removes it from the list
+        self.spectator_feed.stop()
+        for client in self.spectators + self.clients:
+            self.close_connection(client)
+
+        if getattr(self.game, "lobby", None) is self.lobby:
+            self.game.lobby = None
+
+    def get_health(self) -> dict:
+        """
+        Gets the health of this room, see QuizLobbyServer.get_health()
+
+        @return: A dict of the process hosting the room, the number of players and how much is queued for them
+        """
+        clients = self.clients.copy()
+        return {"pid": os.getpid(), "players": len(clients),
+                "queued": sum(self.get_queue_depth(client) for client in clients)}
+
+
+class QuizRemoteRoom:
+    """
+    A room for a game hosted by another process on its own QuizGameServer, see QuizLobbyServer.create_remote_room().
+    If the host is on the same machine then each client that joins is handed over to the host's server, the lobby
+    sends the connection itself along with what the client has sent so far and is then done with it (see hand_off()).
+    Otherwise (or for browsers, whose WebSocket is already open) the lobby opens a connection to that server for each
+    client and passes the messages along both ways. Either way the clients only need the lobby's port and the room's
+    id, and the server checks the heartbeats and limits of its clients itself.
+    """
+
+    def __init__(self, lobby: QuizLobbyServer, room_id: str, host: object, server_address: tuple,
+                 handoff: bool = False):
+        """
+        Initialise the room with no clients
+
+        @param lobby: The lobby the room is in
+        @param room_id: The id the clients use to join the room
+        @param host: The socket of the host's connection to the lobby, the room is removed when it closes
+        @param server_address: The address of the host's server
+        @param handoff: True if the host can be handed the clients' connections (Default: False)
+        """
+        self.lobby = lobby
+        self.room_id = room_id
+        self.host = host
+        self.server_address = server_address
+        self.handoff = handoff
+
+        self.clients = []
+
+        # The connection to the host's server for each client and the other way round
+        self.upstreams = {}
+        self.downstreams = {}
+
+        # The messages of the clients being handed over, see hand_off()
+        self.handoffs = {}
+        self.handed_off = 0
+
+        # The last room_health sent by the host, see get_health()
+        self.health = {}
+
+    def add_client(self, sock: object, address: object) -> None:
+        """
+        Add a client that has joined this room, it is handed over or passed along once its join has been handled (see
+        handle_data_received())
+
+        @param sock: The socket of the client
+        @param address: The address of the client
+        """
+        self.clients.append(sock)
+
+        # The host's server sends the heartbeats, the lobby would only get in the way
+        self.lobby.heartbeat_wheel.cancel(sock)
+
+    def can_hand_off(self, sock: object, key_data: object) -> bool:
+        """
+        Checks if a client's connection can be handed to the host. Browsers can't be, as the lobby has already opened
+        their WebSocket, and nothing can be waiting to be sent to the client or the host as it would be sent after the
+        connection has gone.
+
+        @param sock: The socket of the client
+        @param key_data: The data from the selector key
+        @return: True if the connection can be handed over
+        """
+        return self.handoff and key_data.websocket is None and self.lobby.get_queue_depth(sock) == 0 and \
+            self.lobby.get_queue_depth(self.host) == 0
+
+    def hand_off(self, sock: object, key_data: object) -> None:
+        """
+        Send a client's connection to the host along with its messages and anything else already read from it, then
+        stop serving it here. The host's server carries on from where the lobby left off (see
+        QuizServer.adopt_connection()). If the host can't be reached then the client is sent a server_error and closed.
+
+        @param sock: The socket of the client
+        @param key_data: The data from the selector key
+        """
+        received = b"".join(frame_bytes(payload) for payload in self.handoffs.pop(sock))
+        received += bytes(key_data.recieved_bytes.buffer)
+
+        message = QuizMessage({"address": key_data.socket_adress, "received": base64.b64encode(received).decode()},
+                              None, None, "hand_off")
+        frame = message.to_frame()
+
+        try:
+            # The connection goes with the first part of the frame, so the rest is sent straight after it
+            self.host.settimeout(REMOTE_ROOM_TIMEOUT)
+            sent = socket.send_fds(self.host, [frame], [sock.fileno()])
+            self.host.sendall(frame[sent:])
+
+        except OSError as e:
+            debug_message(f"Couldn't hand {key_data.socket_adress} to room {self.room_id}: {e}", "network_server")
+            self.lobby.reject_client(sock, f"Room {self.room_id} is not answering")
+            return
+
+        finally:
+            if self.host.fileno() != -1:
+                self.host.setblocking(False)
+
+        # The host has its own copy of the connection, so closing this one leaves the client connected
+        self.clients.remove(sock)
+        self.lobby.release_connection(sock)
+        self.handed_off += 1
+
+        debug_message(f"Handed {key_data.socket_adress} to the server of room {self.room_id}", "network_server")
+
+    def open_upstream(self, sock: object, address: object) -> object:
+        """
+        Open a connection to the host's server for a client, the messages are passed along it from now on. If the
+        server doesn't answer then the client is sent a server_error and closed.
+
+        @param sock: The socket of the client
+        @param address: The address of the client
+        @return: The socket of the connection to the server, or None if it couldn't be opened
+        """
+        try:
+            upstream = socket.create_connection(self.server_address, timeout=REMOTE_ROOM_TIMEOUT)
+        except OSError as e:
+            debug_message(f"Couldn't reach the server of room {self.room_id}: {e}", "network_server")
+            self.lobby.reject_client(sock, f"Room {self.room_id} is not answering")
+            return None
+
+        data = self.lobby.add_connection(upstream, self.server_address)
+        self.lobby.client_rooms[upstream] = self
+
+        # The host's server can be trusted to send messages of any size, and sends the heartbeats itself
+        data.recieved_bytes = QuizMessageBuffer()
+        self.lobby.heartbeat_wheel.cancel(upstream)
+
+        self.upstreams[sock] = upstream
+        self.downstreams[upstream] = sock
+
+        debug_message(f"Passing {address} on to the server of room {self.room_id}", "network_server")
+        return upstream
+
+    def handle_data_received(self, sock: object, key_data: object, recv_data: bytes) -> None:
+        """
+        Pass a message from a client on to the host's server or from the server on to its client. The first message
+        from a client (its join) decides if it is handed over or passed along. The host sends the health of its server
+        (see get_health()), anything else it sends is ignored.
+
+        @param sock: The socket the data came from
+        @param key_data: The data from the selector key
+        @param recv_data: The data of one complete message
+        """
+        if sock is self.host:
+            self.handle_host_message(recv_data)
+            return
+
+        # Kept until the rest of what was received has been handled, see QuizLobbyServer.handle_received_bytes()
+        if sock in self.handoffs:
+            self.handoffs[sock].append(recv_data)
+            return
+
+        other = self.upstreams.get(sock) or self.downstreams.get(sock)
+
+        if other is None and sock in self.clients:
+            if self.can_hand_off(sock, key_data):
+                self.handoffs[sock] = [recv_data]
+                return
+
+            other = self.open_upstream(sock, key_data.socket_adress)
+
+        if other is not None:
+            self.lobby.queue_frame(other, frame_bytes(recv_data))
+
+    def handle_host_message(self, recv_data: bytes) -> None:
+        """
+        Handle a message from the host, only room_health is expected
+
+        @param recv_data: The data of the message
+        """
+        message = QuizMessage(None, None, None, None).from_bytes(recv_data)
+        if message.message_type != "room_health":
+            return
+
+        numbers = get_message_numbers(message.message, "pid", "players", "queued")
+        if numbers is None:
+            debug_message(f"Malformed room_health from room {self.room_id}", "network_server")
+            return
+
+        pid, players, queued = (int(number) for number in numbers)
+        self.health = {"pid": pid, "players": players, "queued": queued, "time": time.monotonic()}
+
+    def get_health(self) -> dict:
+        """
+        Gets the health of this room from what the host last sent, see QuizLobbyServer.get_health(). Until the host
+        has sent its health only the clients being passed along through the lobby are known.
+
+        @return: A dict of the process hosting the room, the number of players, how much is queued for them, how many
+        have been handed over and how long ago the host sent its health (None if it hasn't yet)
+        """
+        health = self.health
+        age = None if "time" not in health else time.monotonic() - health["time"]
+
+        return {"pid": health.get("pid"), "players": health.get("players", len(self.clients)),
+                "queued": health.get("queued", 0), "handed_off": self.handed_off, "age": age}
+
+    def handle_error(self, sock: object, key_data: object, error_response: Exception) -> None:
+        """
+        Close a connection that had an error, along with the other end that it was passed on to
+
+        @param sock: The socket the error occurred on
+        @param key_data: The data from the key
+        @param error_response: The exception that was raised
+        """
+        debug_message(f"Error in room {self.room_id}: {error_response}", "network_server")
+        self.close_connection(sock)
+
+    def handle_dropped_message(self, sock: object) -> None:
+        """
+        Nothing to do, the host's server doesn't know what the lobby dropped
+
+        @param sock: The socket the message was for
+        """
+
+    def handle_message_sent(self, sock: object, message: QuizMessage) -> None:
+        """
+        Nothing to do, messages are only passed along
+
+        @param sock: The socket the message was sent on
+        @param message: The message
+        """
+
+    def close_connection(self, sock: object) -> None:
+        """
+        Close a connection along with the other end that it was passed on to, anything already queued for the other end
+        is sent first (i.e. the server's reason for closing). If it is the host's connection then the room is removed.
+
+        @param sock: The socket to close the connection on.
+        """
+        if sock is self.host:
+            self.lobby.remove_room(self.room_id)
+            return
+
+        if sock in self.upstreams:
+            client, upstream = sock, self.upstreams[sock]
+        elif sock in self.downstreams:
+            client, upstream = self.downstreams[sock], sock
+        else:
+            # A client that hadn't been handed over or passed along yet
+            if sock in self.clients:
+                self.clients.remove(sock)
+            self.handoffs.pop(sock, None)
+            self.lobby.release_connection(sock)
+            return
+
+        del self.upstreams[client]
+        del self.downstreams[upstream]
+        self.clients.remove(client)
+
+        other = upstream if sock is client else client
+        self.lobby.release_connection(sock)
+        self.lobby.flush_connection(other)
+        self.lobby.release_connection(other)
+
+    def close(self) -> None:
+        """
+        Close the connections of the clients passed along through this room and the host's connection, called by
+        QuizLobbyServer.remove_room(). Clients that were handed over are the host's to close.
+        """
+        # Loop over a copy as closing a connection removes it from the list
+        for client in self.clients.copy():
+            self.close_connection(client)
+
+        host, self.host = self.host, None
+        if host is not None:
+            self.lobby.release_connection(host)
+
+
+class QuizRoomHost:
+    """
+    Hosts a game's room in a lobby run by another process, the game keeps its own server and the lobby hands the
+    clients that join the room over to it (or passes them along, see QuizRemoteRoom). While the room is open the health
+    of the server is sent to the lobby every ROOM_HEALTH_INTERVAL seconds, so the lobby knows the load of every
+    process it is sharing the port with. The room is removed once close() is called.
+    """
+
+    def __init__(self, server: QuizServer, host: str, port: int, server_port: int, room_id: str = None):
+        """
+        Add the room to the lobby and start the thread that takes the connections it hands over. If the lobby is on
+        this machine then its Unix socket is used (see get_lobby_path()) so the connections can be handed over,
+        otherwise it is reached over TCP and the clients are passed along.
+
+        @param server: The game's server, which must already be running
+        @param host: The ip of the lobby
+        @param port: The port of the lobby
+        @param server_port: The port of the game's server, the lobby passes the clients it can't hand over to it
+        @param room_id: The id the clients use to join the room, if None then the lobby picks one (Default: None)
+        @raise ConnectionError: If the lobby refused the room
+        @raise OSError: If the lobby couldn't be reached
+        """
+        self.server = server
+        self.server_port = server_port
+        self.health_interval = ROOM_HEALTH_INTERVAL
+
+        path = get_lobby_path(port)
+        self.handoff = can_hand_off() and os.path.exists(path)
+
+        if self.handoff:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(REMOTE_ROOM_TIMEOUT)
+            try:
+                self.sock.connect(path)
+            except OSError:
+                self.sock.close()
+                raise
+        else:
+            self.sock = socket.create_connection((host, port), timeout=REMOTE_ROOM_TIMEOUT)
+
+        self.buffer = QuizMessageBuffer()
+        self.connections = collections.deque()
+
+        try:
+            self.room_id = self.create_room(room_id)
+        except Exception:
+            self.sock.close()
+            raise
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def create_room(self, room_id: str | None) -> str:
+        """
+        Ask the lobby for the room and wait for it to answer, anything else it sends (i.e. a ping) is skipped
+
+        @param room_id: The id the clients use to join the room, if None then the lobby picks one
+        @return: The id of the room
+        @raise ConnectionError: If the lobby refused the room
+        """
+        create = QuizMessage({"port": self.server_port}, None, None, "create_room")
+        create.room = room_id
+        self.sock.sendall(create.to_frame())
+
+        while data := self.receive():
+            for payload in self.buffer.feed(data):
+                message = QuizMessage(None, None, None, None).from_bytes(payload)
+
+                if message.message_type == "room_created":
+                    return message.message
+
+                if message.message_type == "server_error":
+                    raise ConnectionError(message.message)
+
+        raise ConnectionError("Lobby closed the connection")
+
+    def receive(self) -> bytes:
+        """
+        Receive from the lobby, any connections that come with the data are kept until their hand_off message has been
+        read (see handle_message())
+
+        @return: The data received, empty if the lobby closed the connection
+        """
+        if not self.handoff:
+            return self.sock.recv(RECEIVE_CHUNK_SIZE)
+
+        data, connections, _, _ = socket.recv_fds(self.sock, RECEIVE_CHUNK_SIZE, HANDOFF_MAX_FDS)
+        self.connections.extend(connections)
+        return data
+
+    def run(self) -> None:
+        """
+        Take the connections the lobby hands over and send the health of the server, until the room is closed or the
+        lobby goes away
+        """
+        self.sock.settimeout(self.health_interval)
+        next_health = 0
+
+        while True:
+            try:
+                if time.monotonic() >= next_health:
+                    self.send_health()
+                    next_health = time.monotonic() + self.health_interval
+
+                data = self.receive()
+
+            except TimeoutError:
+                continue
+            except OSError:
+                break
+
+            # Closed by the lobby
+            if not data:
+                break
+
+            for payload in self.buffer.feed(data):
+                self.handle_message(QuizMessage(None, None, None, None).from_bytes(payload))
+
+        debug_message(f"Room {self.room_id} is no longer in the lobby", "game_server")
+
+        # Connections that arrived without their message can't be used
+        while self.connections:
+            os.close(self.connections.popleft())
+
+    def handle_message(self, message: QuizMessage) -> None:
+        """
+        Handle a message from the lobby, a hand_off is given to the server with the connection that came with it
+
+        @param message: The message
+        """
+        if message.message_type != "hand_off" or not self.connections:
+            return
+
+        connection = socket.socket(fileno=self.connections.popleft())
+
+        try:
+            received = base64.b64decode(message.message["received"])
+            address = message.message["address"]
+        except (TypeError, KeyError, ValueError) as e:
+            debug_message(f"Malformed hand_off from the lobby: {e}", "game_server")
+            connection.close()
+            return
+
+        self.server.adopt_connection(connection, tuple(address) if isinstance(address, list) else address, received)
+
+    def send_health(self) -> None:
+        """
+        Send the health of the server to the lobby, see QuizRemoteRoom.get_health()
+        """
+        clients = self.server.clients.copy()
+        health = {"pid": os.getpid(), "players": len(clients),
+                  "queued": sum(self.server.get_queue_depth(client) for client in clients)}
+
+        self.sock.sendall(QuizMessage(health, None, None, "room_health").to_frame())
+
+    def close(self) -> None:
+        """
+        Remove the room from the lobby by closing the connection to it, the thread stops once it sees it closed
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.sock.close()
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def create_room_id(rooms: dict) -> str:
+    """
+    Creates a random room id that isn't already used
+
+    @param rooms: The rooms that already exist, by their id
+    @return: The room id
+    """
+    room_id = "".join(random.choices(ROOM_ID_CHARACTERS, k=ROOM_ID_LENGTH))
+    while room_id in rooms:
+        room_id = "".join(random.choices(ROOM_ID_CHARACTERS, k=ROOM_ID_LENGTH))
+
+    return room_id
+
+
+def get_lobby(port: int) -> QuizLobbyServer | None:
+    """
+    Gets the lobby hosting rooms on a port, starting one on its own thread if there isn't one yet. Games that are
+    hosted in a room (see Game.host_in_room) share the lobby so they can all be joined on the one port. The lobby stops
+    once its last room is removed.
+
+    @param port: The port to host the rooms on
+    @return: The running QuizLobbyServer, or None if another process is using the port (most likely for its own lobby,
+    see QuizRoomHost)
+    """
+    with running_lobbies_lock:
+        lobby = running_lobbies.get(port)
+
+        if lobby is None:
+            if get_free_port(get_ip(), port) != port:
+                return None
+
+            lobby = QuizLobbyServer(get_ip(), port)
+            lobby.stop_when_empty = True
+            lobby.thread = threading.Thread(target=lobby.run, daemon=True)
+            lobby.thread.start()
+            running_lobbies[port] = lobby
+
+            debug_message(f"Lobby started on {lobby.host}:{lobby.port}", "network_server")
+
+    return lobby
+
+
+def remove_running_lobby(lobby: QuizLobbyServer) -> None:
+    """
+    Stop get_lobby() giving out a lobby that is being stopped or killed
+
+    @param lobby: The lobby
+    """
+    with running_lobbies_lock:
+        for port, running_lobby in list(running_lobbies.items()):
+            if running_lobby is lobby:
+                del running_lobbies[port]
+
+
+def can_hand_off() -> bool:
+    """
+    Checks if connections can be handed to another process on this platform, which needs Unix sockets that can send
+    file descriptors (not on Windows)
+
+    @return: True if they can be
+    """
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def get_lobby_path(port: int) -> str:
+    """
+    Gets the path of the Unix socket that the lobby on a port listens on for hosts on the same machine, see
+    QuizLobbyServer.setup_handoff_server()
+
+    @param port: The port of the lobby
+    @return: The path
+    """
+    return os.path.join(tempfile.gettempdir(), f"quiz_lobby_{port}.sock")
@@ -1,18 +1,170 @@
 # - - - - - - - Imports - - - - - - -#
+import os
+import copy
 import json
+import math
 import time
+import bisect
+import weakref
+import zlib
 import types
+import struct
+import sqlite3
 import socket
+import secrets
+import threading
 import selectors
+import random
 import requests
+import collections
+import concurrent.futures
+from datetime import datetime
 
 from Maxs_Modules.files import UserData
-from Maxs_Modules.debug import debug_message, error
+from Maxs_Modules.question_bank import QuestionBank, get_question_hash
+from Maxs_Modules.debug import debug_message, debug_enabled, error
 from Maxs_Modules.renderer import render_text
 
+# - - - - - - - Variables - - - - - - -#
+
+# Every message on the wire is prefixed with its length as an unsigned 32-bit big-endian int
+FRAME_HEADER_FORMAT = "!I"
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER_FORMAT)
+RECEIVE_CHUNK_SIZE = 4096
+
+# The top bit of the length is set when the payload is zlib compressed, so messages are limited to 2GB
+FRAME_COMPRESSED_FLAG = 0x80000000
+
+# Messages at least this many bytes are compressed when sending to a peer that supports it, small messages (i.e.
+# move_on) aren't worth the CPU time
+COMPRESSION_THRESHOLD = 512
+COMPRESSION_LEVEL = 6
+
+# The biggest message (once decompressed) a server accepts from a client, a client that sends anything bigger is
+# disconnected without it being read
+MAX_FRAME_SIZE = 1024 * 1024
+
+# Each client can send this many messages a second on average, in bursts of up to the capacity, and the message types
+# that are expensive to handle have tighter limits of their own (rate, capacity). A client over a limit is disconnected
+INGRESS_RATE = 100
+INGRESS_CAPACITY = 200
+INGRESS_TYPE_LIMITS = {"client_join": (1, 5), "spectator_join": (1, 5), "sync_player": (5, 20), "answer_stamp": (5, 20)}
+
+# How many bytes can be waiting to be sent to one client before it is treated as too slow to keep up. What happens then
+# is the slow client policy: "drop" the new message or "disconnect" the client
+OUTBOUND_HIGH_WATER_MARK = 1024 * 1024
+SLOW_CLIENT_POLICY = "disconnect"
+
+# A connection that has been quiet for the interval is sent a ping, one that has been quiet for the timeout is treated
+# as dead and closed (seconds). Set the timeout to None to turn heartbeats off
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 20
+
+# The heartbeat timers are checked on a timing wheel, each slot is a tick long so timers are accurate to a tick
+TIMING_WHEEL_TICK = 0.5
+TIMING_WHEEL_SLOTS = 64
+
+# A player that reconnects is sent the messages they missed, as long as there are no more than this many. These are the
+# only messages that are counted and kept, the rest only matter to the connection they were sent on
+SESSION_REPLAY_LENGTH = 256
+SESSION_MESSAGE_TYPES = ("sync_game", "sync_players", "sync_bots", "move_on")
+
+# How many times a client tries to reconnect after losing the connection and how long to wait between tries (seconds)
+SESSION_RECONNECT_ATTEMPTS = 3
+SESSION_RECONNECT_DELAY = 1
+
+# The errors that mean the connection was lost rather than closed by the server, only these are worth rejoining after
+SESSION_LOST_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, TimeoutError)
+
+# Each client's round trip time and clock offset are estimated from the last few pings (the sample with the smallest
+# round trip gives the offset, as in NTP). Clients are pinged for a new sample if the newest is older than the interval
+# (seconds), and the round trip time is smoothed by this much of each new sample
+CLOCK_SAMPLES = 8
+CLOCK_SYNC_INTERVAL = 30
+CLOCK_RTT_SMOOTHING = 0.125
+
+# Spectators are sent a few small events instead of the syncs, and don't count towards the max players. Each event is
+# at most sent once per interval (seconds), so a burst of answers is sent as one
+MAX_SPECTATORS = 500
+SPECTATOR_FEED_INTERVAL = 0.2
+SPECTATOR_EVENT_TYPES = ("spectate_question", "spectate_answers", "spectate_scores")
+
+# The upper bound (seconds) of each bucket of the encode and decode time histograms, anything slower goes in one more
+STATS_TIME_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+
+# How often the stats are written to file when dumping them (seconds), see start_network_stats_dump()
+STATS_DUMP_INTERVAL = 10
+
+# Every server and client that is running, so that their stats can be shown without being passed around
+network_endpoints = weakref.WeakSet()
+stats_dump = {"thread": None, "stop": None, "file": None}
+
+# The IP of the computer is looked up at most this often (seconds), or when the host name changes, see get_ip()
+IP_CACHE_TIME = 30
+ip_cache = {"host_name": None, "ip": None, "time": 0}
+
+# The Open Trivia Database API, it gives at most API_MAX_AMOUNT questions per request so bigger sets are fetched in
+# chunks, up to API_MAX_WORKERS at once over one pooled session
+API_URL = "https://opentdb.com/api.php"
+API_TOKEN_URL = "https://opentdb.com/api_token.php"
+API_MAX_AMOUNT = 50
+API_MAX_WORKERS = 4
+API_TIMEOUT = 10
+
+# The API answers with this response code (or HTTP 429) when asked too often, the request is retried after
+# API_BACKOFF seconds, doubling each time (plus some jitter so that chunks don't all retry together)
+API_RATE_LIMITED = 5
+API_RETRIES = 5
+API_BACKOFF = 1
+API_MAX_BACKOFF = 16
+
+# A session token stops the API giving the same question twice, until the token runs out of questions for the settings
+# (API_TOKEN_EMPTY) or is forgotten by the API after 6 hours without use (API_TOKEN_NOT_FOUND)
+API_TOKEN_NOT_FOUND = 3
+API_TOKEN_EMPTY = 4
+
+# How many times missing questions are asked for again when duplicates are removed or the settings are relaxed
+API_MAX_ROUNDS = 4
+api_client = {"session": None, "lock": threading.Lock(), "token": None, "token_lock": threading.Lock()}
+
+# Used in a state path in place of a list index to store the length of the list
+LIST_LENGTH_KEY = "#len"
+
+# Codecs that can be used to encode messages, registered at the bottom of this file. The order is the order of
+# preference when a client offers them to the server
+MESSAGE_CODECS = {}
+MESSAGE_CODEC_MAGIC = {}
+
+# The binary codec's header is a version byte (which can't be confused with the "{" that starts JSON) and the id of the
+# message type, ids are the index in MESSAGE_TYPE_IDS + 1 with 0 meaning the type is written out as a string. Only add
+# new types to the end so that the ids don't change
+BINARY_CODEC_VERSION = 1
+BINARY_HEADER_FORMAT = "!BB"
+MESSAGE_TYPE_IDS = ("client_join", "sync_player", "sync_game", "sync_players", "sync_bots", "move_on", "server_error",
+                    "sync_ack", "set_codec", "set_compression", "ping", "pong",
+                    "set_session", "spectator_join", "spectate_question", "spectate_answers", "spectate_scores",
+                    "answer_stamp")
+
+# Tags that start each value in the binary codec
+BINARY_TAG_NONE = 0
+BINARY_TAG_FALSE = 1
+BINARY_TAG_TRUE = 2
+BINARY_TAG_INT = 3
+BINARY_TAG_FLOAT = 4
+BINARY_TAG_STRING = 5
+BINARY_TAG_STRING_REF = 6
+BINARY_TAG_LIST = 7
+BINARY_TAG_DICT = 8
+
 
 # - - - - - - - Classes - - - - - - - -#
 
+class QuizLimitExceeded(Exception):
+    """
+    Raised when a client sends more than a server allows, see MAX_FRAME_SIZE
+    """
+
+
 class QuizMessage:
     """
     A class to represent a message sent between the client and server
@@ -30,13 +182,25 @@ class QuizMessage:
         self.recipient = recipient
         self.message_type = message_type
 
+        # Only set on client_join, the names of the codecs the client can decode, if it can decompress frames and the
+        # room it wants to join (when the server is a QuizLobbyServer). When rejoining, the session token and how many
+        # of the session's messages the client has received
+        self.codecs = None
+        self.compression = None
+        self.room = None
+        self.session = None
+        self.sequence = None
+
     def __str__(self):
         return f"Message: {self.message}, Sender: {self.sender}, Recipient: {self.recipient}, Type: {self.message_type}"
 
-    def to_bytes(self) -> bytes:
+    def to_bytes(self, codec: str = "json") -> bytes:
         """
-        Creates a JSON object from the attributes of this object and encodes it in utf-8
-        @return: The message as bytes (JSON encoded in utf-8)
+        Creates an object from the attributes of this object and encodes it with the codec given. By default, this is
+        JSON encoded in utf-8 as that is what every peer understands.
+
+        @param codec: The name of the codec to use, see MESSAGE_CODECS (Default: "json")
+        @return: The message as bytes
         """
         obj = {
             "message": self.message,
@@ -44,764 +208,3578 @@ class QuizMessage:
             "recipient": self.recipient,
             "message_type": self.message_type
         }
-        debug_message(f"Encoding message: {obj}", "Network")
-        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+        if self.codecs is not None:
+            obj["codecs"] = self.codecs
+
+        if self.compression is not None:
+            obj["compression"] = self.compression
+
+        if self.room is not None:
+            obj["room"] = self.room
+
+        if self.session is not None:
+            obj["session"] = self.session
+            obj["sequence"] = self.sequence
+
+        # Only build the debug message if it is going to be shown, as the message can be large
+        if debug_enabled():
+            debug_message(f"Encoding message: {obj}", "Network")
+
+        return MESSAGE_CODECS[codec].encode(obj)
 
     def from_bytes(self, data: bytes) -> object:
         """
-        Update this objects attributes from the bytes (JSON encoded in utf-8)
+        Update this objects attributes from the bytes. The codec is worked out from the first byte, so a peer can
+        switch codecs at any point without the receiver needing to know.
+
         @param data: The data to decode
         @return: This object
         """
-        decoded = data.decode("utf-8")
-        debug_message(f"Decoded message: {decoded}", "Network")
+        codec = MESSAGE_CODEC_MAGIC.get(data[:1])
+        if codec is None:
+            raise ValueError(f"Unknown message codec: {data[:1]}")
+
+        obj = codec.decode(data)
+
+        if debug_enabled():
+            debug_message(f"Decoded message: {obj}", "Network")
 
-        obj = json.loads(decoded)
         self.message = obj.get("message")
         self.sender = obj.get("sender")
         self.recipient = obj.get("recipient")
         self.message_type = obj.get("message_type")
+        self.codecs = obj.get("codecs")
+        self.compression = obj.get("compression")
+        self.room = obj.get("room")
+        self.session = obj.get("session")
+        self.sequence = obj.get("sequence")
         return self
 
+    def to_frame(self, codec: str = "json", compress_threshold: int = None) -> bytes:
+        """
+        Encodes this message and prefixes it with a length header so that the receiver can split it out of the stream,
+        see QuizMessageBuffer for the receiving end. The message is encoded once with the codec, and that payload is
+        compressed if it is over the threshold. The receiver can tell the codec from the message itself.
+
+        @param codec: The name of the codec to use, see MESSAGE_CODECS (Default: "json")
+        @param compress_threshold: Compress the message if it is at least this many bytes, only pass this if the
+        receiver can decompress frames (Default: None, never compress)
+        @return: The framed message as bytes (header + encoded message)
+        """
+        return frame_bytes(self.to_bytes(codec), compress_threshold)
 
-class QuizServer:
+
+class QuizJsonCodec:
     """
-    A class to represent a server for the quiz game
+    Encodes messages as JSON in utf-8, this is what all peers understand so it is used until a client and server have
+    agreed on something else
     """
+    name = "json"
+    magic = b"{"
 
-    def __init__(self, host: str, port: int):
+    @staticmethod
+    def encode(obj: dict) -> bytes:
         """
-        Initialise the server, setups a selector and a server socket to listen for connections
-        @param host: The host to listen on
-        @param port: The port to listen on
+        @param obj: The message as a dict
+        @return: The message as JSON encoded in utf-8
         """
-        self.host = host
-        self.port = port
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
-        self.selector = selectors.DefaultSelector()
-        self.clients = []
-        self.client_names = []
+    @staticmethod
+    def decode(data: bytes) -> dict:
+        """
+        @param data: The message as JSON encoded in utf-8
+        @return: The message as a dict
+        """
+        return json.loads(data.decode("utf-8"))
 
-        self.server = setup_tcp_server(self.port)
 
-        self.selector.register(self.server, selectors.EVENT_READ, data=None)
+class QuizBinaryCodec:
+    """
+    A compact binary encoding for messages. The header is packed with struct and holds the message type as an id, the
+    values are tagged with a byte for their type, integers are written as varints and any string that is repeated in a
+    message (i.e. the keys of each user) is written as a reference to the first time it was written.
+    """
+    name = "binary"
+    magic = bytes([BINARY_CODEC_VERSION])
 
-    def run(self) -> None:
+    @staticmethod
+    def encode(obj: dict) -> bytes:
         """
-        Loop forever and accept connections or service connections when they are ready
+        @param obj: The message as a dict
+        @return: The message encoded in the binary format
         """
-        while True:
-            events = self.selector.select(timeout=None)
-            for key, mask in events:
-                if key.data is None:
-                    self.accept_connection(key.fileobj)
-                else:
-                    self.service_connection(key, mask)
+        message_type = obj.get("message_type")
+        type_id = MESSAGE_TYPE_IDS.index(message_type) + 1 if message_type in MESSAGE_TYPE_IDS else 0
 
-    def accept_connection(self, sock: socket) -> None:
-        """
-        Accept a connection from a client, saves the client and registers it with the selector. The data (sometimes
-        called key_data) is a namespace with the address of the client and the data to send and receive.
+        out = bytearray(struct.pack(BINARY_HEADER_FORMAT, BINARY_CODEC_VERSION, type_id))
+        strings = {}
 
-        @param sock: The socket to accept the connection from
+        # Types without an id are written out
+        if type_id == 0:
+            encode_binary_value(message_type, out, strings)
+
+        encode_binary_value(obj.get("sender"), out, strings)
+        encode_binary_value(obj.get("recipient"), out, strings)
+        encode_binary_value(obj.get("message"), out, strings)
+
+        # Anything else in the message (i.e. codecs) is kept as a dict
+        extras = {}
+        for key, value in obj.items():
+            if key not in ("message", "sender", "recipient", "message_type"):
+                extras[key] = value
+        encode_binary_value(extras, out, strings)
+
+        return bytes(out)
+
+    @staticmethod
+    def decode(data: bytes) -> dict:
         """
-        # Accept the connection
-        connection, address = sock.accept()
+        @param data: The message encoded in the binary format
+        @return: The message as a dict
+        """
+        version, type_id = struct.unpack_from(BINARY_HEADER_FORMAT, data)
+        if version != BINARY_CODEC_VERSION:
+            raise ValueError(f"Unknown binary codec version: {version}")
 
-        # Print the address
-        debug_message(f"Accepted connection from {address}", "network_server")
+        offset = struct.calcsize(BINARY_HEADER_FORMAT)
+        strings = []
 
-        # Don't block the process as we want to be able to accept multiple connections
-        connection.setblocking(False)
+        if type_id == 0:
+            message_type, offset = decode_binary_value(data, offset, strings)
+        else:
+            message_type = MESSAGE_TYPE_IDS[type_id - 1]
 
-        # Create the data object
-        data = types.SimpleNamespace(socket_adress=address, recieved_bytes=b"", send_bytes=b"")
+        sender, offset = decode_binary_value(data, offset, strings)
+        recipient, offset = decode_binary_value(data, offset, strings)
+        message, offset = decode_binary_value(data, offset, strings)
+        obj, offset = decode_binary_value(data, offset, strings)
 
-        # Create the events. They are now read and write so set those bits
-        events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        obj["message"] = message
+        obj["sender"] = sender
+        obj["recipient"] = recipient
+        obj["message_type"] = message_type
+        return obj
 
-        # Register the connection with the selector
-        self.selector.register(connection, events, data=data)
 
-        # Add the connection to the list of clients
-        self.clients.append(connection)
-        self.client_names.append(address)
+class QuizMessageBuffer:
+    """
+    A per-connection buffer that reassembles the length-prefixed frames sent by QuizMessage.to_frame(). TCP is a stream
+    so one recv() can hold part of a message or many messages, the buffer holds onto any partial frame until the rest
+    of it arrives. Compressed frames are decompressed as they are taken out.
+    """
 
-    def close_connection(self, sock: socket) -> None:
+    def __init__(self, max_size: int = None) -> None:
         """
-        Close a connection from a client by removing it from the selector and the list of clients
+        Creates an empty buffer
 
-        @param sock: The socket to close the connection on.
+        @param max_size: The biggest message in bytes (after decompressing) that can be taken out, a frame that says it
+        is bigger raises QuizLimitExceeded as soon as its header arrives (Default: None, no limit)
         """
+        self.buffer = bytearray()
+        self.max_size = max_size
 
-        debug_message(f"Closing connection on {sock}", "network_server")
+    def feed(self, data: bytes) -> list:
+        """
+        Adds the received data to the buffer and splits out every frame that is now complete. Each byte is only looked
+        at once, so large messages arriving in many chunks don't cost more than small ones.
 
-        # Unregister the socket from the selector
-        self.selector.unregister(sock)
+        @param data: The data received from the socket
+        @return: A list of the complete message payloads (without their headers), in the order they were sent
+        @raise QuizLimitExceeded: If a message is over the max size
+        """
+        self.buffer += data
 
-        # Close the socket
-        sock.close()
+        messages = []
+        offset = 0
 
-        # Remove the socket from the list of clients
-        for sock_index in range(len(self.clients)):
-            if self.clients[sock_index] == sock:
-                # Remove the client and name
-                self.clients.pop(sock_index)
-                self.client_names.pop(sock_index)
+        # Keep taking frames out while there is a full header and the full payload it describes
+        while len(self.buffer) - offset >= FRAME_HEADER_SIZE:
+            header = struct.unpack_from(FRAME_HEADER_FORMAT, self.buffer, offset)[0]
+            size = header & ~FRAME_COMPRESSED_FLAG
+            end = offset + FRAME_HEADER_SIZE + size
+
+            # Refuse it now rather than waiting for (and holding onto) the whole message
+            if self.max_size is not None and size > self.max_size:
+                raise QuizLimitExceeded(f"Message of {size} bytes is over the limit of {self.max_size}")
+
+            # The rest of this message hasn't arrived yet
+            if end > len(self.buffer):
                 break
 
-    def service_connection(self, key: object, mask: object) -> None:
-        """
-        Service a connection from a client. This is called when the client has data to send or is ready to receive
-        data. Data is read in 4096 byte chunks so messages shouldn't be sent directly one after another or will cause
-        issues on the receiving end. Data is then sent to the handle_data_received function. If there is data to send
-        then it is sent to the handle_data_send function.
+            payload = bytes(self.buffer[offset + FRAME_HEADER_SIZE:end])
+            if header & FRAME_COMPRESSED_FLAG:
+                payload = self.decompress(payload)
 
-        @param key: The key to the client
-        @param mask: The mask to the client
-        """
+            messages.append(payload)
+            offset = end
 
-        try:
-            sock = key.fileobj
-            data = key.data
+        # Remove the frames that have been taken out in one go
+        if offset:
+            del self.buffer[:offset]
 
-            # If the socket has its read bit set
-            if mask & selectors.EVENT_READ:
+        return messages
 
-                # Get the data
-                recv_data = sock.recv(4096)
+    def decompress(self, payload: bytes) -> bytes:
+        """
+        Decompress a payload, stopping as soon as it is over the max size so that a small message can't be
+        decompressed into a huge one
 
-                # If there is no data then the connection has been closed
-                if recv_data:
-                    self.handle_data_received(sock, data, recv_data)
+        @param payload: The compressed payload
+        @return: The decompressed payload
+        @raise QuizLimitExceeded: If the decompressed payload is over the max size
+        """
+        if self.max_size is None:
+            return zlib.decompress(payload)
 
-                else:
-                    # Print the address
-                    debug_message(f"Closing connection on {data.socket_adress}", "network_server")
+        decompressor = zlib.decompressobj()
+        payload = decompressor.decompress(payload, self.max_size + 1)
 
-                    # Close the connection
-                    self.close_connection(sock)
+        if len(payload) > self.max_size:
+            raise QuizLimitExceeded(f"Compressed message is over the limit of {self.max_size} bytes")
 
-            # If the socket has its write bit set
-            if mask & selectors.EVENT_WRITE:
+        if not decompressor.eof:
+            raise zlib.error("Compressed message is incomplete")
 
-                # If there is data to send
-                if data.send_bytes:
-                    self.handle_data_send(sock, data, data.send_bytes)
+        return payload
 
-        except Exception as e:
-            self.handle_error(sock, data, e)
 
-    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
-        """
-        Handle data received from a client. This needs to be overridden by a subclass to handle for its use case.
+class QuizStateTracker:
+    """
+    Keeps a revision number for every value in the game's save data so that only the values that have changed since a
+    client last synced need to be sent. The save data is flattened into paths (i.e. ["users", 0, "points"]) with the
+    leaf value for each, the lengths of lists are stored as their own path so lists can grow and shrink.
+    """
 
-        @param sock:  The socket the data came from.
-        @param key_data: The data from the key, contains the address of
-        the client, the data to send and the data to receive
-        @param recv_data: The data received, can be also gotten from key_data.send_bytes but is passed for convenience
+    def __init__(self) -> None:
+        """
+        Creates an empty tracker, at revision 0 nothing has been synced
         """
+        self.revision = 0
+        self.values = {}
+        self.revisions = {}
+        self.history = []
 
-    def handle_data_send(self, sock: socket, key_data: object, send_data: bytes) -> None:
+    def update(self, state: dict, sections: list | tuple = None) -> int:
         """
-        Handle data sent to a client
+        Compares the state to the last values and records a new revision for each value that has changed, been added or
+        been removed.
 
-        @param key_data: The data from the key
-        @param sock: The socket to send the data on
-        @param send_data: The data sent
+        @param state: The save data to compare (dicts, lists and JSON values only)
+        @param sections: The top level keys in the state to compare, if None then all of them are compared (Default:
+        None)
+        @return: The current revision
         """
+        if sections is None:
+            sections = list(state.keys())
+
+        # Flatten only the sections being updated
+        flat = {}
+        for section in sections:
+            flatten_state(state.get(section), (section,), flat)
+
+        revision = self.revision + 1
+        changed = False
+
+        # Find the values that are new or have changed (compare the type as well so 1 and True are different)
+        for path, value in flat.items():
+            old_value = self.values.get(path)
+            if path not in self.values or type(old_value) is not type(value) or old_value != value:
+                self.values[path] = value
+                self.revisions[path] = revision
+                self.history.append((revision, path))
+                changed = True
+
+        # Find the values in these sections that no longer exist
+        for path in list(self.values.keys()):
+            if path[0] in sections and path not in flat:
+                del self.values[path]
+                self.revisions[path] = revision
+                self.history.append((revision, path))
+                changed = True
+
+        if changed:
+            self.revision = revision
+
+        # Stop the history growing forever, only the newest change to each path needs to be kept
+        if len(self.history) > 2 * len(self.revisions) + 64:
+            self.history = sorted(((path_revision, path) for path, path_revision in self.revisions.items()),
+                                  key=lambda item: item[0])
+
+        return self.revision
+
+    def patch(self, since: int, sections: list | tuple = None) -> dict:
+        """
+        Creates a patch of everything that has changed after the revision given. Only the history after that revision
+        is looked at so the cost depends on how much has changed, not the size of the game.
 
-    def send_message(self, sock: socket, message: str, message_type: str) -> None:
+        @param since: The revision the client already has (0 for everything)
+        @param sections: Only include the paths that start with one of these keys, if None then all paths are included
+        (Default: None)
+        @return: A dict with the current revision, the values to set and the paths to remove
         """
-        Send a message to the socket specified. The message is wrapped in a QuizMessage object and then sent.
+        set_values = []
+        remove_paths = []
+        seen = set()
+
+        # Walk back through the history until reaching what the client already has
+        for history_index in range(len(self.history) - 1, -1, -1):
+            revision, path = self.history[history_index]
+            if revision <= since:
+                break
 
-        @param message_type: The type of message to send
-        @param sock: The socket to send the message on
-        @param message: The message to send
+            # Only the newest change to a path is needed
+            if path in seen or (sections is not None and path[0] not in sections):
+                continue
+            seen.add(path)
+
+            if path in self.values:
+                set_values.append([list(path), self.values[path]])
+            else:
+                remove_paths.append(list(path))
+
+        return {"revision": self.revision, "set": set_values, "remove": remove_paths}
+
+    def snapshot(self) -> dict:
         """
-        message = QuizMessage(message, get_ip(), self.host, message_type)
-        debug_message(f"Sending...")
-        sock.sendall(message.to_bytes())
-        debug_message(f"Sent {message}", "network_server")
+        Creates a patch containing all the values as they are now, rebuilt into their dicts and lists. This is used for
+        clients that haven't synced yet as it is much smaller than listing every path.
 
-    def send_message_to_all(self, message: str, message_type: str) -> None:
+        @return: A dict with the current revision and the rebuilt state
         """
-        Send a message to all clients using the send_message function and  looping through the clients
+        state = {}
+        for path, value in self.values.items():
+            set_patch_value(state, list(path), value)
 
-        @param message_type: The type of message to send
-        @param message: The message to send
+        return {"revision": self.revision, "snapshot": state}
+
+
+class QuizSession:
+    """
+    A player's place in a game, kept when their connection is lost so that they can rejoin where they left off. The
+    messages sent to the player (including the ones sent while they were disconnected) are counted and the newest are
+    kept, so a player that rejoins with the number they received only needs to be sent the ones after that.
+    """
+
+    def __init__(self, name: str, replay_length: int = SESSION_REPLAY_LENGTH) -> None:
         """
-        for client in self.clients:
-            self.send_message(client, message, message_type)
+        Creates a session with a new random token
 
-    def kill(self) -> None:
+        @param name: The name of the player the session is for
+        @param replay_length: How many messages to keep for replaying (Default: SESSION_REPLAY_LENGTH)
         """
-        Kill the server, closing all connections in the clients list and then finally closing the server
+        self.token = secrets.token_hex(16)
+        self.name = name
+        self.sent = 0
+        self.replay = collections.deque(maxlen=replay_length)
+
+        # The revision of the game state the player has (or will have once the kept messages are replayed)
+        self.revision = 0
+
+    def record(self, message: QuizMessage) -> None:
         """
-        # Close the clients
-        for client in self.clients:
-            self.close_connection(client)
+        Count and keep a message sent to the player, only the types in SESSION_MESSAGE_TYPES are recorded
 
-        # Close the server
-        self.close_connection(self.server)
+        @param message: The message that was sent
+        """
+        if message.message_type in SESSION_MESSAGE_TYPES:
+            self.sent += 1
+            self.replay.append(message)
 
-    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+    def missed(self, received: int) -> list | None:
         """
-        Handle an error from the server. This is called when an error occurs in the server. The connection is closed
-        on the socket and the error is printed. If the error is a user disconnecting then it is printed as a debug
-        message, otherwise it is printed as an error this is because disconnection shouldn't be displayed.
+        Gets the messages sent after the ones the player received
 
-        @param sock: The socket the error occurred on
-        @param key_data: The data from the key
-        @param error_response: The string representation of the error
+        @param received: How many of the messages the player received
+        @return: The messages in the order they were sent, or None if some of them are no longer kept
         """
-        self.close_connection(sock)
+        missed = self.sent - received
+        if missed < 0 or missed > len(self.replay):
+            return None
 
-        # Check if this is caused by a user disconnecting
-        if "An existing connection was forcibly closed by the remote host" in str(error_response):
-            debug_message(f"Client disconnected: {key_data.socket_adress}", "network_server")
-        else:
-            error(f"Error in server: {error_response}")
+        return list(self.replay)[len(self.replay) - missed:]
 
 
-class QuizClient:
+class QuizTimingWheel:
     """
-    A class to represent a client for the quiz game
+    A hashed timing wheel, used to check the heartbeat of every connection without looking at all of them on every
+    tick. Timers are put in the slot for the tick they are due on (wrapping around the wheel, with a count of how many
+    more times around they have to go), so each tick only looks at the timers in one slot. Adding, cancelling and
+    expiring a timer are all O(1).
     """
 
-    def __init__(self, host: str, port: int):
+    def __init__(self, tick_length: float = TIMING_WHEEL_TICK, slot_amount: int = TIMING_WHEEL_SLOTS,
+                 now: float = None) -> None:
         """
-        Initialise the client and connect to the server. The selector set and then is used to listen for data from
-        the server
+        Creates an empty wheel
 
-        @param host: The host ip to connect to
-        @param port: The port to listen on
+        @param tick_length: How many seconds each slot covers (Default: TIMING_WHEEL_TICK)
+        @param slot_amount: How many slots the wheel has (Default: TIMING_WHEEL_SLOTS)
+        @param now: The time.monotonic() to start the wheel at, if None then the current time (Default: None)
         """
-        self.host = host
-        self.port = port
-
-        self.selector = selectors.DefaultSelector()
-
-        self.client = connect_to_server(self.host, self.port)
+        self.tick_length = tick_length
+        self.slots = [{} for _ in range(slot_amount)]
+        self.timers = {}
 
-        self.selector.register(self.client, selectors.EVENT_READ, data=None)
+        self.current_tick = 0
+        self.last_tick_time = time.monotonic() if now is None else now
 
-    def run(self) -> None:
-        """
-        Run the client, listening for data from the server refreshing every second. If there is data then it is read
-        at 4096 bytes per chunk and then checked to see if it is a valid json string. If it is then it is sent to the
-        handle_data_received function. If there is no data then the connection has been closed and the client is closed.
+    def schedule(self, key: object, delay: float) -> None:
         """
-        try:
+        Add a timer, replacing any timer already set for the key
 
-            while True:
+        @param key: What the timer is for (i.e. the socket), returned by advance() when the timer expires
+        @param delay: How many seconds until the timer expires, rounded up to the next tick
+        """
+        self.cancel(key)
 
-                events = self.selector.select(timeout=1)
+        ticks = max(1, math.ceil(delay / self.tick_length))
+        slot = (self.current_tick + ticks) % len(self.slots)
 
-                for key, mask in events:
+        # Store how many more times the wheel has to go round before this timer is due
+        self.slots[slot][key] = (ticks - 1) // len(self.slots)
+        self.timers[key] = slot
 
-                    try:
-                        sock = key.fileobj
-                        data = key.data
+    def cancel(self, key: object) -> None:
+        """
+        Remove a timer, does nothing if there isn't one for the key
 
-                        # If the socket has its read bit set
-                        if mask & selectors.EVENT_READ:
+        @param key: What the timer is for
+        """
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
 
-                            # Store all the data parts in a list
-                            fragments = []
+    def advance(self, now: float = None) -> list:
+        """
+        Move the wheel on by however many ticks have passed since it was last moved
 
-                            # While there is data to read
-                            while True:
-                                data = sock.recv(4096)
-                                fragments.append(data)
-                                recv_data = b''.join(fragments)
+        @param now: The current time.monotonic(), if None then it is got (Default: None)
+        @return: The keys of the timers that have expired
+        """
+        if now is None:
+            now = time.monotonic()
 
-                                try:
-                                    decoded = recv_data.decode()
-                                    json.loads(decoded)
-                                    break
-                                except ValueError:
-                                    continue
+        expired = []
 
-                            # If there is no data then the connection has been closed
-                            if recv_data:
-                                self.handle_data_received(sock, data, recv_data)
+        while now - self.last_tick_time >= self.tick_length:
+            self.last_tick_time += self.tick_length
+            self.current_tick = (self.current_tick + 1) % len(self.slots)
+            slot = self.slots[self.current_tick]
 
-                        # If the socket has its write bit set
-                        if mask & selectors.EVENT_WRITE:
+            for key, rounds in list(slot.items()):
+                if rounds:
+                    slot[key] = rounds - 1
+                else:
+                    del slot[key]
+                    del self.timers[key]
+                    expired.append(key)
 
-                            # If there is data to send
-                            if data.send_bytes:
-                                self.handle_request(sock, data, data.send_bytes)
+        return expired
 
-                    except Exception as e:
-                        self.handle_error(sock, data, e)
 
-        # OSErrors thrown here are caused when the socket is being deleted, so can ignore them
-        except OSError:
-            pass
+class QuizClockEstimate:
+    """
+    Estimates the round trip time to a client and how far its clock is ahead of the server's, in the same way as NTP.
+    Each ping is stamped with when the server sent it, the client adds when it received it and when it replied (on
+    its own clock) and the server stamps when the pong arrived. Only monotonic clocks are used, so the offset maps the
+    client's time.monotonic() to the server's and isn't thrown off by either computer changing its wall clock.
+    """
 
-    def close_connection(self, sock: socket) -> None:
+    def __init__(self, sample_amount: int = CLOCK_SAMPLES) -> None:
         """
-        Close a connection on a socket and unregisters it from the selector, mostly used to close the connection on 
-        the server
+        Creates an estimate with no samples
 
-        @param sock: The socket to close the connection on.
+        @param sample_amount: How many of the newest samples to keep (Default: CLOCK_SAMPLES)
         """
-        # Unregister the socket from the selector
-        self.selector.unregister(sock)
+        self.samples = collections.deque(maxlen=sample_amount)
+        self.rtt = None
+        self.offset = None
 
-        # Close the socket
-        sock.close()
+        # The server's time.monotonic() when the newest sample arrived
+        self.measured = None
 
-    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+    def add_sample(self, sent: float, received: float, replied: float, returned: float) -> None:
         """
-        Handle data received from the server. This is called when data is received from the server. Functionality needs
-        to be written by the subclass
+        Add the timings of a ping and update the estimate
 
-        @param sock: The socket the data was received on
-        @param key_data: The data from the key
-        @param recv_data: The data received from the server, same as key_data.receive_bytes but kept for convenience
+        @param sent: When the server sent the ping (server clock)
+        @param received: When the client received the ping (client clock)
+        @param replied: When the client sent the pong (client clock)
+        @param returned: When the server received the pong (server clock)
         """
-        pass
+        # The time spent on the network, without the time the client took to reply
+        rtt = max(0.0, (returned - sent) - (replied - received))
+        offset = ((received - sent) + (replied - returned)) / 2
 
-    def handle_request(self, sock: socket, key_data: object, send_data: bytes) -> None:
-        """
-        Handle a request to send data to the server. This is called when data is sent to the server. Functionality needs
-        to be written by the subclass
+        self.samples.append((rtt, offset))
+        self.rtt = rtt if self.rtt is None else self.rtt + (rtt - self.rtt) * CLOCK_RTT_SMOOTHING
 
-        @param sock: The socket to send the data on
-        @param key_data: The data from the key
-        @param send_data: The data to send to the server, same as key_data.send_bytes but kept for convenience
-        """
-        pass
+        # The sample with the smallest round trip was held up the least, so its offset is the most accurate
+        self.offset = min(self.samples)[1]
+        self.measured = returned
 
-    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+    def needs_sample(self, now: float, interval: float = CLOCK_SYNC_INTERVAL) -> bool:
         """
-        Handle an error from the client. This is called when an error occurs in the client. The connection is closed
-        and then the exception is printed using the error function
+        Checks if the client should be pinged for another sample
 
-        @param sock: The socket the error occurred on
-        @param key_data: The data from the selector key
-        @param error_response: The string representation of the error
+        @param now: The server's time.monotonic()
+        @param interval: How old the newest sample can be in seconds (Default: CLOCK_SYNC_INTERVAL)
+        @return: True if there aren't enough samples yet or the newest is too old
         """
-        self.close_connection(sock)
-        error(f"Error in client: {error_response}")
+        return len(self.samples) < self.samples.maxlen or now - self.measured >= interval
 
-    def send_message(self, sock: object, message: str, message_type: str) -> None:
+    def to_server_time(self, client_time: float) -> float:
         """
-        Send a message to the server enclosed in a QuizMessage object
+        Converts a time.monotonic() from the client to the server's clock, there must be at least one sample
 
-        @param message_type: The type of message to send
-        @param sock: The socket to send the message on
-        @param message: The message to send
+        @param client_time: The time on the client's clock
+        @return: The time on the server's clock
         """
-        message = QuizMessage(message, get_ip(), self.host, message_type)
-        debug_message(f"Sending {message}", "network_client")
-        sock.sendall(message.to_bytes())
+        return client_time - self.offset
 
 
-class QuizGameServer(QuizServer):
-    game = None
-    running = False
-    error = None
+class QuizTimeHistogram:
+    """
+    Counts how long something took in fixed buckets, so it is cheap enough to add to on every message. The buckets are
+    the same for every histogram so they can be compared, see STATS_TIME_BUCKETS
+    """
 
-    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+    def __init__(self) -> None:
         """
-        Handle data received from a client. This function can handle the client_join message type and the sync_player
-        message. Both of these actions involve updating the game's users array with the new user data if the request
-        was handled without error. Upon handling the messages the server will send an error response to the socket if
-        the game is full or has already started or if the username is already taken.  If the game has already started
-        then the server will only allow the client to join if they have a name that is already in the game's users
-        but not connected, which is treated as a reconnect.
+        Creates an empty histogram
+        """
+        self.counts = [0] * (len(STATS_TIME_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
 
-        @param sock: The socket to handle the data from
-        @param key_data: The data from the selector key
-        @param recv_data: The data received from the client (same as key_data.receive_bytes but kept for convenience)
+    def add(self, seconds: float) -> None:
         """
+        Add a time to the histogram
 
-        # Convert the data to a message
-        message = QuizMessage(None, None, None, None)
-        message.from_bytes(recv_data)
+        @param seconds: How long it took
+        """
+        self.counts[bisect.bisect_left(STATS_TIME_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> dict:
+        """
+        Gets the histogram as a dict that can be saved as JSON
+
+        @return: The count, total, mean and max (in seconds) and the count in each bucket by its upper bound ("inf" for
+        the last)
+        """
+        bounds = [str(bound) for bound in STATS_TIME_BUCKETS] + ["inf"]
+
+        return {"count": self.count, "total": self.total, "mean": self.total / self.count if self.count else 0.0,
+                "max": self.max, "buckets": dict(zip(bounds, self.counts))}
+
+
+class QuizConnectionStats:
+    """
+    The counters for one connection: the bytes and messages sent and received of each message type and when anything
+    last happened. Inbound bytes are counted once the frame has been decompressed, outbound bytes are the frame as
+    sent (so after compressing). Counting is only a few additions, so it is always on.
+    """
+
+    def __init__(self) -> None:
+        """
+        Creates the counters with nothing counted
+        """
+        self.bytes_in = collections.Counter()
+        self.bytes_out = collections.Counter()
+        self.messages_in = collections.Counter()
+        self.messages_out = collections.Counter()
+        self.created = time.monotonic()
+        self.last_activity = self.created
+
+    def record_in(self, message_type: str, size: int) -> None:
+        """
+        Count a message that has been received
+
+        @param message_type: The type of the message
+        @param size: The size of the message in bytes
+        """
+        self.bytes_in[message_type] += size
+        self.messages_in[message_type] += 1
+        self.last_activity = time.monotonic()
+
+    def record_out(self, message_type: str, size: int) -> None:
+        """
+        Count a message that has been sent (or queued to be sent)
+
+        @param message_type: The type of the message
+        @param size: The size of the frame in bytes
+        """
+        self.bytes_out[message_type] += size
+        self.messages_out[message_type] += 1
+        self.last_activity = time.monotonic()
+
+    def to_dict(self, now: float, queued: int) -> dict:
+        """
+        Gets the counters as a dict that can be saved as JSON
+
+        @param now: The time.monotonic() to work out the rates and idle time from
+        @param queued: How many bytes are waiting to be sent on the connection
+        @return: The totals, the messages per second since the connection started, the bytes queued, the seconds since
+        anything was sent or received and the messages and bytes of each type
+        """
+        # Copy the counters first as they can be added to by the server thread while this is running
+        bytes_in, bytes_out = dict(self.bytes_in), dict(self.bytes_out)
+        types_in, types_out = dict(self.messages_in), dict(self.messages_out)
+
+        age = max(now - self.created, 0.001)
+        messages_in = sum(types_in.values())
+        messages_out = sum(types_out.values())
+
+        return {"bytes_in": sum(bytes_in.values()), "bytes_out": sum(bytes_out.values()),
+                "messages_in": messages_in, "messages_out": messages_out, "rate_in": messages_in / age,
+                "rate_out": messages_out / age, "queued": queued, "idle": max(now - self.last_activity, 0.0),
+                "types_in": {message_type: {"messages": count, "bytes": bytes_in.get(message_type, 0)}
+                             for message_type, count in types_in.items()},
+                "types_out": {message_type: {"messages": count, "bytes": bytes_out.get(message_type, 0)}
+                              for message_type, count in types_out.items()}}
+
+
+class QuizTokenBucket:
+    """
+    Limits how often something can happen. The bucket holds up to the capacity in tokens and is refilled at the rate,
+    each time it happens a token is taken out. So short bursts are allowed but the average can't go over the rate.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """
+        Creates a full bucket
+
+        @param rate: How many tokens are added a second
+        @param capacity: The most tokens the bucket can hold
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        """
+        Take a token out of the bucket if there is one
+
+        @param now: The time.monotonic() to refill the bucket up to
+        @return: True if a token was taken, False if the bucket is empty
+        """
+        # The time can be from just before the bucket was made, which mustn't take tokens away
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class QuizIngressLimiter:
+    """
+    The rate limits of one connection, a bucket for every message and one for each message type that has its own limit,
+    see INGRESS_TYPE_LIMITS. The buckets for the types are only made once a message of that type arrives.
+    """
+
+    def __init__(self, rate: float = INGRESS_RATE, capacity: float = INGRESS_CAPACITY,
+                 type_limits: dict = None) -> None:
+        """
+        Creates the limiter with full buckets
+
+        @param rate: How many messages a second can be received on average (Default: INGRESS_RATE)
+        @param capacity: How many messages can be received in a burst (Default: INGRESS_CAPACITY)
+        @param type_limits: The rate and capacity of each message type that has its own limit (Default: None, uses
+        INGRESS_TYPE_LIMITS)
+        """
+        self.bucket = QuizTokenBucket(rate, capacity)
+        self.type_limits = INGRESS_TYPE_LIMITS if type_limits is None else type_limits
+        self.type_buckets = {}
+
+    def allow(self, message_type: str, now: float) -> bool:
+        """
+        Checks if a message can be received and takes it from the buckets
+
+        @param message_type: The type of the message
+        @param now: The time.monotonic() the message arrived
+        @return: True if the message is within the limits, False if not
+        """
+        if not self.bucket.take(now):
+            return False
+
+        limit = self.type_limits.get(message_type)
+        if limit is None:
+            return True
+
+        if message_type not in self.type_buckets:
+            self.type_buckets[message_type] = QuizTokenBucket(*limit)
+
+        return self.type_buckets[message_type].take(now)
+
+
+class QuizSpectatorFeed:
+    """
+    Sends the spectators of a QuizGameServer the events they watch the game with, on a thread of its own so that the
+    players are never kept waiting while hundreds of spectators are sent to. The server only marks that something may
+    have changed (see publish()), the feed then works out the events from the game and only sends the ones that are
+    different to what was last sent.
+    """
+
+    def __init__(self, server: object, interval: float = SPECTATOR_FEED_INTERVAL) -> None:
+        """
+        Creates the feed, the thread is started when the first spectator joins (see start())
+
+        @param server: The QuizGameServer to get the game and spectators from
+        @param interval: The least time between sending events in seconds (Default: SPECTATOR_FEED_INTERVAL)
+        """
+        self.server = server
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.pending = False
+        self.running = True
+        self.thread = None
+
+        # The value of each event as it was last sent
+        self.sent = {}
+
+    def publish(self) -> None:
+        """
+        Let the feed know that the game may have changed, can be called from any thread and returns straight away
+        """
+        # Nobody is watching, so there is nothing to wake the thread for (new spectators are sent everything)
+        if not self.server.spectators:
+            return
+
+        with self.condition:
+            if not self.running:
+                return
+
+            self.pending = True
+            self.condition.notify_all()
+
+    def start(self) -> None:
+        """
+        Start the feed's thread if it isn't already running, so servers without spectators never have one
+        """
+        with self.condition:
+            if self.running and self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the feed's thread
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def run(self) -> None:
+        """
+        Send the events that have changed whenever something is published, until stopped
+        """
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or not self.running)
+                if not self.running:
+                    return
+                self.pending = False
+
+            # Nobody is watching, so there is no need to work anything out (new spectators are sent everything)
+            spectators = self.server.spectators.copy()
+            if spectators:
+                events = self.server.get_spectator_events()
+
+                for message_type, event in get_changed_events(events, self.sent):
+                    self.server.send_message_to_clients(spectators, event, message_type)
+
+                self.sent = events
+
+            # Wait before sending again, anything published while waiting is sent together
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running, self.interval)
+
+
+class QuizServer:
+    """
+    A class to represent a server for the quiz game
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the server, setups a selector and a server socket to listen for connections. A socket pair is also
+        registered with the selector so that other threads can wake it up when they have queued data to send.
+
+        @param host: The host to listen on
+        @param port: The port to listen on
+        """
+        self.host = host
+        self.port = port
+
+        self.selector = selectors.DefaultSelector()
+        self.clients = []
+        self.client_names = []
+        self.client_codecs = {}
+        self.client_compression = {}
+        self.compression_threshold = COMPRESSION_THRESHOLD
+        self.high_water_mark = OUTBOUND_HIGH_WATER_MARK
+        self.slow_client_policy = SLOW_CLIENT_POLICY
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.heartbeat_timeout = HEARTBEAT_TIMEOUT
+        self.heartbeat_wheel = QuizTimingWheel()
+
+        # What each client is allowed to send, see allow_message()
+        self.max_frame_size = MAX_FRAME_SIZE
+        self.ingress_rate = INGRESS_RATE
+        self.ingress_capacity = INGRESS_CAPACITY
+        self.ingress_type_limits = INGRESS_TYPE_LIMITS
+
+        # The round trip time and clock offset of each client, see handle_pong()
+        self.clock_estimates = {}
+        self.clock_sync_interval = CLOCK_SYNC_INTERVAL
+
+        # How long encoding and decoding messages takes, the per-connection counters are kept in each connection's data
+        self.encode_times = QuizTimeHistogram()
+        self.decode_times = QuizTimeHistogram()
+
+        # The outbound queues are filled by the game thread and emptied by the server thread, clients in
+        # pending_clients have had data queued (or need closing) since the server thread last looked
+        self.send_lock = threading.Lock()
+        self.pending_clients = set()
+
+        # Connections accepted by another process that are waiting to be added on the server thread, see
+        # adopt_connection()
+        self.adopted_connections = []
+
+        # Set by stop(), the server thread kills the server once it sees it
+        self.stopped = False
+
+        self.server = setup_tcp_server(self.port)
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.wakeup_sender.setblocking(False)
+
+        self.selector.register(self.server, selectors.EVENT_READ, data=None)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ, data=None)
+
+        network_endpoints.add(self)
+
+    def run(self) -> None:
+        """
+        Loop forever and accept connections or service connections when they are ready. Clients are only watched for
+        being writable while they have data queued, so this only wakes up when there is something to do or to check
+        the heartbeats once a tick. Returns once stop() has been called, after killing the server.
+        """
+        timeout = None if self.heartbeat_timeout is None else self.heartbeat_wheel.tick_length
+
+        while not self.stopped:
+            events = self.selector.select(timeout=timeout)
+            for key, mask in events:
+                if key.fileobj is self.wakeup_receiver:
+                    self.handle_wakeup()
+                elif key.data is None:
+                    self.accept_connection(key.fileobj)
+                else:
+                    self.service_connection(key, mask)
+
+            if timeout is not None:
+                self.check_heartbeats()
+
+        self.kill()
+
+    def accept_connection(self, sock: socket) -> None:
+        """
+        Accept a connection from a client, saves the client and registers it with the selector. The data (sometimes
+        called key_data) is a namespace with the address of the client, the data to send and receive, if the client is
+        a browser (see open_transport()) and if the connection is being closed.
+
+        @param sock: The socket to accept the connection from
+        """
+        # Accept the connection
+        connection, address = sock.accept()
+
+        # Print the address
+        debug_message(f"Accepted connection from {address}", "network_server")
+
+        self.add_connection(connection, address)
+
+    def add_connection(self, connection: socket, address: object) -> object:
+        """
+        Start serving a connected socket, see accept_connection()
+
+        @param connection: The socket of the client
+        @param address: The address of the client
+        @return: The data (sometimes called key_data) of the connection
+        """
+        # Don't block the process as we want to be able to accept multiple connections
+        connection.setblocking(False)
+
+        # Create the data object
+        data = types.SimpleNamespace(socket_adress=address, recieved_bytes=QuizMessageBuffer(self.max_frame_size),
+                                     handshake=bytearray(), websocket=None,
+                                     send_bytes=bytearray(), closing=False, last_seen=time.monotonic(),
+                                     stats=QuizConnectionStats(), limiter=QuizIngressLimiter(
+                                         self.ingress_rate, self.ingress_capacity, self.ingress_type_limits))
+
+        # Only read for now, write is added when there is data queued to send
+        self.selector.register(connection, selectors.EVENT_READ, data=data)
+        self.start_heartbeat(connection)
+
+        # Add the connection to the list of clients
+        self.clients.append(connection)
+        self.client_names.append(address)
+
+        return data
+
+    def adopt_connection(self, connection: socket, address: object, received: bytes) -> None:
+        """
+        Start serving a connection that another process accepted and handed over (i.e. a lobby passing on a client that
+        joined this game's room), along with the bytes that process had already read from it. Can be called from any
+        thread, the connection is added on the server thread.
+
+        @param connection: The socket of the client
+        @param address: The address of the client
+        @param received: The data already received from the client
+        """
+        with self.send_lock:
+            killed = self.server.fileno() == -1
+            if not killed:
+                self.adopted_connections.append((connection, address, received))
+
+        if killed:
+            debug_message(f"Server has been killed, closing the connection from {address}", "network_server")
+            connection.close()
+            return
+
+        self.wake_up()
+
+    def close_connection(self, sock: socket) -> None:
+        """
+        Close a connection from a client by removing it from the selector and the list of clients
+
+        @param sock: The socket to close the connection on.
+        """
+
+        debug_message(f"Closing connection on {sock}", "network_server")
+
+        # Let a browser know the WebSocket is being closed on purpose, after anything still queued
+        data = self.get_connection_data(sock)
+        if data is not None and data.websocket is not None and not data.closing:
+            # Import here to prevent circular imports
+            from Maxs_Modules.websocket_network import WEBSOCKET_OPCODE_CLOSE, create_frame
+
+            self.queue_frame(sock, create_frame(b"", WEBSOCKET_OPCODE_CLOSE), False)
+            self.flush_connection(sock)
+
+        # Unregister the socket from the selector
+        self.selector.unregister(sock)
+
+        # Close the socket
+        sock.close()
+
+        # Remove the socket from the list of clients
+        for sock_index in range(len(self.clients)):
+            if self.clients[sock_index] == sock:
+                # Remove the client and name
+                self.clients.pop(sock_index)
+                self.client_names.pop(sock_index)
+                break
+
+        self.client_codecs.pop(sock, None)
+        self.client_compression.pop(sock, None)
+        self.clock_estimates.pop(sock, None)
+        self.heartbeat_wheel.cancel(sock)
+
+    def service_connection(self, key: object, mask: object) -> None:
+        """
+        Service a connection from a client. This is called when the client has data to send or is ready to receive
+        data. Data is read in 4096 byte chunks and fed into the connection's QuizMessageBuffer, each complete message
+        is then sent to the handle_data_received function. If the socket is writable (only watched for while there is
+        data queued) then the queue is sent with the handle_data_send function.
+
+        @param key: The key to the client
+        @param mask: The mask to the client
+        """
+
+        try:
+            sock = key.fileobj
+            data = key.data
+
+            # If the socket has its read bit set
+            if mask & selectors.EVENT_READ:
+
+                # Get the data
+                recv_data = sock.recv(RECEIVE_CHUNK_SIZE)
+
+                # If there is no data then the connection has been closed
+                if recv_data:
+                    data.last_seen = time.monotonic()
+                    self.handle_received_bytes(sock, data, recv_data)
+
+                else:
+                    # Print the address
+                    debug_message(f"Closing connection on {data.socket_adress}", "network_server")
+
+                    # Close the connection
+                    self.close_connection(sock)
+
+            # If the socket has its write bit set, and wasn't closed while reading
+            if mask & selectors.EVENT_WRITE and sock.fileno() != -1:
+
+                # If there is data to send
+                if data.send_bytes:
+                    self.handle_data_send(sock, data, data.send_bytes)
+
+        except QuizLimitExceeded as e:
+            self.reject_client(sock, str(e))
+
+        except Exception as e:
+            self.handle_error(sock, data, e)
+
+    def handle_received_bytes(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+        """
+        Take the complete messages out of data received from a client and handle each one with handle_data_received().
+        Messages from a browser arrive as WebSocket frames instead, see open_transport().
+
+        @param sock: The socket the data came from
+        @param key_data: The data from the key
+        @param recv_data: The data received
+        """
+        # What has connected isn't known until the first few bytes have arrived
+        if key_data.handshake is not None:
+            recv_data = self.open_transport(sock, key_data, recv_data)
+            if recv_data is None:
+                return
+
+        if key_data.websocket is None:
+            messages = key_data.recieved_bytes.feed(recv_data)
+        else:
+            messages = self.read_websocket(sock, key_data, recv_data)
+
+        for message in messages:
+            # A message before it may have closed the connection
+            if sock.fileno() == -1:
+                break
+
+            self.handle_data_received(sock, key_data, message)
+
+    def open_transport(self, sock: socket, key_data: object, recv_data: bytes) -> bytes | None:
+        """
+        Works out what has connected from how the connection starts. A browser opens a WebSocket with an HTTP GET,
+        which is answered here to finish the handshake, anything else is a normal client's first frame. The messages
+        are the same either way, only the framing is different.
+
+        @param sock: The socket the data came from
+        @param key_data: The data from the key
+        @param recv_data: The data received
+        @return: The data to read messages from, None if more is needed (or the connection was closed)
+        """
+        # Import here to prevent circular imports
+        from Maxs_Modules.websocket_network import QuizWebSocketBuffer, WEBSOCKET_REQUEST_START, \
+            WEBSOCKET_MAX_REQUEST_SIZE, create_handshake_response
+
+        request = key_data.handshake
+        request += recv_data
+        if len(request) < len(WEBSOCKET_REQUEST_START):
+            return None
+
+        # As a frame header "GET " would be a length far over the max frame size, so it can't be a normal client
+        if not request.startswith(WEBSOCKET_REQUEST_START):
+            key_data.handshake = None
+            return bytes(request)
+
+        end = request.find(b"\r\n\r\n")
+        if end == -1 and len(request) <= WEBSOCKET_MAX_REQUEST_SIZE:
+            return None
+
+        response = None
+        if end != -1 and end + 4 <= WEBSOCKET_MAX_REQUEST_SIZE:
+            response = create_handshake_response(bytes(request[:end + 4]))
+
+        if response is None:
+            debug_message(f"Bad WebSocket request from {key_data.socket_adress}, closing", "network_server")
+            self.close_connection(sock)
+            return None
+
+        # The response is queued before switching, it isn't a WebSocket frame
+        key_data.handshake = None
+        self.queue_frame(sock, response)
+        key_data.websocket = QuizWebSocketBuffer(self.max_frame_size)
+        debug_message(f"Opened a WebSocket to {key_data.socket_adress}", "network_server")
+
+        return bytes(request[end + 4:])
+
+    def read_websocket(self, sock: socket, key_data: object, recv_data: bytes) -> list:
+        """
+        Take the complete messages out of data received on a WebSocket, pings are answered straight away. A close from
+        the browser closes the connection once the messages before it have been handled.
+
+        @param sock: The socket the data came from
+        @param key_data: The data from the key
+        @param recv_data: The data received
+        @return: A list of the complete message payloads
+        @raise QuizLimitExceeded: If a message is over the max size or the browser broke the WebSocket protocol
+        """
+        # Import here to prevent circular imports
+        from Maxs_Modules.websocket_network import WEBSOCKET_OPCODE_TEXT, WEBSOCKET_OPCODE_BINARY, \
+            WEBSOCKET_OPCODE_CLOSE, WEBSOCKET_OPCODE_PING, WEBSOCKET_OPCODE_PONG, create_frame
+
+        messages = []
+
+        for opcode, payload in key_data.websocket.feed(recv_data):
+            if opcode in (WEBSOCKET_OPCODE_TEXT, WEBSOCKET_OPCODE_BINARY):
+                messages.append(payload)
+            elif opcode == WEBSOCKET_OPCODE_PING:
+                self.queue_frame(sock, create_frame(payload, WEBSOCKET_OPCODE_PONG), False)
+            elif opcode == WEBSOCKET_OPCODE_CLOSE:
+                for message in messages:
+                    self.handle_data_received(sock, key_data, message)
+
+                debug_message(f"WebSocket closed by {key_data.socket_adress}", "network_server")
+                self.close_connection(sock)
+                return []
+
+        return messages
+
+    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+        """
+        Handle data received from a client. This needs to be overridden by a subclass to handle for its use case.
+
+        @param sock:  The socket the data came from.
+        @param key_data: The data from the key, contains the address of
+        the client, the data to send and the data to receive
+        @param recv_data: The data of one complete message (the frame header is already removed)
+        """
+
+    def handle_data_send(self, sock: socket, key_data: object, send_data: bytearray) -> None:
+        """
+        Send as much of the queued data to a client as the socket will take without blocking, once the queue is empty
+        the socket is no longer watched for being writable. Must be called on the server thread.
+
+        @param key_data: The data from the key
+        @param sock: The socket to send the data on
+        @param send_data: The queued data (same as key_data.send_bytes)
+        """
+        with self.send_lock:
+            try:
+                sent = sock.send(send_data)
+            except BlockingIOError:
+                return
+
+            del send_data[:sent]
+
+            if not send_data:
+                self.selector.modify(sock, selectors.EVENT_READ, data=key_data)
+
+    def queue_frame(self, sock: socket, frame: bytes, reframe: bool = True) -> None:
+        """
+        Add a framed message to the client's outbound queue, can be called from any thread. If the client already has
+        more than the high-water mark queued then the slow client policy is used instead.
+
+        @param sock: The socket to send the frame on
+        @param frame: The framed message
+        @param reframe: If the client is a browser then swap the frame's header for a WebSocket one, False if it is
+        already a WebSocket frame (Default: True)
+        """
+        try:
+            data = self.selector.get_key(sock).data
+        except (KeyError, ValueError):
+            debug_message(f"Not connected, dropping message to {sock}", "network_server")
+            return
+
+        # A WebSocket already says how long each message is, so the frame's header is swapped for a WebSocket one
+        if data.websocket is not None and reframe:
+            # Import here to prevent circular imports
+            from Maxs_Modules.websocket_network import WEBSOCKET_OPCODE_TEXT, WEBSOCKET_OPCODE_BINARY, \
+                create_frame_header
+
+            payload = frame[FRAME_HEADER_SIZE:]
+            opcode = WEBSOCKET_OPCODE_TEXT if payload[:1] == QuizJsonCodec.magic else WEBSOCKET_OPCODE_BINARY
+            frame = create_frame_header(len(payload), opcode) + payload
+
+        with self.send_lock:
+            if data.closing:
+                return
+
+            # A message bigger than the mark can still be sent on its own, otherwise it would never be sent
+            if data.send_bytes and len(data.send_bytes) + len(frame) > self.high_water_mark:
+                self.handle_slow_client(sock, data)
+                return
+
+            was_empty = not data.send_bytes
+            data.send_bytes += frame
+
+            # The server thread needs to start watching for the socket being writable
+            if was_empty:
+                self.pending_clients.add(sock)
+
+        if was_empty:
+            self.wake_up()
+
+    def handle_slow_client(self, sock: socket, key_data: object) -> None:
+        """
+        Handle a client that isn't reading fast enough to keep its queue under the high-water mark, so that it doesn't
+        hold up the game for everyone else. Depending on the slow client policy the new message is dropped or the client
+        is disconnected. Called with the send lock held.
+
+        @param sock: The socket of the slow client
+        @param key_data: The data from the key
+        """
+        if self.slow_client_policy == "drop":
+            debug_message(f"Client {key_data.socket_adress} is too slow, dropping message", "network_server")
+            self.handle_dropped_message(sock)
+            return
+
+        debug_message(f"Client {key_data.socket_adress} is too slow, disconnecting", "network_server")
+
+        # Closing is done on the server thread
+        key_data.closing = True
+        key_data.send_bytes.clear()
+        self.pending_clients.add(sock)
+        self.wake_up()
+
+    def allow_message(self, sock: socket, message_type: str) -> bool:
+        """
+        Checks a message from a client is within its rate limits (see QuizIngressLimiter), a client over them is
+        disconnected so that it can't hold up the server for everyone else. Call before handling the message.
+
+        @param sock: The socket the message came from
+        @param message_type: The type of the message
+        @return: True if the message should be handled, False if the client has been (or already was) disconnected
+        """
+        data = self.get_connection_data(sock)
+        if data is None:
+            return False
+
+        if data.limiter.allow(message_type, time.monotonic()):
+            return True
+
+        self.reject_client(sock, f"Sending {message_type} too often")
+        return False
+
+    def reject_client(self, sock: socket, reason: str) -> None:
+        """
+        Disconnect a client that has gone over a limit, it is sent the reason as a server_error first
+
+        @param sock: The socket of the client
+        @param reason: Why the client is being disconnected
+        """
+        debug_message(f"Disconnecting {sock}: {reason}", "network_server")
+
+        self.send_message(sock, reason, "server_error")
+        self.flush_connection(sock)
+        self.close_connection(sock)
+
+    def flush_connection(self, sock: socket) -> None:
+        """
+        Send as much of a client's queue as the socket will take straight away, used before closing a connection so
+        that the last message (i.e. an error) isn't lost. Must be called on the server thread.
+
+        @param sock: The socket of the client
+        """
+        data = self.get_connection_data(sock)
+        if data is None or not data.send_bytes:
+            return
+
+        try:
+            self.handle_data_send(sock, data, data.send_bytes)
+        except OSError as e:
+            debug_message(f"Couldn't flush {data.socket_adress}: {e}", "network_server")
+
+    def handle_dropped_message(self, sock: socket) -> None:
+        """
+        Called when a message to a client was dropped because it was too slow. This needs to be overridden by a
+        subclass if it needs to know (i.e. to resend what was missed)
+
+        @param sock: The socket the message was for
+        """
+
+    def handle_message_sent(self, sock: socket, message: QuizMessage) -> None:
+        """
+        Called after a message has been queued for a client. This needs to be overridden by a subclass if it needs to
+        know (i.e. to keep it for replaying)
+
+        @param sock: The socket the message was sent on
+        @param message: The message
+        """
+
+    def wake_up(self) -> None:
+        """
+        Wake the server thread up from waiting in select(), can be called from any thread
+        """
+        try:
+            self.wakeup_sender.send(b"\0")
+
+        # If the buffer is full then the server thread is already going to wake up
+        except (BlockingIOError, OSError):
+            pass
+
+    def handle_wakeup(self) -> None:
+        """
+        Handle being woken up by another thread, starts watching the clients that have had data queued for being
+        writable, closes any clients that were marked as closing and adds any adopted connections. Must be called on
+        the server thread.
+        """
+        try:
+            while self.wakeup_receiver.recv(RECEIVE_CHUNK_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+        with self.send_lock:
+            pending_clients = self.pending_clients
+            self.pending_clients = set()
+            adopted_connections = self.adopted_connections
+            self.adopted_connections = []
+
+        for connection, address, received in adopted_connections:
+            debug_message(f"Adopted connection from {address}", "network_server")
+            data = self.add_connection(connection, address)
+
+            try:
+                self.handle_received_bytes(connection, data, received)
+
+            except QuizLimitExceeded as e:
+                self.reject_client(connection, str(e))
+
+            except Exception as e:
+                self.handle_error(connection, data, e)
+
+        for sock in pending_clients:
+            try:
+                key = self.selector.get_key(sock)
+            except (KeyError, ValueError):
+                continue
+
+            if key.data.closing:
+                self.close_connection(sock)
+            elif key.data.send_bytes:
+                self.selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, data=key.data)
+
+    def get_connection_data(self, sock: socket) -> object:
+        """
+        Gets the data (sometimes called key_data) of a connection
+
+        @param sock: The socket of the connection
+        @return: The data, or None if the socket isn't connected
+        """
+        try:
+            return self.selector.get_key(sock).data
+        except (KeyError, ValueError):
+            return None
+
+    def start_heartbeat(self, sock: socket) -> None:
+        """
+        Start checking the heartbeat of a new connection, see check_heartbeats()
+
+        @param sock: The socket of the connection
+        """
+        if self.heartbeat_timeout is not None:
+            self.heartbeat_wheel.schedule(sock, min(self.heartbeat_interval, self.heartbeat_timeout))
+
+    def check_heartbeats(self) -> None:
+        """
+        Check the connections that have a heartbeat timer due. A connection that has been quiet for the heartbeat
+        interval is sent a ping (which the client answers with a pong), one that has been quiet for the timeout is
+        closed as the client has gone without saying so (i.e. lost its Wi-Fi). Connections that need another sample
+        for their clock estimate are pinged even if they aren't quiet, see QuizClockEstimate. Must be called on the
+        server thread.
+        """
+        now = time.monotonic()
+
+        for sock in self.heartbeat_wheel.advance(now):
+            data = self.get_connection_data(sock)
+            if data is None:
+                continue
+
+            quiet_for = now - data.last_seen
+
+            if quiet_for >= self.heartbeat_timeout:
+                debug_message(f"No heartbeat from {data.socket_adress} for {quiet_for:.1f}s, closing",
+                              "network_server")
+                self.close_connection(sock)
+                continue
+
+            # Only ping connections that are quiet (anything received counts as a heartbeat) or need a clock sample
+            estimate = self.clock_estimates.get(sock)
+            needs_sample = estimate is None or estimate.needs_sample(now, self.clock_sync_interval)
+            if quiet_for >= self.heartbeat_interval or needs_sample:
+                self.send_message(sock, now, "ping")
+
+            # Check again at the next interval or when the timeout is due, whichever is first
+            time_left = self.heartbeat_timeout - quiet_for
+            self.heartbeat_wheel.schedule(sock, min(self.heartbeat_interval, time_left))
+
+    def handle_pong(self, sock: socket, timings: object) -> None:
+        """
+        Add a client's answer to a ping to its clock estimate, see QuizClockEstimate
+
+        @param sock: The socket the pong came from
+        @param timings: The pong, a dict of when the ping was sent, received and replied to (older clients only send
+        back when it was sent, which is ignored)
+        """
+        timings = get_message_numbers(timings, "sent", "received", "replied")
+        if timings is None:
+            debug_message(f"Dropped a malformed pong from {sock}", "network_server")
+            return
+
+        estimate = self.clock_estimates.setdefault(sock, QuizClockEstimate())
+        estimate.add_sample(*timings, time.monotonic())
+
+        if debug_enabled():
+            debug_message(f"Round trip to {sock} is {estimate.rtt * 1000:.1f}ms, clock offset {estimate.offset:.4f}s",
+                          "network_server")
+
+    def get_clock_estimate(self, sock: socket) -> QuizClockEstimate | None:
+        """
+        Gets the clock estimate of a client
+
+        @param sock: The socket of the client
+        @return: The estimate, or None if the client hasn't answered a ping yet
+        """
+        return self.clock_estimates.get(sock)
+
+    def get_clock_diagnostics(self) -> dict:
+        """
+        Gets the round trip time and clock offset of each client, for showing to the host or debugging
+
+        @return: A dict of the rtt and offset (in seconds) and how many samples they are from, by the client's name
+        """
+        diagnostics = {}
+        for sock, name in zip(self.clients.copy(), self.client_names.copy()):
+            estimate = self.get_clock_estimate(sock)
+            if estimate is not None:
+                diagnostics[str(name)] = {"rtt": estimate.rtt, "offset": estimate.offset,
+                                          "samples": len(estimate.samples)}
+
+        return diagnostics
+
+    def send_message(self, sock: socket, message: str, message_type: str) -> None:
+        """
+        Send a message to the socket specified. The message is wrapped in a QuizMessage object and then queued, it is
+        sent by the server thread when the socket is writable so this doesn't block.
+
+        @param message_type: The type of message to send
+        @param sock: The socket to send the message on
+        @param message: The message to send
+        """
+        message = QuizMessage(message, get_ip(), self.host, message_type)
+        frame = self.encode_frame(message, self.get_client_encoding(sock))
+        self.queue_frame(sock, frame)
+        self.record_sent(sock, message, frame)
+        self.handle_message_sent(sock, message)
+
+        # Only build the debug message if it is going to be shown, as the message can be large
+        if debug_enabled():
+            debug_message(f"Queued {message}", "network_server")
+
+    def send_message_to_clients(self, clients: list, message: str, message_type: str) -> None:
+        """
+        Send the same message to many clients. The message is only encoded once for each encoding (codec and
+        compression) the clients are using, and the same bytes are queued for each client that uses it.
+
+        @param clients: The sockets to send the message on
+        @param message: The message to send
+        @param message_type: The type of message to send
+        """
+        message = QuizMessage(message, get_ip(), self.host, message_type)
+        frames = {}
+
+        for sock in clients:
+            encoding = self.get_client_encoding(sock)
+
+            if encoding not in frames:
+                frames[encoding] = self.encode_frame(message, encoding)
+
+            self.queue_frame(sock, frames[encoding])
+            self.record_sent(sock, message, frames[encoding])
+            self.handle_message_sent(sock, message)
+
+        if debug_enabled():
+            debug_message(f"Queued {message} for {len(clients)} clients", "network_server")
+
+    def encode_frame(self, message: QuizMessage, encoding: tuple) -> bytes:
+        """
+        Encode a message into a frame, timing how long it took
+
+        @param message: The message to encode
+        @param encoding: The codec name and compression threshold, see get_client_encoding()
+        @return: The frame
+        """
+        start = time.perf_counter()
+        frame = message.to_frame(*encoding)
+        self.encode_times.add(time.perf_counter() - start)
+
+        return frame
+
+    def decode_message(self, sock: socket, recv_data: bytes) -> QuizMessage:
+        """
+        Decode a message from a client, timing how long it took and counting it in the connection's stats
+
+        @param sock: The socket the message came from
+        @param recv_data: The data of one complete message (the frame header is already removed)
+        @return: The message
+        """
+        start = time.perf_counter()
+        message = QuizMessage(None, None, None, None).from_bytes(recv_data)
+        self.decode_times.add(time.perf_counter() - start)
+
+        data = self.get_connection_data(sock)
+        if data is not None:
+            data.stats.record_in(message.message_type, len(recv_data))
+
+        return message
+
+    def record_sent(self, sock: socket, message: QuizMessage, frame: bytes) -> None:
+        """
+        Count a message sent to a client in the connection's stats
+
+        @param sock: The socket the message was sent on
+        @param message: The message
+        @param frame: The frame the message was sent as
+        """
+        data = self.get_connection_data(sock)
+        if data is not None:
+            data.stats.record_out(message.message_type, len(frame))
+
+    def get_queue_depth(self, sock: socket) -> int:
+        """
+        Gets how much is waiting to be sent to a client
+
+        @param sock: The socket of the client
+        @return: The number of bytes queued
+        """
+        data = self.get_connection_data(sock)
+        return 0 if data is None else len(data.send_bytes)
+
+    def get_stats_sockets(self) -> list:
+        """
+        Gets the connections to show the stats of, see get_stats()
+
+        @return: The sockets
+        """
+        return self.clients.copy()
+
+    def get_stats(self) -> dict:
+        """
+        Gets the stats of the server and each of its connections, for the debug CLI or dumping to file
+
+        @return: A dict of the server's name, port, encode and decode times and the stats of each connection by the
+        client's address, see QuizConnectionStats.to_dict()
+        """
+        now = time.monotonic()
+        connections = {}
+
+        for sock in self.get_stats_sockets():
+            data = self.get_connection_data(sock)
+            if data is not None:
+                connections[str(data.socket_adress)] = data.stats.to_dict(now, self.get_queue_depth(sock))
+
+        return {"name": type(self).__name__, "port": self.port, "encode_times": self.encode_times.to_dict(),
+                "decode_times": self.decode_times.to_dict(), "connections": connections}
+
+    def get_client_encoding(self, sock: socket) -> tuple:
+        """
+        Gets how messages to a client should be encoded, clients that haven't negotiated anything get JSON without
+        compression
+
+        @param sock: The socket of the client
+        @return: The codec name and the compression threshold (None if the client can't decompress)
+        """
+        return self.client_codecs.get(sock, "json"), self.client_compression.get(sock)
+
+    def set_client_codec(self, sock: socket, offered: list | None) -> None:
+        """
+        Picks the codec to use when sending to a client from the ones it offered when joining. The first codec in
+        MESSAGE_CODECS that the client also has is used, the client is told which one with a set_codec message (sent
+        in JSON so that the client can read it either way). Clients that didn't offer any codecs are left on JSON.
+
+        @param sock: The socket of the client
+        @param offered: The names of the codecs the client can decode, or None if it didn't send any
+        """
+        if not offered:
+            return
+
+        for codec in MESSAGE_CODECS:
+            if codec in offered:
+                self.send_message(sock, codec, "set_codec")
+                self.client_codecs[sock] = codec
+                debug_message(f"Using the {codec} codec for {sock}", "network_server")
+                return
+
+    def set_client_compression(self, sock: socket, offered: bool | None) -> None:
+        """
+        Turns on compression for a client if it said it can decompress frames when joining. The client is sent the
+        threshold with a set_compression message so that it can compress what it sends back as well.
+
+        @param sock: The socket of the client
+        @param offered: True if the client can decompress frames, None if it didn't say
+        """
+        if not offered or self.compression_threshold is None:
+            return
+
+        # Browsers are never sent compressed frames, as the frame header (with the compressed flag) isn't sent to them
+        data = self.get_connection_data(sock)
+        if data is not None and data.websocket is not None:
+            return
+
+        self.client_compression[sock] = self.compression_threshold
+        self.send_message(sock, self.compression_threshold, "set_compression")
+        debug_message(f"Compressing messages over {self.compression_threshold} bytes for {sock}", "network_server")
+
+    def send_message_to_all(self, message: str, message_type: str) -> None:
+        """
+        Send a message to all clients, it is only encoded once, see send_message_to_clients()
+
+        @param message_type: The type of message to send
+        @param message: The message to send
+        """
+        self.send_message_to_clients(self.clients.copy(), message, message_type)
+
+    def stop(self) -> None:
+        """
+        Stop the server thread, it kills the server once it has finished with the connections that are ready. Unlike
+        kill() this can be called from any thread, including the server thread.
+        """
+        self.stopped = True
+        self.wake_up()
+
+    def kill(self) -> None:
+        """
+        Kill the server, closing all connections in the clients list and then finally closing the server. Does nothing
+        if the server has already been killed.
+        """
+        if self.server.fileno() == -1:
+            return
+
+        # Close the clients (loop over a copy as closing a connection removes it from the list)
+        for client in self.clients.copy():
+            self.close_connection(client)
+
+        # Close the server
+        self.close_connection(self.server)
+
+        # Connections handed over too late to be added are closed as well, any after this are closed by
+        # adopt_connection()
+        with self.send_lock:
+            for connection, _, _ in self.adopted_connections:
+                connection.close()
+            self.adopted_connections = []
+        self.selector.unregister(self.wakeup_receiver)
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
+        network_endpoints.discard(self)
+
+    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+        """
+        Handle an error from the server. This is called when an error occurs in the server. The connection is closed
+        on the socket and the error is printed. If the error is a user disconnecting then it is printed as a debug
+        message, otherwise it is printed as an error this is because disconnection shouldn't be displayed.
+
+        @param sock: The socket the error occurred on
+        @param key_data: The data from the key
+        @param error_response: The string representation of the error
+        """
+        self.close_connection(sock)
+
+        # Check if this is caused by a user disconnecting
+        if "An existing connection was forcibly closed by the remote host" in str(error_response):
+            debug_message(f"Client disconnected: {key_data.socket_adress}", "network_server")
+        else:
+            error(f"Error in server: {error_response}")
+
+
+class QuizClient:
+    """
+    A class to represent a client for the quiz game
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the client and connect to the server. The selector set and then is used to listen for data from
+        the server
+
+        @param host: The host ip to connect to
+        @param port: The port to listen on
+        """
+        self.host = host
+        self.port = port
+
+        self.selector = selectors.DefaultSelector()
+
+        self.client = connect_to_server(self.host, self.port)
+        self.recieved_bytes = QuizMessageBuffer()
+
+        # Messages are sent in JSON without compression until the server says otherwise
+        self.codec = "json"
+        self.compress_threshold = None
+
+        # The room to join, only used when the server is a QuizLobbyServer
+        self.room = None
+
+        # The server pings quiet clients, so if nothing has been received for the timeout the server has gone
+        self.heartbeat_timeout = HEARTBEAT_TIMEOUT
+        self.last_received = time.monotonic()
+
+        # Given by the server once joined, used to rejoin where this client left off if the connection is lost
+        self.session = None
+        self.received_count = 0
+        self.reconnect_attempts = SESSION_RECONNECT_ATTEMPTS
+        self.reconnect_delay = SESSION_RECONNECT_DELAY
+
+        # The counters for the connection to the server, kept across reconnects
+        self.stats = QuizConnectionStats()
+        self.encode_times = QuizTimeHistogram()
+        self.decode_times = QuizTimeHistogram()
+
+        self.selector.register(self.client, selectors.EVENT_READ, data=None)
+        network_endpoints.add(self)
+
+    def run(self) -> None:
+        """
+        Run the client, listening for data from the server refreshing every second. If there is data then it is read
+        at 4096 bytes per chunk and fed into the QuizMessageBuffer, each complete message is then sent to the
+        handle_data_received function. If there is no data then the connection has been closed and the client is closed.
+        If nothing has been received for the heartbeat timeout then the server is treated as gone.
+        """
+        try:
+
+            while True:
+
+                events = self.selector.select(timeout=1)
+
+                for key, mask in events:
+
+                    try:
+                        sock = key.fileobj
+                        data = key.data
+
+                        # If the socket has its read bit set
+                        if mask & selectors.EVENT_READ:
+
+                            recv_data = sock.recv(RECEIVE_CHUNK_SIZE)
+
+                            # If there is no data then the connection has been closed
+                            if not recv_data:
+                                raise ConnectionError("Server Closed")
+
+                            self.last_received = time.monotonic()
+                            for message in self.recieved_bytes.feed(recv_data):
+                                self.handle_data_received(sock, data, message)
+
+                        # If the socket has its write bit set
+                        if mask & selectors.EVENT_WRITE:
+
+                            # If there is data to send
+                            if data.send_bytes:
+                                self.handle_request(sock, data, data.send_bytes)
+
+                    except Exception as e:
+                        self.handle_error(sock, data, e)
+
+                # Check the server is still there, unless the connection has already been closed
+                if self.heartbeat_timeout is not None and self.client.fileno() != -1:
+                    if time.monotonic() - self.last_received > self.heartbeat_timeout:
+                        self.handle_error(self.client, None, TimeoutError("Server timed out"))
+
+        # OSErrors thrown here are caused when the socket is being deleted, so can ignore them
+        except OSError:
+            pass
+
+    def close_connection(self, sock: socket) -> None:
+        """
+        Close a connection on a socket and unregisters it from the selector, mostly used to close the connection on 
+        the server
+
+        @param sock: The socket to close the connection on.
+        """
+        # Unregister the socket from the selector
+        self.selector.unregister(sock)
+
+        # Close the socket
+        sock.close()
+
+    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+        """
+        Handle data received from the server. This is called when data is received from the server. Functionality needs
+        to be written by the subclass
+
+        @param sock: The socket the data was received on
+        @param key_data: The data from the key
+        @param recv_data: The data of one complete message from the server (the frame header is already removed)
+        """
+        pass
+
+    def handle_request(self, sock: socket, key_data: object, send_data: bytes) -> None:
+        """
+        Handle a request to send data to the server. This is called when data is sent to the server. Functionality needs
+        to be written by the subclass
+
+        @param sock: The socket to send the data on
+        @param key_data: The data from the key
+        @param send_data: The data to send to the server, same as key_data.send_bytes but kept for convenience
+        """
+        pass
+
+    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+        """
+        Handle an error from the client. This is called when an error occurs in the client. The connection is closed
+        and then the exception is printed using the error function
+
+        @param sock: The socket the error occurred on
+        @param key_data: The data from the selector key
+        @param error_response: The string representation of the error
+        """
+        self.close_connection(sock)
+        error(f"Error in client: {error_response}")
+
+    def send_message(self, sock: object, message: str, message_type: str) -> None:
+        """
+        Send a message to the server enclosed in a QuizMessage object
+
+        @param message_type: The type of message to send
+        @param sock: The socket to send the message on
+        @param message: The message to send
+        """
+        message = self.create_message(message, message_type)
+
+        if debug_enabled():
+            debug_message(f"Sending {message}", "network_client")
+
+        try:
+            sock.sendall(self.encode_frame(message))
+
+        # The connection has been lost, the run thread handles that (and if it rejoins the server is sent the user)
+        except OSError:
+            debug_message(f"Not connected, dropping {message_type}", "network_client")
+
+    def create_message(self, message: str, message_type: str) -> QuizMessage:
+        """
+        Wrap a message to the server in a QuizMessage object. When joining, the codecs this client can decode are sent
+        with the message so that the server can pick one, that this client can decompress frames and the room to join,
+        see QuizServer.set_client_codec(), QuizServer.set_client_compression() and QuizLobbyServer
+
+        @param message: The message to send
+        @param message_type: The type of message to send
+        @return: The QuizMessage
+        """
+        message = QuizMessage(message, get_ip(), self.host, message_type)
+
+        if message_type in ("client_join", "spectator_join"):
+            message.codecs = list(MESSAGE_CODECS)
+            message.compression = True
+            message.room = self.room
+
+            # Rejoining, so the server only needs to send what hasn't been received
+            if message_type == "client_join" and self.session is not None:
+                message.session = self.session
+                message.sequence = self.received_count
+
+        return message
+
+    def encode_frame(self, message: QuizMessage) -> bytes:
+        """
+        Encode a message to the server into a frame, timing how long it took and counting it in the stats
+
+        @param message: The message to encode
+        @return: The frame
+        """
+        start = time.perf_counter()
+        frame = message.to_frame(self.codec, self.compress_threshold)
+        self.encode_times.add(time.perf_counter() - start)
+        self.stats.record_out(message.message_type, len(frame))
+
+        return frame
+
+    def decode_message(self, sock: socket, recv_data: bytes) -> QuizMessage:
+        """
+        Decode a message from the server, timing how long it took and counting it in the stats
+
+        @param sock: The socket the message came from
+        @param recv_data: The data of one complete message (the frame header is already removed)
+        @return: The message
+        """
+        start = time.perf_counter()
+        message = QuizMessage(None, None, None, None).from_bytes(recv_data)
+        self.decode_times.add(time.perf_counter() - start)
+        self.stats.record_in(message.message_type, len(recv_data))
+
+        return message
+
+    def get_queue_depth(self) -> int:
+        """
+        Gets how much is waiting to be sent to the server, nothing is queued as sending blocks until it is all sent
+
+        @return: The number of bytes queued
+        """
+        return 0
+
+    def get_stats(self) -> dict:
+        """
+        Gets the stats of the connection to the server, in the same form as QuizServer.get_stats()
+
+        @return: A dict of the client's name, the port, the encode and decode times and the stats of the connection
+        """
+        connection = self.stats.to_dict(time.monotonic(), self.get_queue_depth())
+
+        return {"name": type(self).__name__, "port": self.port, "encode_times": self.encode_times.to_dict(),
+                "decode_times": self.decode_times.to_dict(), "connections": {str((self.host, self.port)): connection}}
+
+    def send_pong(self, sock: socket, sent: float) -> None:
+        """
+        Answer a ping from the server with when it arrived and when it was answered, on this client's clock, so that
+        the server can estimate the round trip time and the offset between the clocks, see QuizClockEstimate
+
+        @param sock: The socket the ping came from
+        @param sent: When the server sent the ping, on its clock
+        """
+        self.send_message(sock, {"sent": sent, "received": self.last_received, "replied": time.monotonic()}, "pong")
+
+    def reconnect(self) -> bool:
+        """
+        Connect to the server again after the connection has been lost, trying reconnect_attempts times with
+        reconnect_delay seconds between each. Once connected handle_reconnect() is called to rejoin.
+
+        @return: True if connected, False if every attempt failed
+        """
+        for attempt in range(self.reconnect_attempts):
+            try:
+                self.client = connect_to_server(self.host, self.port)
+                break
+            except OSError as e:
+                debug_message(f"Reconnect attempt {attempt + 1} failed: {e}", "network_client")
+                time.sleep(self.reconnect_delay)
+        else:
+            return False
+
+        # Start again as if this was a new client, the server negotiates everything again when rejoining
+        self.recieved_bytes = QuizMessageBuffer()
+        self.last_received = time.monotonic()
+        self.codec = "json"
+        self.compress_threshold = None
+
+        self.selector.register(self.client, selectors.EVENT_READ, data=None)
+        self.handle_reconnect()
+        return True
+
+    def handle_reconnect(self) -> None:
+        """
+        Called once reconnected to the server. This needs to be overridden by a subclass that can rejoin (i.e. by
+        sending a client_join with the session)
+        """
+
+
+class QuizGameServer(QuizServer):
+    game = None
+    running = False
+    error = None
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the server and the state tracker used to only send the changes when syncing the game
+
+        @param host: The host to listen on
+        @param port: The port to listen on
+        """
+        super().__init__(host, port)
+
+        self.state = QuizStateTracker()
+        self.client_revisions = {}
+
+        # Signalled whenever a player syncs or leaves, so wait_for_answers() can check if everyone has answered
+        self.answer_condition = threading.Condition()
+
+        # The sessions by token and by the socket they are connected on, see QuizSession
+        self.sessions = {}
+        self.client_sessions = {}
+        self.session_lock = threading.RLock()
+
+        # When each question was started (by its index) and the answer times worked out from the clients' clocks (by
+        # the player's name and then the question's index), see stamp_answer()
+        self.question_starts = {}
+        self.answer_times = {}
+
+        # Spectators aren't in the clients, so aren't synced or waited for, see add_spectator()
+        self.spectators = []
+        self.max_spectators = MAX_SPECTATORS
+        self.spectator_question = 0
+        self.spectator_feed = QuizSpectatorFeed(self)
+
+    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+        """
+        Handle data received from a client. This function can handle the client_join message type and the sync_player
+        message. Both of these actions involve updating the game's users array with the new user data if the request
+        was handled without error. Upon handling the messages the server will send an error response to the socket if
+        the game is full or has already started or if the username is already taken.  If the game has already started
+        then the server will only allow the client to join if they have a name that is already in the game's users
+        but not connected, which is treated as a reconnect. A client that joins with a session token is rejoining
+        after losing its connection, so is only sent what it missed, see resume_session(). Spectators join with
+        spectator_join instead, see add_spectator().
+
+        @param sock: The socket to handle the data from
+        @param key_data: The data from the selector key
+        @param recv_data: The data received from the client (same as key_data.receive_bytes but kept for convenience)
+        """
+
+        # Convert the data to a message
+        message = self.decode_message(sock, recv_data)
+
+        # Don't do anything with a message from a client that is sending too much
+        if not self.allow_message(sock, message.message_type):
+            return
+
+        # Handle the message
+        match message.message_type:
+            case "client_join":
+                # The player is added to the game as sent, so anything that isn't a player only closes this client
+                if not is_player_data(message.message):
+                    self.reject_client(sock, "Malformed client_join")
+                    return
+
+                # A player that lost their connection is coming back, even if the game has started
+                session = self.sessions.get(message.session)
+                if session is not None and self.resume_session(sock, session, message):
+                    return
+
+                # Check if the game has started
+                if self.game.game_started:
+                    self.send_message(sock, "Game has already started", "server_error")
+                    return
+
+                # Check if the game is full
+                if len(self.game.users) >= self.game.max_players:
+                    self.send_message(sock, "Game is full", "server_error")
+                    return
+
+                # Convert the user to an object
+                self.game.users.append(message.message)
+                temp_index = len(self.game.users) - 1
+                self.game.convert_to_object(self.game.users, self.game.user_reference)
+
+                is_new_player = True
+
+                # Check if the username is taken
+                for user_index in range(len(self.game.users) - 1):
+
+                    # If the username is taken
+                    user = self.game.users[user_index]
+                    if user.name == self.game.users[temp_index].name:
+                        # If the user is taken and connected then the name is taken so send an error
+                        if user.is_connected:
+                            self.send_message(sock, "Username is taken", "server_error")
+                            # Remove the user from the list
+                            self.game.users.pop(temp_index)
+                            return
+
+                        debug_message(f"Removing index {temp_index}", "network_server")
+
+                        # Remove the user from the list as will use the old one
+                        self.game.users.pop(temp_index)
+                        temp_index = user_index
+
+                        # This means the server is continuing a game so the user is sent their progress once joined
+                        is_new_player = False
+
+                        break
+
+                # If this server is continuing a game then don't allow new players to join
+                if is_new_player and self.game.game_loaded:
+                    self.send_message(sock,
+                                      "Server is continuing game, must rejoin using same name. New players not allowed",
+                                      "server_error")
+                    # Remove the user from the list
+                    self.game.users.pop(temp_index)
+                    return
+
+                self.game.convert_to_object(self.game.users, self.game.user_reference)
+
+                # Set the sockets name to the user's name
+                self.client_names[self.clients.index(sock)] = self.game.users[temp_index].name
+
+                # User is now connected
+                self.game.users[temp_index].is_connected = True
+                debug_message(f"Player {self.game.users[temp_index].name} has joined the game", "network_server")
+
+                # Now the player has joined, switch to the best codec the client can decode and compression
+                self.set_client_codec(sock, message.codecs)
+                self.set_client_compression(sock, message.compression)
+                self.start_session(sock, self.game.users[temp_index].name)
+
+                # Send a returning player their progress, without syncing the other players
+                if not is_new_player:
+                    self.sync_client(sock)
+
+                # Start the clock estimate now rather than at the first heartbeat, so it is ready for the first question
+                self.send_message(sock, time.monotonic(), "ping")
+
+            case "spectator_join":
+                self.add_spectator(sock, message)
+
+            case "sync_player":
+                if not is_player_data(message.message):
+                    self.reject_client(sock, "Malformed sync_player")
+                    return
+
+                index = self.update_user(message.message)
+                debug_message(f"Player: {self.game.users[index].name} has synced", "network_server")
+
+            case "sync_ack":
+                acknowledged = get_message_numbers(message.message, "revision")
+                if acknowledged is None:
+                    debug_message(f"Dropped a malformed sync_ack from {sock}", "network_server")
+                    return
+
+                # The client has applied everything up to this revision, so the next sync only needs what is newer
+                revision = int(acknowledged[0])
+                self.client_revisions[sock] = revision
+
+                session = self.client_sessions.get(sock)
+                if session is not None:
+                    session.revision = revision
+
+            case "pong":
+                # Receiving it is what counts as the heartbeat, the timings are used to estimate the clock offset
+                self.handle_pong(sock, message.message)
+
+            case "answer_stamp":
+                self.stamp_answer(sock, message.message)
+
+            case _:
+                debug_message(f"Unhandled message: {message.message}", "network_server")
+
+    def update_user(self, user: dict) -> int:
+        """
+        Replace a player with the data their client sent
+
+        @param user: The player's save data
+        @return: The index of the player in the game's users (0 if they weren't found)
+        """
+        index = 0
+
+        # Update the users while holding the condition so the game thread doesn't see them half converted
+        with self.answer_condition:
+
+            # The times the server worked out are fairer than the ones measured by the player's client
+            times = user.get("times")
+            if isinstance(times, list):
+                for question_index, answer_time in self.answer_times.get(user["name"], {}).items():
+                    if question_index < len(times):
+                        times[question_index] = answer_time
+
+            # Find the user to update
+            for user_index in range(len(self.game.users)):
+                if self.game.users[user_index].name == user["name"]:
+                    self.game.users[user_index] = user
+                    self.game.users[user_index]["is_connected"] = True
+                    index = user_index
+                    break
+
+            # Convert the users to objects
+            self.game.convert_to_object(self.game.users, self.game.user_reference)
+
+            # This player may have been the last one to answer
+            self.answer_condition.notify_all()
+
+        self.spectator_feed.publish()
+        return index
+
+    def stamp_answer(self, sock: socket, stamp: dict) -> None:
+        """
+        Work out how long a player took to answer from the server's point of view. The client sends when it showed the
+        question and when it was answered on its own clock, which is converted to the server's clock with the clock
+        estimate. The time is then from when the server started the question, without the half of the round trip it
+        took to reach the player (so a slow connection isn't counted against them). The time is kept and used in
+        place of the one the client syncs, see update_user().
+
+        @param sock: The socket of the player
+        @param stamp: The question's index and when it was shown and answered (client clock)
+        """
+        received = time.monotonic()
+        if sock not in self.clients:
+            return
+
+        stamp = get_message_numbers(stamp, "question", "shown", "answered")
+        if stamp is None:
+            debug_message(f"Dropped a malformed answer_stamp from {sock}", "network_server")
+            return
+
+        name = self.client_names[self.clients.index(sock)]
+        question_index, shown, answered = int(stamp[0]), stamp[1], stamp[2]
+
+        # Without an estimate the client's own time is used, it is still on a monotonic clock
+        answer_time = answered - shown
+
+        started = self.question_starts.get(question_index)
+        estimate = self.get_clock_estimate(sock)
+        if started is not None and estimate is not None:
+            # It can't have been answered before the question was sent or after the answer arrived
+            answered_at = min(max(estimate.to_server_time(answered), started), received)
+            answer_time = max(0.0, answered_at - started - estimate.rtt / 2)
+
+        debug_message(f"Player {name} answered question {question_index} in {answer_time:.3f}s (client measured "
+                      f"{answered - shown:.3f}s)", "network_server")
+
+        with self.answer_condition:
+            self.answer_times.setdefault(name, {})[question_index] = answer_time
+
+    def add_spectator(self, sock: socket, message: QuizMessage) -> None:
+        """
+        Add a spectator, they are sent the events in SPECTATOR_EVENT_TYPES instead of the syncs. The socket is taken out
+        of the clients so that nothing sent to the players is sent to it and the game doesn't wait for it.
+
+        @param sock: The socket of the spectator
+        @param message: The spectator_join message
+        """
+        # A repeated spectator_join, the socket has already been taken out of the clients
+        if sock not in self.clients:
+            debug_message("Ignored a spectator_join from a client that is already spectating", "network_server")
+            return
+
+        if len(self.spectators) >= self.max_spectators:
+            self.send_message(sock, "Too many spectators", "server_error")
+            return
+
+        client_index = self.clients.index(sock)
+        self.clients.pop(client_index)
+        self.client_names.pop(client_index)
+        self.spectators.append(sock)
+
+        debug_message(f"Spectator joined, {len(self.spectators)} watching", "network_server")
+
+        self.set_client_codec(sock, message.codecs)
+        self.set_client_compression(sock, message.compression)
+
+        # Catch up with everything, after this the feed only sends what changes
+        for message_type, event in get_changed_events(self.get_spectator_events(), {}):
+            self.send_message(sock, event, message_type)
+
+        self.spectator_feed.start()
+
+    def get_stats_sockets(self) -> list:
+        """
+        Gets the connections to show the stats of, the spectators are shown as well as the players
+
+        @return: The sockets
+        """
+        return self.clients.copy() + self.spectators.copy()
+
+    def get_spectator_events(self) -> dict:
+        """
+        Gets what the spectators are shown of the game: the question being answered, how many of the players have
+        answered it and the scores
+
+        @return: The value of each event by its message type
+        """
+        # This is run on the feed's thread, so the players can be part way through being converted to or from dicts
+        # by the game thread. Read them either way rather than converting them here.
+        users = [user if isinstance(user, dict) else vars(user) for user in self.game.users.copy()]
+        bots = [bot if isinstance(bot, dict) else vars(bot) for bot in (self.game.bots or []).copy()]
+
+        question_index = self.spectator_question
+        questions = self.game.questions or []
+        finished = question_index >= len(questions)
+
+        question_text = None
+        if not finished:
+            question = questions[question_index]
+            question_text = question.get("question") if isinstance(question, dict) else question.question
+
+        question = {"started": bool(self.game.game_started), "finished": finished, "number": question_index + 1,
+                    "total": len(questions), "question": question_text}
+
+        # A player has answered once their answer to the question has been synced
+        answers = {"answered": sum(len(user.get("answers") or []) > question_index for user in users),
+                   "players": len(users)}
+
+        scores = sorted(([player.get("name"), player.get("points") or 0] for player in users + bots),
+                        key=lambda score: score[1], reverse=True)
+
+        return {"spectate_question": question, "spectate_answers": answers, "spectate_scores": scores}
+
+    def start_session(self, sock: socket, name: str) -> None:
+        """
+        Give a player that has just joined a new session, replacing any they had before
+
+        @param sock: The socket of the player
+        @param name: The name of the player
+        """
+        session = QuizSession(name)
+
+        with self.session_lock:
+            for token, old_session in list(self.sessions.items()):
+                if old_session.name == name:
+                    del self.sessions[token]
+
+            self.sessions[session.token] = session
+            self.client_sessions[sock] = session
+
+        self.send_message(sock, {"session": session.token, "sequence": 0}, "set_session")
+
+    def resume_session(self, sock: socket, session: QuizSession, message: QuizMessage) -> bool:
+        """
+        Rejoin a player with their session. They are sent the messages they missed, or everything if some of those
+        are no longer kept, without the other players being sent anything. The player's own data is taken from the
+        client_join as it may have changed while they were disconnected (i.e. they answered).
+
+        @param sock: The socket the player has rejoined on
+        @param session: The player's session
+        @param message: The client_join message
+        @return: True if the player rejoined, False if they are no longer in the game so need to join as new
+        """
+        # If the old connection hasn't been noticed as lost yet then close it, this one replaces it
+        for old_sock, old_session in list(self.client_sessions.items()):
+            if old_session is session and old_sock is not sock:
+                self.close_connection(old_sock)
+
+        # Players are removed when they leave before the game starts
+        if session.name not in [user.name for user in self.game.users]:
+            return False
+
+        self.client_names[self.clients.index(sock)] = session.name
+        self.client_revisions[sock] = session.revision
+        self.update_user(message.message)
+
+        self.set_client_codec(sock, message.codecs)
+        self.set_client_compression(sock, message.compression)
+
+        with self.session_lock:
+            received = message.sequence or 0
+            missed = session.missed(received)
+
+            if missed is None:
+                # Too much was missed, so start the count again and send the whole game
+                debug_message(f"Player {session.name} has rejoined, sending everything", "network_server")
+                self.send_message(sock, {"session": session.token, "sequence": session.sent}, "set_session")
+                self.client_sessions[sock] = session
+                self.client_revisions.pop(sock, None)
+                self.send_message(sock, self.state.snapshot(), "sync_game")
+                return True
+
+            # Replay before the socket is given the session, so the messages aren't recorded twice
+            debug_message(f"Player {session.name} has rejoined, replaying {len(missed)} messages", "network_server")
+            self.send_message(sock, {"session": session.token, "sequence": received}, "set_session")
+            for missed_message in missed:
+                self.send_message(sock, missed_message.message, missed_message.message_type)
+
+            self.client_sessions[sock] = session
+
+        return True
+
+    def get_disconnected_sessions(self) -> list:
+        """
+        Gets the sessions of the players that have lost their connection and haven't rejoined yet, must be called with
+        the session lock held
+
+        @return: The sessions
+        """
+        connected = set(self.client_sessions.values())
+        return [session for session in self.sessions.values() if session not in connected]
+
+    def send_message_to_all(self, message: str, message_type: str) -> None:
+        """
+        Send a message to all clients, players that have lost their connection are sent it when they rejoin
+
+        @param message_type: The type of message to send
+        @param message: The message to send
+        """
+        super().send_message_to_all(message, message_type)
+
+        with self.session_lock:
+            for session in self.get_disconnected_sessions():
+                session.record(QuizMessage(message, get_ip(), self.host, message_type))
+
+        # The players are moving on to the next question (which the host has already moved to), or the game has ended
+        if message_type == "move_on":
+            self.question_starts[self.game.current_question] = time.monotonic()
+            self.spectator_question = self.game.current_question
+            self.spectator_feed.publish()
+
+    def handle_message_sent(self, sock: socket, message: QuizMessage) -> None:
+        """
+        Keep the message in the player's session, so it can be replayed if they rejoin
+
+        @param sock: The socket the message was sent on
+        @param message: The message
+        """
+        with self.session_lock:
+            session = self.client_sessions.get(sock)
+            if session is not None:
+                session.record(message)
+
+    def handle_dropped_message(self, sock: socket) -> None:
+        """
+        A sync to this client may have been dropped, so forget its revision and send it everything on the next sync
+
+        @param sock: The socket the message was for
+        """
+        self.client_revisions.pop(sock, None)
+
+    def sync_game(self) -> None:
+        """
+        Sync the game data to all clients. Only the values that have changed since each client last acknowledged a
+        sync are sent, so a client that has just joined gets the whole game (30kb with 50 questions, 50 players) while
+        the others only get what has changed. It is best practice to save any variables that need to be saved before
+        handling this.
+        """
+        # Ensure users have been converted, as timings can be off when networked
+        self.game.convert_to_object(self.game.users, self.game.user_reference)
+
+        self.sync_state("sync_game")
+
+    def sync_players(self) -> None:
+        """
+        Sync the player data to all clients, only the values of the players that have changed are sent. It is best
+        practice to save the position of the local player before handling this.
+        """
+        # Ensure users have been converted, as timings can be off when networked
+        self.game.convert_to_object(self.game.users, self.game.user_reference)
+
+        self.sync_state("sync_players", ["users"])
+
+    def sync_bots(self) -> None:
+        """
+        Sync the bot data to all clients, only the values of the bots that have changed are sent.
+        """
+        # Ensure bots have been converted, as timings can be off when networked
+        self.game.convert_to_object(self.game.bots, self.game.bot_reference)
+
+        self.sync_state("sync_bots", ["bots"])
+
+    def update_state(self, sections: list = None) -> tuple:
+        """
+        Updates the state tracker with the game data, without sending anything
+
+        @param sections: The parts of the game data that could have changed (i.e. ["users"]), if None then all of the
+        game data is checked (Default: None)
+        @return: The sections that were checked and the new revision
+        """
+        # Get the game data
+        self.game.prepare_save_data()
+
+        # The previous save data is stored in the save data, so don't sync it
+        if sections is None:
+            sections = [key for key in self.game.save_data.keys() if key != "save_data"]
+
+        revision = self.state.update(self.game.save_data, sections)
+
+        # Convert everything back
+        self.game.convert_all_from_save_data()
+
+        return sections, revision
+
+    def sync_client(self, sock: socket) -> None:
+        """
+        Sync the whole game to one client (i.e. a player rejoining by name), the other clients aren't sent anything and
+        get any changes with the next sync
+
+        @param sock: The socket of the client
+        """
+        # Ensure users have been converted, as timings can be off when networked
+        self.game.convert_to_object(self.game.users, self.game.user_reference)
+        self.update_state()
+
+        self.client_revisions.pop(sock, None)
+        self.send_message(sock, self.state.snapshot(), "sync_game")
+
+    def sync_state(self, message_type: str, sections: list = None) -> None:
+        """
+        Updates the state tracker with the game data and then sends each client a patch of what has changed since the
+        revision it last acknowledged. Clients that are on the same revision are sent the same patch.
+
+        @param message_type: The type of message to send the patch as
+        @param sections: The parts of the game data that could have changed (i.e. ["users"]), if None then all of the
+        game data is checked (Default: None)
+        """
+        sections, revision = self.update_state(sections)
+
+        # Send the patches. Every change is sent to all the clients as soon as it is recorded, so a client that has
+        # synced before only needs the sections that were checked. A client that hasn't synced gets everything. The
+        # clients on the same revision are sent the same patch, so it is only encoded once for them.
+        clients_since = {}
+        for client in self.clients.copy():
+            clients_since.setdefault(self.client_revisions.get(client, 0), []).append(client)
+
+        patches = {}
+        for since, clients in clients_since.items():
+            patches[since] = self.state.patch(since, sections) if since else self.state.snapshot()
+
+            debug_message(f"Syncing revision {since} to {revision} for {len(clients)} clients", "network_server")
+            self.send_message_to_clients(clients, patches[since], message_type)
+
+        # Keep the patches for the players that have lost their connection, they are sent them when they rejoin
+        with self.session_lock:
+            for session in self.get_disconnected_sessions():
+                since = session.revision
+
+                if since not in patches:
+                    patches[since] = self.state.patch(since, sections) if since else self.state.snapshot()
+
+                session.record(QuizMessage(patches[since], get_ip(), self.host, message_type))
+                session.revision = revision
+
+        self.spectator_feed.publish()
+
+    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+        """
+        Handle an error from a client and then close the client. Uses the super class to handle the error and then sets
+        the running variable to false
+
+        @param sock: The socket that the error occurred on
+        @param key_data: The key data for the socket
+        @param error_response: The exception that was raised that caused the error
+        """
+        super().handle_error(sock, key_data, error_response)
+        self.running = False
+
+    def close_connection(self, sock: socket) -> None:
+        """
+        Close a connection from a client by removing it from the selector and the list of clients. Before the game has
+        started the user is also removed from the games list of players, after it has started they are kept (so their
+        score is still shown) but marked as not connected.
+
+        @param sock: The socket to close the connection on.
+        """
+        # Spectators aren't players, so there is nothing else to do
+        if sock in self.spectators:
+            self.spectators.remove(sock)
+            super().close_connection(sock)
+            return
+
+        # Get the name of the player before the super class removes it
+        client_name = None
+        if sock in self.clients:
+            client_name = self.client_names[self.clients.index(sock)]
+
+        # Close the connection and remove the socket from the list of clients, the session is kept for rejoining
+        super().close_connection(sock)
+        self.client_revisions.pop(sock, None)
+
+        with self.session_lock:
+            session = self.client_sessions.pop(sock, None)
+
+            # Players are only kept once the game has started, before that they join again as new
+            if session is not None and not self.game.game_started:
+                self.sessions.pop(session.token, None)
+
+        # Remove the player from the game, the game no longer needs to wait for them to answer
+        with self.answer_condition:
+            for user_index in range(len(self.game.users)):
+                if self.game.users[user_index].name == client_name:
+                    if self.game.game_started:
+                        self.game.users[user_index].is_connected = False
+                    else:
+                        self.game.users.pop(user_index)
+                    break
+
+            self.answer_condition.notify_all()
+
+        self.spectator_feed.publish()
+
+    def kill(self) -> None:
+        """
+        Kill the server, closing the spectators and then the players and the server, see QuizServer.kill()
+        """
+        self.spectator_feed.stop()
+
+        for spectator in self.spectators.copy():
+            self.close_connection(spectator)
+
+        super().kill()
+
+    def get_unanswered_users(self) -> list:
+        """
+        Gets the players that haven't answered the current question yet, players that have disconnected are skipped
+        as they won't be answering
+
+        @return: The names of the players that haven't answered
+        """
+        # is_connected isn't kept when the users are synced, so use the clients that are still here (and the host,
+        # who is always the first user)
+        connected = set(self.client_names)
+        if self.game.users:
+            connected.add(self.game.users[0].name)
+
+        return [user.name for user in self.game.users if user.has_answered is False and user.name in connected]
+
+    def wait_for_answers(self, deadline: float = None, waiting: list = None) -> list:
+        """
+        Wait until every player has answered the current question, this is woken up as soon as each player syncs so
+        there is no delay after the last answer. Also returns early if the players still to answer are different to
+        the ones in waiting (so the caller can show who is left) or when the deadline is reached.
+
+        @param deadline: The time.monotonic() to stop waiting at, players that haven't answered by then are late. If
+        None then wait until everyone has answered (Default: None)
+        @param waiting: The names of the players the caller already knows haven't answered (Default: None)
+        @return: The names of the players that still haven't answered, empty if everyone has
+        """
+        with self.answer_condition:
+            while True:
+                unanswered = self.get_unanswered_users()
+                if not unanswered or unanswered != waiting:
+                    return unanswered
+
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        return unanswered
+
+                self.answer_condition.wait(timeout)
+
+
+class QuizGameClient(QuizClient):
+    game = None
+    running = False
+    error = None
+    server = None
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the client, the copy of the server's game data that the synced patches are applied to and the
+        condition that wait_for_move_on() waits on
+
+        @param host: The host ip to connect to
+        @param port: The port to connect to
+        """
+        super().__init__(host, port)
+
+        self.synced_data = {}
+
+        # How many move_on messages have arrived that haven't been waited for yet, counted so that one arriving before
+        # wait_for_move_on() is called isn't missed
+        self.move_on_count = 0
+        self.move_on_condition = threading.Condition()
+
+    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+        """
+        Handle data received from the server. The message is converted to a QuizMessage object and then handled,
+        the types that can be handled are: server_error, move_on, sync_game, sync_players, sync_bots. Server error
+        will cause the client to close, move on will wake up wait_for_move_on(), sync_game will sync the game
+        data, sync_players will sync the player data and sync_bots will sync the bot data. The syncs are patches of
+        what has changed, see apply_sync().
+
+        @param sock: The socket to handle the data from
+        @param key_data: The key data for the socket's selector
+        @param recv_data: The data of one complete message from the server as bytes
+        """
+        self.server = sock
+
+        # Convert the data to a message
+        message = self.decode_message(sock, recv_data)
+
+        # Count the messages the server keeps for rejoining, see QuizSession
+        if message.message_type in SESSION_MESSAGE_TYPES:
+            self.received_count += 1
 
         # Handle the message
         match message.message_type:
-            case "client_join":
-                # Check if the game has started
-                if self.game.game_started:
-                    self.send_message(sock, "Game has already started", "server_error")
-                    return
+            case "server_error":
+                self.error = f"Server error: {message.message}"
+                self.close_connection(sock)
+                self.stop()
 
-                # Check if the game is full
-                if len(self.game.users) >= self.game.max_players:
-                    self.send_message(sock, "Game is full", "server_error")
-                    return
+            case "move_on":
+                with self.move_on_condition:
+                    self.move_on_count += 1
+                    self.move_on_condition.notify_all()
 
-                # Convert the user to an object
-                self.game.users.append(message.message)
-                temp_index = len(self.game.users) - 1
+            case "set_codec":
+                # The server can decode this codec, so use it from now on
+                if message.message in MESSAGE_CODECS:
+                    self.codec = message.message
+
+            case "set_compression":
+                # The server can decompress frames, so compress anything sent over its threshold
+                self.compress_threshold = message.message
+
+            case "ping":
+                # Let the server know this client is still here
+                self.send_pong(sock, message.message)
+
+            case "set_session":
+                # Used to rejoin if the connection is lost, the count is where the server will start from
+                self.session = message.message["session"]
+                self.received_count = message.message["sequence"]
+
+            case "sync_game":
+                self.apply_sync(sock, message.message)
+
+                # Load from a copy so the game doesn't share lists with the synced data
+                self.game.save_data = copy.deepcopy(self.synced_data)
+                # Load the save data into variables
+                self.game.load_from_saved()
+
+                # Set the default settings if the settings are none
+                self.game.set_settings_default()
+
+                # Convert everything back
+                self.game.convert_all_from_save_data()
+
+                # Ensure that the joined_game flag is not lost
+                self.game.joined_game = True
+
+                # Make sure the user playing is the local user and not the synced one
+                for user_index in range(len(self.game.users)):
+                    if self.game.users[user_index].name == self.game.current_user_playing_net_name:
+                        self.game.current_user_playing = user_index
+
+            case "sync_players":
+                self.apply_sync(sock, message.message, ["users"])
+
+                # Convert any new users
                 self.game.convert_to_object(self.game.users, self.game.user_reference)
+                for user in self.game.users:
+                    debug_message(f"Player: {user.name} has synced with a score of {user.points}")
 
-                is_new_player = True
+                # Make sure the user playing is the local user and not the synced one
+                for user_index in range(len(self.game.users)):
+                    if self.game.users[user_index].name == self.game.current_user_playing_net_name:
+                        self.game.current_user_playing = user_index
 
-                # Check if the username is taken
-                for user_index in range(len(self.game.users) - 1):
+            case "sync_bots":
+                self.apply_sync(sock, message.message, ["bots"])
 
-                    # If the username is taken
-                    user = self.game.users[user_index]
-                    if user.name == self.game.users[temp_index].name:
-                        # If the user is taken and connected then the name is taken so send an error
-                        if user.is_connected:
-                            self.send_message(sock, "Username is taken", "server_error")
-                            # Remove the user from the list
-                            self.game.users.pop(temp_index)
-                            return
+                # Convert any new bots
+                self.game.convert_to_object(self.game.bots, self.game.bot_reference)
 
-                        debug_message(f"Removing index {temp_index}", "network_server")
+            case _:
+                debug_message(f"Unhandled message: {message.message}", "network_client")
 
-                        # Remove the user from the list as will use the old one
-                        self.game.users.pop(temp_index)
-                        temp_index = user_index
+    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+        """
+        Handle an error from the server, close the connection and set the running variable to false. If the error
+        message was that the connection was closed by the host then it is rephrased as "Server Closed" for readability.
+        If the connection was lost (rather than closed by the server) after joining then the client tries to reconnect
+        and rejoin first.
 
-                        # This means the server is continuing a game so send the user their progress
-                        is_new_player = False
-                        self.sync_game()
-                        time.sleep(0.5)
+        @param sock: The socket to handle the error from
+        @param key_data: The key data for the socket
+        @param error_response: The error response
+        """
+        self.close_connection(sock)
+
+        # The server keeps this player's place, so try to get it back
+        if self.running and self.session is not None and isinstance(error_response, SESSION_LOST_ERRORS):
+            debug_message(f"Lost connection ({error_response}), reconnecting", "network_client")
+            if self.reconnect():
+                return
+
+        error_response = str(error_response)
+
+        # Make errors more readable
+        if "An existing connection was forcibly closed by the remote host" in error_response:
+            error_response = "Server Closed"
+
+        self.error = error_response
+        self.stop()
+
+    def handle_reconnect(self) -> None:
+        """
+        Rejoin the game with the session, sending the local user as it may have changed while disconnected
+        """
+        self.server = self.client
+
+        # Convert the users to a dict
+        self.game.prepare_save_data()
+
+        # Get the user data
+        user_data = self.game.save_data["users"][self.game.current_user_playing]
+
+        self.send_message(self.client, user_data, "client_join")
+
+        # Convert everything back
+        self.game.convert_all_from_save_data()
+
+    def stop(self) -> None:
+        """
+        Mark the client as no longer running and wake up anything waiting in wait_for_move_on(), as the server isn't
+        going to send a move on now
+        """
+        with self.move_on_condition:
+            self.running = False
+            self.move_on_condition.notify_all()
+
+        network_endpoints.discard(self)
+
+    def apply_sync(self, sock: socket, patch: dict, sections: list = None) -> None:
+        """
+        Applies a patch from the server to the copy of the server's game data and then lets the server know that
+        revision has been applied. If sections are given then those parts of the patch are also applied to the game
+        in place (i.e. the users are updated without being recreated).
+
+        @param sock: The socket to send the acknowledgement on
+        @param patch: The patch from the server
+        @param sections: The parts of the game to update in place (i.e. ["users"]), if None then only the copy of the
+        server's game data is updated (Default: None)
+        """
+        apply_patch(self.synced_data, patch)
+
+        if sections is not None:
+            apply_patch(self.game, patch, sections)
+
+        self.send_message(sock, {"revision": patch["revision"]}, "sync_ack")
+
+    def send_answer_stamp(self, question_index: int, shown: float, answered: float) -> None:
+        """
+        Let the server know when a question was shown and answered on this client's time.monotonic(), so it can work
+        out the answer time on its own clock, see QuizGameServer.stamp_answer()
+
+        @param question_index: The index of the question
+        @param shown: When the question was shown
+        @param answered: When the question was answered (or the time ran out)
+        """
+        self.send_message(self.server, {"question": question_index, "shown": shown, "answered": answered},
+                          "answer_stamp")
+
+    def send_self(self):
+        """
+        Send the local user to the server
+        """
+        # Convert the users to a dict
+        self.game.prepare_save_data()
+
+        # Get the user data
+        user_data = self.game.save_data["users"][self.game.current_user_playing]
+
+        # Send the user data to the server
+        self.send_message(self.server, user_data, "sync_player")
+
+        # Convert everything back
+        self.game.convert_all_from_save_data()
+
+    def wait_for_move_on(self, timeout: float = None) -> bool:
+        """
+        Wait until the server sends a move on message, the thread sleeps until it arrives so this doesn't use any CPU.
+        If a move on arrived before this was called then it returns straight away. Stops waiting if the connection is
+        closed (see stop()) or the timeout runs out.
+
+        @param timeout: How many seconds to wait for, if None then wait until the move on or the connection closes
+        (Default: None)
+        @return: True if the server said to move on, False if the connection closed or the timeout ran out
+        """
+        with self.move_on_condition:
+            self.move_on_condition.wait_for(lambda: self.move_on_count or not self.running, timeout)
+
+            if not self.move_on_count:
+                return False
+
+            self.move_on_count -= 1
+            return True
+
+
+class QuizSpectatorClient(QuizClient):
+    """
+    Watches a game without playing in it. The server only sends the events in SPECTATOR_EVENT_TYPES, which are kept in
+    the question, answers and scores variables as they arrive.
+    """
+    running = False
+    error = None
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the client and the condition that wait_for_update() waits on, call join() once it is running
+
+        @param host: The host ip to connect to
+        @param port: The port to connect to
+        """
+        super().__init__(host, port)
+
+        # The question being answered, how many players have answered it and the [name, points] of each player
+        self.question = None
+        self.answers = None
+        self.scores = []
+
+        self.update_count = 0
+        self.update_condition = threading.Condition()
+
+    def join(self) -> None:
+        """
+        Ask the server to watch the game
+        """
+        self.send_message(self.client, None, "spectator_join")
+
+    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
+        """
+        Handle data received from the server, the spectator events are stored and wake up wait_for_update(). A
+        server_error closes the client.
+
+        @param sock: The socket to handle the data from
+        @param key_data: The key data for the socket's selector
+        @param recv_data: The data of one complete message from the server as bytes
+        """
+        message = self.decode_message(sock, recv_data)
+
+        match message.message_type:
+            case "server_error":
+                self.error = f"Server error: {message.message}"
+                self.close_connection(sock)
+                self.stop()
+
+            case "set_codec":
+                if message.message in MESSAGE_CODECS:
+                    self.codec = message.message
+
+            case "set_compression":
+                self.compress_threshold = message.message
+
+            case "ping":
+                self.send_pong(sock, message.message)
+
+            case "spectate_question" | "spectate_answers" | "spectate_scores":
+                with self.update_condition:
+                    match message.message_type:
+                        case "spectate_question":
+                            self.question = message.message
+                        case "spectate_answers":
+                            self.answers = message.message
+                        case "spectate_scores":
+                            self.scores = message.message
+
+                    self.update_count += 1
+                    self.update_condition.notify_all()
+
+            case _:
+                debug_message(f"Unhandled message: {message.message}", "network_client")
+
+    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
+        """
+        Handle an error from the server, close the connection and stop. Spectators don't rejoin, they can just join
+        again.
+
+        @param sock: The socket to handle the error from
+        @param key_data: The key data for the socket
+        @param error_response: The error response
+        """
+        self.close_connection(sock)
+        self.error = str(error_response)
+        self.stop()
+
+    def stop(self) -> None:
+        """
+        Mark the client as no longer running and wake up anything waiting in wait_for_update()
+        """
+        with self.update_condition:
+            self.running = False
+            self.update_condition.notify_all()
+
+        network_endpoints.discard(self)
+
+    def wait_for_update(self, seen: int, timeout: float = None) -> int:
+        """
+        Wait until an event arrives that hasn't been seen yet
+
+        @param seen: The update_count when the events were last looked at
+        @param timeout: How many seconds to wait for, if None then wait until an event arrives or the client stops
+        (Default: None)
+        @return: The update_count now, the same as seen if nothing arrived
+        """
+        with self.update_condition:
+            self.update_condition.wait_for(lambda: self.update_count != seen or not self.running, timeout)
+            return self.update_count
+
+
+# - - - - - - - Functions - - - - - - -#
+
+
+def frame_bytes(payload: bytes, compress_threshold: int = None) -> bytes:
+    """
+    Prefixes the payload with its length so that it can be split back out of a TCP stream by a QuizMessageBuffer. If
+    the payload is over the threshold it is compressed and the compressed flag is set in the header, unless compressing
+    didn't make it any smaller.
+
+    @param payload: The bytes to frame
+    @param compress_threshold: Compress the payload if it is at least this many bytes (Default: None, never compress)
+    @return: The header and payload as one bytes object
+    """
+    if compress_threshold is not None and len(payload) >= compress_threshold:
+        compressed = zlib.compress(payload, COMPRESSION_LEVEL)
+
+        if len(compressed) < len(payload):
+            return struct.pack(FRAME_HEADER_FORMAT, len(compressed) | FRAME_COMPRESSED_FLAG) + compressed
+
+    return struct.pack(FRAME_HEADER_FORMAT, len(payload)) + payload
+
+
+def register_codec(codec: type) -> None:
+    """
+    Adds a codec so that messages can be encoded with it and it can be offered when joining a server. A codec is a
+    class with a name, a magic first byte that no other codec starts with and static encode(dict) -> bytes and
+    decode(bytes) -> dict functions.
+
+    @param codec: The codec class to add
+    """
+    MESSAGE_CODECS[codec.name] = codec
+    MESSAGE_CODEC_MAGIC[codec.magic] = codec
+
+
+def encode_binary_value(value: object, out: bytearray, strings: dict) -> None:
+    """
+    Writes a value to the end of the output in the binary codec's format, see QuizBinaryCodec. Only values that can be
+    stored as JSON can be encoded, and like JSON tuples become lists and dict keys become strings.
+
+    @param value: The value to write
+    @param out: The bytes to add the value to
+    @param strings: The strings already written in this message and their index, for the string references
+    """
+    # Check bools before ints as bools are ints in python
+    if value is None:
+        out.append(BINARY_TAG_NONE)
+
+    elif value is True:
+        out.append(BINARY_TAG_TRUE)
+
+    elif value is False:
+        out.append(BINARY_TAG_FALSE)
+
+    elif isinstance(value, int):
+        out.append(BINARY_TAG_INT)
+
+        # Zigzag the number so small negative numbers are small too
+        write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+    elif isinstance(value, float):
+        out.append(BINARY_TAG_FLOAT)
+        out += struct.pack("!d", value)
+
+    elif isinstance(value, str):
+        string_index = strings.get(value)
+
+        # Repeated strings are written as the index of the first time they were written
+        if string_index is not None:
+            out.append(BINARY_TAG_STRING_REF)
+            write_varint(out, string_index)
+        else:
+            strings[value] = len(strings)
+            encoded = value.encode("utf-8")
+            out.append(BINARY_TAG_STRING)
+            write_varint(out, len(encoded))
+            out += encoded
+
+    elif isinstance(value, (list, tuple)):
+        out.append(BINARY_TAG_LIST)
+        write_varint(out, len(value))
+        for item in value:
+            encode_binary_value(item, out, strings)
+
+    elif isinstance(value, dict):
+        out.append(BINARY_TAG_DICT)
+        write_varint(out, len(value))
+        for key, item in value.items():
+            encode_binary_value(key if isinstance(key, str) else str(key), out, strings)
+            encode_binary_value(item, out, strings)
+
+    else:
+        raise TypeError(f"Can't encode {type(value)} in a message")
+
+
+def decode_binary_value(data: bytes, offset: int, strings: list) -> tuple:
+    """
+    Reads a value written by encode_binary_value()
+
+    @param data: The bytes to read from
+    @param offset: Where the value starts
+    @param strings: The strings already read in this message, for the string references
+    @return: The value and the offset of the byte after it
+    """
+    tag = data[offset]
+    offset += 1
+
+    if tag == BINARY_TAG_NONE:
+        return None, offset
+
+    if tag == BINARY_TAG_TRUE:
+        return True, offset
+
+    if tag == BINARY_TAG_FALSE:
+        return False, offset
+
+    if tag == BINARY_TAG_INT:
+        number, offset = read_varint(data, offset)
+
+        # Undo the zigzag
+        return (number >> 1) if not number & 1 else -((number + 1) >> 1), offset
+
+    if tag == BINARY_TAG_FLOAT:
+        return struct.unpack_from("!d", data, offset)[0], offset + 8
+
+    if tag == BINARY_TAG_STRING:
+        length, offset = read_varint(data, offset)
+        value = data[offset:offset + length].decode("utf-8")
+        strings.append(value)
+        return value, offset + length
+
+    if tag == BINARY_TAG_STRING_REF:
+        string_index, offset = read_varint(data, offset)
+        return strings[string_index], offset
+
+    if tag == BINARY_TAG_LIST:
+        length, offset = read_varint(data, offset)
+        value = []
+        for _ in range(length):
+            item, offset = decode_binary_value(data, offset, strings)
+            value.append(item)
+        return value, offset
+
+    if tag == BINARY_TAG_DICT:
+        length, offset = read_varint(data, offset)
+        value = {}
+        for _ in range(length):
+            key, offset = decode_binary_value(data, offset, strings)
+            value[key], offset = decode_binary_value(data, offset, strings)
+        return value, offset
+
+    raise ValueError(f"Unknown binary tag: {tag}")
+
+
+def write_varint(out: bytearray, number: int) -> None:
+    """
+    Writes a positive int using 7 bits per byte, the top bit is set on every byte except the last
+
+    @param out: The bytes to add the number to
+    @param number: The number to write (must not be negative)
+    """
+    while number > 0x7F:
+        out.append((number & 0x7F) | 0x80)
+        number >>= 7
+
+    out.append(number)
+
+
+def read_varint(data: bytes, offset: int) -> tuple:
+    """
+    Reads an int written by write_varint()
+
+    @param data: The bytes to read from
+    @param offset: Where the number starts
+    @return: The number and the offset of the byte after it
+    """
+    number = 0
+    shift = 0
+
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7F) << shift
 
-                        break
+        if byte < 0x80:
+            return number, offset
 
-                # If this server is continuing a game then don't allow new players to join
-                if is_new_player and self.game.game_loaded:
-                    self.send_message(sock,
-                                      "Server is continuing game, must rejoin using same name. New players not allowed",
-                                      "server_error")
-                    # Remove the user from the list
-                    self.game.users.pop(temp_index)
-                    return
+        shift += 7
 
-                self.game.convert_to_object(self.game.users, self.game.user_reference)
 
-                # Set the sockets name to the user's name
-                self.client_names[self.clients.index(sock)] = self.game.users[temp_index].name
+def get_changed_events(events: dict, sent: dict) -> list:
+    """
+    Gets the spectator events that are different to the ones last sent, in the order of SPECTATOR_EVENT_TYPES so that
+    a new question is sent before the answers to it
 
-                # User is now connected
-                self.game.users[temp_index].is_connected = True
-                debug_message(f"Player {message.message['name']} has joined the game", "network_server")
+    @param events: The value of each event by its message type, see QuizGameServer.get_spectator_events()
+    @param sent: The events as they were last sent (empty if nothing has been sent)
+    @return: A list of the message type and value of each event that has changed
+    """
+    return [(message_type, events[message_type]) for message_type in SPECTATOR_EVENT_TYPES
+            if message_type in events and events[message_type] != sent.get(message_type)]
 
-            case "sync_player":
-                user = message.message
 
-                index = 0
+def flatten_state(value: object, path: tuple, flat: dict) -> None:
+    """
+    Flattens a value from the save data into the flat dict, where each leaf value is stored under the path of keys and
+    indexes to get to it. Lists also store their length under LIST_LENGTH_KEY. See apply_patch() for the reverse.
 
-                # Find the user to update
-                for user_index in range(len(self.game.users)):
-                    if self.game.users[user_index].name == user["name"]:
-                        self.game.users[user_index] = user
-                        self.game.users[user_index]["is_connected"] = True
-                        index = user_index
-                        break
+    @param value: The value to flatten (dicts, lists and JSON values only)
+    @param path: The path to the value
+    @param flat: The dict to add the flattened values to
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten_state(item, path + (key,), flat)
 
-                # Convert the users to objects
-                self.game.convert_to_object(self.game.users, self.game.user_reference)
-                debug_message(f"Player: {self.game.users[index].name} has synced", "network_server")
+    elif isinstance(value, list):
+        flat[path + (LIST_LENGTH_KEY,)] = len(value)
+        for index in range(len(value)):
+            flatten_state(value[index], path + (index,), flat)
 
-            case _:
-                debug_message(f"Unhandled message: {message.message}", "network_server")
+    else:
+        flat[path] = value
 
-    def sync_game(self) -> None:
-        """
-        Sync the game data to all clients. This will send all the game data, so it is best practice to save any
-        variables that need to be saved before handling this. As games can be quite large (30kb with 50 questions,
-        50 players) this function should be used sparingly, instead send the data that needs to be updated,
-        i.e. use sync_players when showing the scoreboard.
-        """
-        # Ensure users have been converted, as timings can be off when networked
-        self.game.convert_to_object(self.game.users, self.game.user_reference)
 
-        # Get the game data
-        self.game.prepare_save_data()
-        game_data = self.game.save_data
+def apply_patch(root: object, patch: dict, sections: list | tuple = None) -> None:
+    """
+    Applies a patch made by QuizStateTracker.patch() or QuizStateTracker.snapshot() in place. The root can be a dict
+    or an object (i.e. the Game), objects have their attributes set so the users and bots can be updated without being
+    recreated. Any dicts or lists on the path that don't exist yet are created.
+
+    @param root: The data to apply the patch to
+    @param patch: The patch to apply
+    @param sections: Only apply the paths that start with one of these keys, if None then apply all of them (Default:
+    None)
+    """
+    # A snapshot replaces the sections, copied so that different roots don't share lists
+    for key, value in patch.get("snapshot", {}).items():
+        if sections is None or key in sections:
+            set_patch_child(root, key, copy.deepcopy(value))
 
-        debug_message(f"Syncing game data: {game_data}", "network_server")
+    for path, value in patch.get("set", []):
+        if sections is None or path[0] in sections:
+            set_patch_value(root, path, value)
 
-        # Send the game data to all clients
-        self.send_message_to_all(game_data, "sync_game")
+    for path in patch.get("remove", []):
+        if sections is not None and path[0] not in sections:
+            continue
 
-        # Convert everything back
-        self.game.convert_all_from_save_data()
+        # Removed list items are handled by the length changing, so only dict keys need removing
+        parent = get_patch_parent(root, path, False)
+        if isinstance(parent, dict):
+            parent.pop(path[-1], None)
 
-    def sync_players(self) -> None:
-        """
-        Sync the player data to all clients. This will send all the player data, so it is best practice to save the
-        position of the local player before handling this. 
-        """
-        # Ensure users have been converted, as timings can be off when networked
-        self.game.convert_to_object(self.game.users, self.game.user_reference)
 
-        # Get the game data
-        self.game.prepare_save_data()
-        players = self.game.save_data["users"]
+def set_patch_value(root: object, path: list, value: object) -> None:
+    """
+    Sets the value at the end of the path, if the path is a list length then the list is resized
 
-        debug_message(f"Syncing player data: {players}", "network_server")
+    @param root: The data to set the value in
+    @param path: The path to the value
+    @param value: The value to set
+    """
+    parent = get_patch_parent(root, path)
+    key = path[-1]
 
-        # Send the game data to all clients
-        self.send_message_to_all(players, "sync_players")
+    # Resize the list to the new length
+    if key == LIST_LENGTH_KEY:
+        del parent[value:]
+        parent.extend([None] * (value - len(parent)))
+        return
 
-        # Convert everything back
-        self.game.convert_all_from_save_data()
+    set_patch_child(parent, key, value)
 
-    def sync_bots(self) -> None:
-        """
-        Sync the bot data to all clients.
-        """
-        # Ensure bots have been converted, as timings can be off when networked
-        self.game.convert_to_object(self.game.bots, self.game.bot_reference)
 
-        # Get the game data
-        self.game.prepare_save_data()
-        bots = self.game.save_data["bots"]
+def get_patch_parent(root: object, path: list, create: bool = True) -> object:
+    """
+    Follows the path to the container that holds the last key of the path, creating any containers that are missing.
 
-        debug_message(f"Syncing bot data: {bots}", "network_server")
+    @param root: The data to follow the path in
+    @param path: The path to follow
+    @param create: Should missing containers be created, if not then None is returned when one is missing (Default:
+    True)
+    @return: The container holding the last key of the path
+    """
+    container = root
+    for key_index in range(len(path) - 1):
+        key = path[key_index]
+        next_key = path[key_index + 1]
+
+        # Get the child, dicts and lists use their keys and anything else uses its attributes
+        if isinstance(container, list):
+            child = container[key] if key < len(container) else None
+        elif isinstance(container, dict):
+            child = container.get(key)
+        else:
+            # Only use the object's own attributes, as class defaults (i.e. lists) are shared between objects
+            child = vars(container).get(key)
 
-        # Send the game data to all clients
-        self.send_message_to_all(bots, "sync_bots")
+        if child is None and not create:
+            return None
 
-        # Convert everything back
-        self.game.convert_all_from_save_data()
+        # Create the child if it doesn't exist, the next key says if it should be a list or a dict
+        if child is None:
+            child = [] if isinstance(next_key, int) or next_key == LIST_LENGTH_KEY else {}
+            set_patch_child(container, key, child)
 
-    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
-        """
-        Handle an error from a client and then close the client. Uses the super class to handle the error and then sets
-        the running variable to false
+        container = child
 
-        @param sock: The socket that the error occurred on
-        @param key_data: The key data for the socket
-        @param error_response: The exception that was raised that caused the error
-        """
-        super().handle_error(sock, key_data, error_response)
-        self.running = False
+    return container
 
-    def close_connection(self, sock: socket) -> None:
-        """
-        Close a connection from a client by removing it from the selector and the list of clients. The user is also
-        removed from the games list of players.
 
-        @param sock: The socket to close the connection on.
-        """
+def set_patch_child(container: object, key: object, value: object) -> None:
+    """
+    Sets a key in a dict or list or an attribute on an object
 
-        debug_message(f"Closing connection on {sock}", "network_server")
+    @param container: The container to set the value in
+    @param key: The key, index or attribute name
+    @param value: The value to set
+    """
+    if isinstance(container, list):
+        if key >= len(container):
+            container.extend([None] * (key + 1 - len(container)))
+        container[key] = value
+    elif isinstance(container, dict):
+        container[key] = value
+    else:
+        setattr(container, key, value)
+
+
+def api_get_questions(amount: int, category: int, difficulty: str, question_type: str, quiet: bool = False,
+                      exclude: set = None) -> list:
+    """
+    Gets questions from the API at https://opentdb.com/api.php and returns them as a list of dictionaries. The API only
+    gives API_MAX_AMOUNT questions per request so more are fetched in chunks at the same time, any questions that come
+    back more than once (or are excluded) are removed and asked for again. The requests use a session token so that the
+    API doesn't give questions it has already given, see get_api_token().
 
-        # Unregister the socket from the selector
-        self.selector.unregister(sock)
+    @param amount: How many questions to get
+    @param category: The category of the questions (index, offset by 9)
+    @param difficulty: The difficulty of the questions
+    @param question_type: The type of the questions
+    @param quiet: Only log errors instead of showing them, for when the questions are fetched in the background
+    (Default: False)
+    @param exclude: The hashes of questions to leave out (i.e. ones that have been played), see get_question_hash()
+    (Default: None)
+    @return: A list of dictionaries containing the questions, there may be fewer than the amount if the API doesn't have
+    enough
+    """
 
-        # Close the socket
-        sock.close()
+    api_fix = 0
 
-        # Remove the socket from the list of clients
-        # Remove the player from the game
-        for sock_index in range(len(self.clients)):
-            if self.clients[sock_index] == sock:
-                for user_index in range(len(self.game.users)):
-                    if self.game.users[user_index].name == self.client_names[sock_index]:
-                        self.game.users.pop(user_index)
-                        break
+    user_data = UserData()
 
-                # Remove the client and name
-                self.clients.pop(sock_index)
-                self.client_names.pop(sock_index)
-                break
+    # Showing an error waits for the user to read it, so when in the background they are only logged
+    def report_error(message: str) -> None:
+        if quiet:
+            debug_message(message, "API")
+        else:
+            error(message)
 
+    # Keyed by the hash so that duplicates are dropped, the order they arrive in is kept
+    questions = {}
 
-class QuizGameClient(QuizClient):
-    game = None
-    running = False
-    error = None
-    server = None
-    move_on = False
+    for _ in range(API_MAX_ROUNDS):
+        needed = amount - len(questions)
+        if needed <= 0:
+            break
 
-    def __init__(self, host: str, port: int):
-        super().__init__(host, port)
+        # Ignore the options if they are "Any" (or none because 'convert_question_settings_to_api' already does this)
+        # since the API gives any by default
+        parameters = {}
 
-    def handle_data_received(self, sock: socket, key_data: object, recv_data: bytes) -> None:
-        """
-        Handle data received from the server. The message is converted to a QuizMessage object and then handled,
-        the types that can be handled are: server_error, move_on, sync_game, sync_players, sync_bots. Server error
-        will cause the client to close, move on will exit the wait_for_move_on()'s loop, sync_game will sync the game
-        data, sync_players will sync the player data and sync_bots will sync the bot data.
+        if question_type is not None and api_fix < 1:
+            parameters["type"] = question_type
 
-        @param sock: The socket to handle the data from
-        @param key_data: The key data for the socket's selector
-        @param recv_data: The data received from the server as bytes (the same as key_data.receive_bytes but kept for
-        convenience)
-        """
-        self.server = sock
+        if difficulty != "Any" and api_fix < 2:
+            parameters["difficulty"] = difficulty.lower()
 
-        # Convert the data to a message
-        message = QuizMessage(None, None, None, None)
-        message.from_bytes(recv_data)
+        if category is not None and api_fix < 3:
+            parameters["category"] = category
+
+        token = get_api_token()
+        if token is not None:
+            parameters["token"] = token
+
+        responses = api_request_chunks(needed, parameters)
+        no_results = False
+        token_failed = False
+
+        for response in responses:
+
+            # Check if the was any errors
+            if response is None:
+                report_error("Failed to get questions from the API")
+                continue
+
+            # Check for errors
+            match response["response_code"]:
+                case 0:
+                    pass  # No errors, just good to have a defined case so that I don't forget it
+                case 1:
+                    no_results = True
+                case 2:
+                    report_error("Invalid parameter")
+                # Constants can't be used as patterns in a match, so they are checked in the guard
+                case code if code in (API_TOKEN_NOT_FOUND, API_TOKEN_EMPTY):
+                    token_failed = True
+
+            for question in response["results"]:
+                question_hash = get_question_hash(question)
+                if exclude is None or question_hash not in exclude:
+                    questions.setdefault(question_hash, question)
+
+        # Get a new token (or reset the one that has run out) and ask for the rest again
+        if token_failed:
+            renew_api_token(token)
+            continue
+
+        if no_results:
+            report_error("No results found")
+
+            # Relax the settings and ask for the rest again
+            if user_data.auto_fix_api and api_fix < 3:
+                if not quiet:
+                    render_text("Auto fixing API error...")
+                api_fix += 1
+                continue
 
-        # Handle the message
-        match message.message_type:
-            case "server_error":
-                self.error = f"Server error: {message.message}"
-                self.close_connection(sock)
-                self.running = False
+        # Only ask again if something came back, otherwise the API is failing
+        if None in responses or no_results or not any(response["results"] for response in responses):
+            break
 
-            case "move_on":
-                self.move_on = True
+    questions = list(questions.values())
 
-            case "sync_game":
-                self.game.save_data = message.message
-                # Load the save data into variables
-                self.game.load_from_saved()
+    # Keep the questions so that later games can use them without downloading them again
+    if user_data.question_bank_store and questions:
+        store_questions(questions)
 
-                # Set the default settings if the settings are none
-                self.game.set_settings_default()
+    # Return the questions
+    return questions
 
-                # Convert everything back
-                self.game.convert_all_from_save_data()
 
-                # Ensure that the joined_game flag is not lost
-                self.game.joined_game = True
+def api_request_chunks(amount: int, parameters: dict) -> list:
+    """
+    Splits a request for questions into chunks the API allows and requests them at the same time
 
-                # Make sure the user playing is the local user and not the synced one
-                for user_index in range(len(self.game.users)):
-                    if self.game.users[user_index].name == self.game.current_user_playing_net_name:
-                        self.game.current_user_playing = user_index
+    @param amount: How many questions to request in total
+    @param parameters: The query parameters to send with each chunk (not including the amount)
+    @return: The JSON response of each chunk, None for any that failed
+    """
+    chunks = [min(API_MAX_AMOUNT, amount - start) for start in range(0, amount, API_MAX_AMOUNT)]
 
-            case "sync_players":
-                synced_users = message.message
+    # No need for threads when it fits in one request
+    if len(chunks) == 1:
+        return [api_request(chunks[0], parameters)]
 
-                self.game.users = synced_users
+    with concurrent.futures.ThreadPoolExecutor(min(len(chunks), API_MAX_WORKERS)) as executor:
+        return list(executor.map(lambda chunk: api_request(chunk, parameters), chunks))
 
-                self.game.convert_to_object(self.game.users, self.game.user_reference)
-                for user in self.game.users:
-                    debug_message(f"Player: {user.name} has synced with a score of {user.points}")
 
-                # Make sure the user playing is the local user and not the synced one
-                for user_index in range(len(self.game.users)):
-                    if self.game.users[user_index].name == self.game.current_user_playing_net_name:
-                        self.game.current_user_playing = user_index
+def api_request(amount: int, parameters: dict) -> dict | None:
+    """
+    Requests questions from the API using the shared session, backing off and retrying if the API is asked too often or
+    can't be reached
 
-            case "sync_bots":
-                synced_bots = message.message
-                for bot_index in range(len(synced_bots)):
-                    self.game.bots[bot_index] = synced_bots[bot_index]
-                self.game.convert_to_object(self.game.bots, self.game.bot_reference)
+    @param amount: How many questions to request (Max API_MAX_AMOUNT)
+    @param parameters: The query parameters to send (not including the amount)
+    @return: The JSON response, or None if the request failed
+    """
+    parameters = {"amount": amount, **parameters}
 
-            case _:
-                debug_message(f"Unhandled message: {message.message}", "network_client")
+    for attempt in range(API_RETRIES):
+        try:
+            response = get_api_session().get(API_URL, params=parameters, timeout=API_TIMEOUT)
+            debug_message(f"{response.url} ({response.status_code})", "API")
 
-    def handle_error(self, sock: socket, key_data: object, error_response: Exception) -> None:
-        """
-        Handle an error from the server, close the connection and set the running variable to false. If the error
-        message was that the connection was closed by the host then it is rephrased as "Server Closed" for readability.
+            if response.status_code == 200:
+                data = response.json()
 
-        @param sock: The socket to handle the error from
-        @param key_data: The key data for the socket
-        @param error_response: The error response
-        """
-        self.close_connection(sock)
+                # Debug
+                if debug_enabled():
+                    debug_message(str(data), "API")
 
-        error_response = str(error_response)
+                if data["response_code"] != API_RATE_LIMITED:
+                    return data
 
-        # Make errors more readable
-        if "An existing connection was forcibly closed by the remote host" in error_response:
-            error_response = "Server Closed"
+            elif response.status_code != 429 and response.status_code < 500:
+                return None
 
-        self.error = error_response
-        self.running = False
+        except (requests.RequestException, ValueError) as request_error:
+            debug_message(f"Request to the API failed: {request_error}", "API")
 
-    def send_self(self):
-        """
-        Send the local user to the server
-        """
-        # Convert the users to a dict
-        self.game.prepare_save_data()
+        # Wait longer each time, with jitter so chunks that were limited together don't retry together
+        if attempt < API_RETRIES - 1:
+            backoff = min(API_BACKOFF * 2 ** attempt, API_MAX_BACKOFF)
+            time.sleep(backoff + random.uniform(0, backoff))
 
-        # Get the user data
-        user_data = self.game.save_data["users"][self.game.current_user_playing]
+    return None
 
-        # Send the user data to the server
-        self.send_message(self.server, user_data, "sync_player")
 
-        # Convert everything back
-        self.game.convert_all_from_save_data()
+def get_api_token() -> str | None:
+    """
+    Gets the session token sent with each request, so that the API doesn't give the same question twice. The token is
+    kept in the user data so that it carries on between runs, a new one is requested if there isn't one.
 
-    def wait_for_move_on(self):
-        """
-        Wait for the move on flag to be set (this is set when receiving the move on message from the server)
-        """
-        self.move_on = False
-        while not self.move_on and self.running:
-            pass
+    @return: The token, or None if the API couldn't give one (the questions are then fetched without a token)
+    """
+    with api_client["token_lock"]:
+        if api_client["token"] is None:
+            api_client["token"] = UserData().api_token
 
+    if api_client["token"] is None:
+        renew_api_token(None)
 
-# - - - - - - - Functions - - - - - - -#
+    return api_client["token"]
 
 
-def api_get_questions(amount: int, category: int, difficulty: str, question_type: str) -> list:
+def renew_api_token(token: str | None) -> None:
     """
-    Gets questions from the API at https://opentdb.com/api.php and returns them as a list of dictionaries
+    Replaces a token that the API has forgotten with a new one, or resets a token that has run out of questions so that
+    it can give them again (questions that have been played are left out locally instead, see QuestionSelection)
 
-    @param amount: How many questions to get (Max 50)
-    @param category: The category of the questions (index, offset by 9)
-    @param difficulty: The difficulty of the questions
-    @param question_type: The type of the questions
-    @return: A list of dictionaries containing the questions
+    @param token: The token that failed, None to get a new one
     """
+    with api_client["token_lock"]:
 
-    redo = True
-    api_fix = 0
+        # Another chunk or thread has already renewed it
+        if token != api_client["token"]:
+            return
 
-    user_data = UserData()
+        data = None
+        if token is not None:
+            data = api_request_token({"command": "reset", "token": token})
 
-    while redo:
+        # Resetting a token the API has forgotten fails, so a new one is requested
+        if data is None or data.get("response_code") != 0:
+            data = api_request_token({"command": "request"})
 
-        # Create the URL
-        url = f"https://opentdb.com/api.php?amount={amount}"
+        if data is None:
+            return
 
-        # Ignore the options if they are "Any" (or none because 'convert_question_settings_to_api' already does this)
-        # since the API gives any by default
+        api_client["token"] = data.get("token")
+        debug_message("Renewed the API token", "API")
 
-        if question_type is not None and api_fix < 1:
-            url += f"&type={question_type}"
+        user_data = UserData()
+        user_data.api_token = api_client["token"]
+        user_data.save()
 
-        if difficulty != "Any" and api_fix < 2:
-            url += f"&difficulty={difficulty.lower()}"
 
-        if category is not None and api_fix < 3:
-            url += f"&category={category}"
+def api_request_token(parameters: dict) -> dict | None:
+    """
+    Sends a request to the token part of the API
+
+    @param parameters: The query parameters, the command and the token if there is one
+    @return: The JSON response, or None if the request failed
+    """
+    try:
+        return get_api_session().get(API_TOKEN_URL, params=parameters, timeout=API_TIMEOUT).json()
+    except (requests.RequestException, ValueError) as request_error:
+        debug_message(f"Token request to the API failed: {request_error}", "API")
+        return None
+
 
-        debug_message(url, "API")
+def get_api_session() -> requests.Session:
+    """
+    Gets the session used to talk to the API, it is created the first time. Reusing the session keeps the connections
+    to the API open between requests and chunks.
+
+    @return: The session
+    """
+    with api_client["lock"]:
+        if api_client["session"] is None:
+            session = requests.Session()
 
-        # Get the questions from the API
-        response = requests.get(url)
+            # Enough pooled connections for every chunk to have one
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=API_MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
 
-        # Check if the was any errors
-        if response.status_code != 200:
-            error("Failed to get questions from the API")
-            return []
+            api_client["session"] = session
 
-        # Debug
-        debug_message(str(response.json()), "API")
+        return api_client["session"]
 
-        # Check for errors
-        match response.json()["response_code"]:
-            case 0:
-                pass  # No errors, just good to have a defined case so that I don't forget it
-            case 1:
-                error("No results found")
-                if user_data.auto_fix_api:
-                    render_text("Auto fixing API error...")
-                    api_fix += 1
-                    continue
 
-            case 2:
-                error("Invalid parameter")
+def store_questions(questions: list) -> None:
+    """
+    Adds questions downloaded from the API to the local question bank. The bank is only a cache, so if it can't be
+    written to the game carries on without it.
 
-        # Return the questions
-        return response.json()["results"]
+    @param questions: The questions as given by the API
+    """
+    try:
+        with QuestionBank() as bank:
+            bank.add_questions(questions)
+    except sqlite3.Error as bank_error:
+        debug_message(f"Couldn't store the questions: {bank_error}", "API")
 
 
 def connect_to_server(server_ip: str, port: int) -> socket.socket:
@@ -851,13 +3829,23 @@ def setup_tcp_server(port: int) -> socket.socket:
     return sock
 
 
-def get_ip() -> str:
+def get_ip(refresh: bool = False) -> str:
     """
-    Gets the IP of the computer using the socket library
+    Gets the IP of the computer using the socket library. Looking the IP up can go out to the network, so it is cached
+    and only looked up again after IP_CACHE_TIME or if the host name has changed (i.e. joined a different network).
 
+    @param refresh: Look the IP up even if the cached one is still valid (Default: False)
     @return: The IP of the computer
     """
-    return socket.gethostbyname(socket.gethostname())
+    host_name = socket.gethostname()
+    now = time.monotonic()
+
+    if refresh or ip_cache["host_name"] != host_name or now - ip_cache["time"] > IP_CACHE_TIME:
+        ip_cache["ip"] = socket.gethostbyname(host_name)
+        ip_cache["host_name"] = host_name
+        ip_cache["time"] = now
+
+    return ip_cache["ip"]
 
 
 def get_free_port(ip: str, port: int) -> int:
@@ -878,3 +3866,158 @@ def get_free_port(ip: str, port: int) -> int:
             port += 1
 
     return port
+
+
+def get_message_numbers(message: object, *names: str) -> tuple | None:
+    """
+    Gets number fields out of a message from a client, a client can send anything so the message is checked before
+    the server uses it
+
+    @param message: The message, should be a dict
+    @param names: The keys of the numbers
+    @return: The numbers in the same order as the keys, or None if the message isn't a dict or any of them is missing or
+    isn't a finite number
+    """
+    if not isinstance(message, dict):
+        return None
+
+    numbers = tuple(message.get(name) for name in names)
+    for number in numbers:
+        if isinstance(number, bool) or not isinstance(number, (int, float)) or not math.isfinite(number):
+            return None
+
+    return numbers
+
+
+def is_player_data(message: object) -> bool:
+    """
+    Checks a player sent by a client (in a client_join or sync_player) can be loaded into a User, a client can send
+    anything so the message is checked before the game uses it
+
+    @param message: The message, should be the player's save data as a dict
+    @return: True if the message has a name and its stats and answers are the right types, False if not
+    """
+    if not isinstance(message, dict):
+        return False
+
+    if not isinstance(message.get("name"), str) or not message["name"]:
+        return False
+
+    for name in ("answers", "times"):
+        if message.get(name) is not None and not isinstance(message[name], list):
+            return False
+
+    for name in ("points", "correct", "incorrect", "streak", "highest_streak", "questions_missed"):
+        if message.get(name) is not None and get_message_numbers(message, name) is None:
+            return False
+
+    return True
+
+
+def get_network_stats() -> list:
+    """
+    Gets the stats of every server and client that is running, see QuizServer.get_stats() and QuizClient.get_stats()
+
+    @return: A list of the stats of each server and client
+    """
+    return [endpoint.get_stats() for endpoint in list(network_endpoints)]
+
+
+def format_network_stats(stats: list) -> list:
+    """
+    Formats the stats of the servers and clients to be shown in the debug CLI, see get_network_stats()
+
+    @param stats: The stats to format
+    @return: The lines to show
+    """
+    lines = []
+
+    for endpoint in stats:
+        lines.append(f"{endpoint['name']} on port {endpoint['port']} ({len(endpoint['connections'])} connections)")
+
+        # Lobbies also show the health of their rooms, including the ones hosted by other processes
+        health = endpoint.get("health")
+        if health is not None:
+            lines.append(f" Rooms: {health['rooms']}, players {health['players']}, processes {health['processes']}")
+            for room_id, room in health["room_health"].items():
+                lines.append(f" - Room {room_id}: {room['players']} players, queued {room['queued']}B, process "
+                             f"{room['pid'] if room['pid'] is not None else 'unknown'}"
+                             + (f", {room['handed_off']} handed over" if room.get("handed_off") else ""))
+
+        for name in ("encode_times", "decode_times"):
+            times = endpoint[name]
+            buckets = ", ".join(f"<={float(bound) * 1000:g}ms: {count}" if bound != "inf" else f">: {count}"
+                                for bound, count in times["buckets"].items() if count)
+            lines.append(f" {name.split('_')[0].title()}: {times['count']} messages, mean {times['mean'] * 1000:.3f}ms,"
+                         f" max {times['max'] * 1000:.3f}ms {'(' + buckets + ')' if buckets else ''}")
+
+        for address, connection in endpoint["connections"].items():
+            lines.append(f" - {address}: in {connection['messages_in']} messages/{connection['bytes_in']}B "
+                         f"({connection['rate_in']:.1f}/s), out {connection['messages_out']} messages/"
+                         f"{connection['bytes_out']}B ({connection['rate_out']:.1f}/s), queued {connection['queued']}B,"
+                         f" idle {connection['idle']:.1f}s")
+
+            for direction in ("in", "out"):
+                counts = sorted(connection["types_" + direction].items())
+                if counts:
+                    lines.append(f"     {direction}: " + ", ".join(f"{message_type} {count['messages']}/"
+                                                             f"{count['bytes']}B" for message_type, count in counts))
+
+    return lines
+
+
+def start_network_stats_dump(folder: str, interval: float = STATS_DUMP_INTERVAL) -> str | None:
+    """
+    Start writing the stats of every server and client to a file on an interval, each line of the file is a JSON
+    object of the time and the stats (see get_network_stats()). Any dump already running is stopped first.
+
+    @param folder: The folder to create the file in (i.e. ProgramData/Logs)
+    @param interval: How often to write the stats in seconds, 0 or less stops dumping (Default: STATS_DUMP_INTERVAL)
+    @return: The path of the file, or None if dumping was stopped
+    """
+    if stats_dump["stop"] is not None:
+        stats_dump["stop"].set()
+        stats_dump["thread"].join()
+        debug_message(f"Stopped dumping network stats to {stats_dump['file']}", "Network")
+        stats_dump.update(thread=None, stop=None, file=None)
+
+    if interval <= 0:
+        return None
+
+    os.makedirs(folder, exist_ok=True)
+    file_name = folder + "/network_stats_" + str(datetime.now()).replace(":", "-").replace(" ", "_") + ".jsonl"
+
+    stop = threading.Event()
+    thread = threading.Thread(target=dump_network_stats, args=(file_name, interval, stop), daemon=True)
+    stats_dump.update(thread=thread, stop=stop, file=file_name)
+    thread.start()
+
+    debug_message(f"Dumping network stats to {file_name} every {interval}s", "Network")
+    return file_name
+
+
+def dump_network_stats(file_name: str, interval: float, stop: threading.Event) -> None:
+    """
+    Append the stats to the file every interval until stopped, run on its own thread by start_network_stats_dump()
+
+    @param file_name: The path of the file to append to
+    @param interval: How often to write the stats in seconds
+    @param stop: Set to stop dumping
+    """
+    while True:
+        line = json.dumps({"time": time.time(), "endpoints": get_network_stats()})
+
+        try:
+            with open(file_name, "a") as file:
+                file.write(line + "\n")
+        except OSError as e:
+            debug_message(f"Couldn't write the network stats: {e}", "Network")
+            return
+
+        if stop.wait(interval):
+            return
+
+
+# Register the built-in codecs, in order of preference
+register_codec(QuizBinaryCodec)
+register_codec(QuizJsonCodec)
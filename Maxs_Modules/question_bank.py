@@ -0,0 +1,336 @@
+# - - - - - - - Imports - - - - - - -#
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+
+from Maxs_Modules.files import DATA_FOLDER
+from Maxs_Modules.debug import debug_message
+
+# - - - - - - - Variables - - - - - - -#
+
+QUESTION_BANK_FILE = DATA_FOLDER + "questions.db"
+
+# SQLite can only take so many parameters in one query, so the chosen questions are fetched in batches this big
+QUESTION_BANK_BATCH_SIZE = 500
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class QuestionBank:
+    """
+    A local store of every question downloaded from the API, so that games can be started without waiting on the
+    network (or without a network at all). Questions are stored once no matter how many times they are downloaded and
+    are indexed on their category, difficulty and type so that picking questions for a game only has to read the index.
+    """
+
+    def __init__(self, path: str = QUESTION_BANK_FILE) -> None:
+        """
+        Open the bank, creating it if it doesn't exist
+
+        @param path: The file the bank is stored in (Default: QUESTION_BANK_FILE)
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS questions (hash TEXT PRIMARY KEY, category TEXT NOT NULL, "
+                                "difficulty TEXT NOT NULL, type TEXT NOT NULL, data TEXT NOT NULL, "
+                                "added REAL NOT NULL)")
+
+        # The hash is part of each index so that leaving out played questions doesn't need to read the table. The game
+        # can filter on any of the category, difficulty and type, so each one starts an index. Filtering on the
+        # category and type but not the difficulty only uses the category part of questions_lookup.
+        self.connection.execute("CREATE INDEX IF NOT EXISTS questions_lookup ON questions (category, difficulty, type, "
+                                "hash)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS questions_difficulty ON questions (difficulty, type, hash)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS questions_type ON questions (type, hash)")
+
+        # The hashes of every question that has been played, so that they aren't played again
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen (hash TEXT PRIMARY KEY, served REAL NOT NULL) "
+                                "WITHOUT ROWID")
+        self.connection.commit()
+
+    def __enter__(self) -> "QuestionBank":
+        return self
+
+    def __exit__(self, *args: tuple) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the bank's file
+        """
+        self.connection.close()
+
+    def add_questions(self, questions: list) -> int:
+        """
+        Add questions from the API to the bank, any that are already in the bank are skipped
+
+        @param questions: The questions, as dicts in the same form as the API gives them
+        @return: How many of the questions were new
+        """
+        rows = []
+        now = time.time()
+
+        for question in questions:
+            try:
+                rows.append((get_question_hash(question), get_category_name(question["category"]),
+                             question["difficulty"], question["type"], json.dumps(question, ensure_ascii=False), now))
+            except (KeyError, TypeError, AttributeError):
+                debug_message(f"Not storing invalid question: {question}", "question_bank")
+
+        before = self.connection.total_changes
+        self.connection.executemany("INSERT OR IGNORE INTO questions VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+
+        added = self.connection.total_changes - before
+        debug_message(f"Stored {added} new questions of {len(questions)}", "question_bank")
+        return added
+
+    def get_questions(self, amount: int, category: str = None, difficulty: str = None, question_type: str = None,
+                      unseen: bool = False) -> list:
+        """
+        Pick random questions from the bank. Only the index is read to find the questions that match, then just the
+        ones picked are loaded.
+
+        @param amount: How many questions to pick
+        @param category: The category the questions must be in, as named in the game's settings (Default: None, any)
+        @param difficulty: The difficulty the questions must be, in the API's form (i.e. "easy") (Default: None, any)
+        @param question_type: The type the questions must be, in the API's form (i.e. "multiple") (Default: None,
+        any)
+        @param unseen: Leave out the questions that have been played, see add_seen() (Default: False)
+        @return: The questions as dicts in the same form as the API gives them, there can be fewer than the amount if
+        there aren't enough in the bank
+        """
+        where, parameters = create_filter(category, difficulty, question_type, unseen)
+        row_ids = [row[0] for row in self.connection.execute("SELECT rowid FROM questions" + where, parameters)]
+        chosen = random.sample(row_ids, min(amount, len(row_ids)))
+
+        # Load the chosen questions and keep them in the random order they were picked in
+        questions = {}
+        for start in range(0, len(chosen), QUESTION_BANK_BATCH_SIZE):
+            batch = chosen[start:start + QUESTION_BANK_BATCH_SIZE]
+            query = f"SELECT rowid, data FROM questions WHERE rowid IN ({', '.join('?' * len(batch))})"
+            for row_id, data in self.connection.execute(query, batch):
+                questions[row_id] = json.loads(data)
+
+        return [questions[row_id] for row_id in chosen]
+
+    def count_questions(self, category: str = None, difficulty: str = None, question_type: str = None) -> int:
+        """
+        Count the questions in the bank that match, see get_questions()
+
+        @param category: The category the questions must be in (Default: None, any)
+        @param difficulty: The difficulty the questions must be (Default: None, any)
+        @param question_type: The type the questions must be (Default: None, any)
+        @return: How many questions match
+        """
+        where, parameters = create_filter(category, difficulty, question_type)
+        return self.connection.execute("SELECT COUNT(*) FROM questions" + where, parameters).fetchone()[0]
+
+    def clear(self) -> None:
+        """
+        Remove every question from the bank, which questions have been played is kept (see clear_seen())
+        """
+        self.connection.execute("DELETE FROM questions")
+        self.connection.commit()
+        self.connection.execute("VACUUM")
+
+    def add_seen(self, hashes: list) -> None:
+        """
+        Remember that questions have been played
+
+        @param hashes: The hashes of the questions, see get_question_hash()
+        """
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO seen VALUES (?, ?)", [(hash_, now) for hash_ in hashes])
+        self.connection.commit()
+
+    def get_seen(self) -> set:
+        """
+        Gets the hashes of every question that has been played
+
+        @return: The hashes, see get_question_hash()
+        """
+        return {row[0] for row in self.connection.execute("SELECT hash FROM seen")}
+
+    def clear_seen(self) -> None:
+        """
+        Forget which questions have been played, so that they can be played again
+        """
+        self.connection.execute("DELETE FROM seen")
+        self.connection.commit()
+
+
+class QuestionSelection:
+    """
+    Collects the questions for a game from a number of places (i.e. the question bank and then the API), leaving out
+    any that have been played before or have already been picked. The questions that have been played are kept aside
+    to fill the game up if there aren't enough new ones.
+    """
+
+    def __init__(self, amount: int, seen: set, picked: set = None) -> None:
+        """
+        Creates an empty selection
+
+        @param amount: How many questions the game needs
+        @param seen: The hashes of the questions that have been played, see QuestionBank.get_seen()
+        @param picked: The hashes of the questions the game already has from another selection, these are left out
+        (Default: None)
+        """
+        self.amount = amount
+        self.seen = seen
+        self.picked = picked or set()
+
+        # Both keyed by the hash of the question
+        self.fresh = {}
+        self.repeats = {}
+
+    def add(self, questions: list) -> None:
+        """
+        Adds questions to the selection, stops taking new questions once there are enough
+
+        @param questions: The questions as dicts in the same form as the API gives them
+        """
+        for question in questions:
+            question_hash = get_question_hash(question)
+
+            if question_hash in self.picked:
+                continue
+
+            if question_hash in self.seen:
+                self.repeats.setdefault(question_hash, question)
+            elif len(self.fresh) < self.amount:
+                self.fresh.setdefault(question_hash, question)
+
+    def get_needed(self) -> int:
+        """
+        Works out how many more new questions the game needs
+
+        @return: The amount, 0 once there are enough
+        """
+        return self.amount - len(self.fresh)
+
+    def get_excluded(self) -> set:
+        """
+        Gets the questions that shouldn't be added, the played questions and the ones already picked
+
+        @return: Their hashes
+        """
+        return self.seen | self.picked | self.fresh.keys()
+
+    def get_questions(self) -> list:
+        """
+        Gets the questions picked for the game, topped up with played questions if there aren't enough new ones
+
+        @return: The questions as dicts in the same form as the API gives them
+        """
+        questions = list(self.fresh.values())
+        questions += list(self.repeats.values())[:self.get_needed()]
+        return questions
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def get_question_hash(question: dict) -> str:
+    """
+    Works out the hash a question is stored under, the same question downloaded again has the same hash
+
+    @param question: The question as a dict from the API
+    @return: The hash as a hex string
+    """
+    key = json.dumps([question["question"], question["correct_answer"]], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def get_category_name(category: str) -> str:
+    """
+    Converts a category from the API to the name used in the game's settings, the API puts a group in front of some
+    categories (i.e. "Entertainment: Books" is "Books")
+
+    @param category: The category from the API
+    @return: The category as named in the game's settings
+    """
+    return category.split(": ", 1)[-1]
+
+
+def load_bank_questions(amount: int, category: str = None, difficulty: str = None, question_type: str = None) -> list:
+    """
+    Picks random questions that match and haven't been played from the question bank, as the bank is only a cache an
+    empty list is given if it can't be read
+
+    @param amount: How many questions to pick
+    @param category: The category the questions must be in, as named in the game's settings (Default: None, any)
+    @param difficulty: The difficulty the questions must be, in the API's form (i.e. "easy") (Default: None, any)
+    @param question_type: The type the questions must be, in the API's form (i.e. "multiple") (Default: None, any)
+    @return: The questions as dicts in the same form as the API gives them, there can be fewer than the amount
+    """
+    try:
+        with QuestionBank() as bank:
+            questions = bank.get_questions(amount, category, difficulty, question_type, unseen=True)
+    except sqlite3.Error as bank_error:
+        debug_message(f"Couldn't read the question bank: {bank_error}", "question_bank")
+        return []
+
+    debug_message(f"Got {len(questions)} of {amount} questions from the question bank", "question_bank")
+    return questions
+
+
+def load_seen_questions() -> set:
+    """
+    Gets the hashes of every question that has been played from the question bank, as the bank is only a cache an empty
+    set is given if it can't be read
+
+    @return: The hashes, see get_question_hash()
+    """
+    try:
+        with QuestionBank() as bank:
+            return bank.get_seen()
+    except sqlite3.Error as bank_error:
+        debug_message(f"Couldn't read the played questions: {bank_error}", "question_bank")
+        return set()
+
+
+def remember_questions(questions: list) -> None:
+    """
+    Remembers in the question bank that the questions have been played, so that later games pick new ones
+
+    @param questions: The questions as dicts in the same form as the API gives them
+    """
+    try:
+        with QuestionBank() as bank:
+            bank.add_seen([get_question_hash(question) for question in questions])
+    except sqlite3.Error as bank_error:
+        debug_message(f"Couldn't store the played questions: {bank_error}", "question_bank")
+
+
+def create_filter(category: str | None, difficulty: str | None, question_type: str | None,
+                  unseen: bool = False) -> tuple:
+    """
+    Creates the WHERE part of a query on the questions, anything that is None isn't filtered on
+
+    @param category: The category the questions must be in
+    @param difficulty: The difficulty the questions must be
+    @param question_type: The type the questions must be
+    @param unseen: Leave out the questions that have been played (Default: False)
+    @return: The WHERE clause (an empty string if there is nothing to filter on) and its parameters
+    """
+    conditions = []
+    parameters = []
+
+    for column, value in (("category", category), ("difficulty", difficulty), ("type", question_type)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+
+    if unseen:
+        conditions.append("hash NOT IN (SELECT hash FROM seen)")
+
+    if not conditions:
+        return "", parameters
+
+    return " WHERE " + " AND ".join(conditions), parameters
@@ -0,0 +1,239 @@
+# - - - - - - - Imports - - - - - - -#
+import json
+import mmap
+import bisect
+import random
+import struct
+import itertools
+
+from Maxs_Modules.question_bank import get_question_hash, get_category_name
+from Maxs_Modules.debug import debug_message
+
+# - - - - - - - Variables - - - - - - -#
+
+# A pack is laid out as:
+#   header: magic, version, index count, record count, where the offset table starts, where the index starts
+#   records: each question as UTF-8 JSON, one after the other
+#   offset table: where each record starts, plus where the last one ends
+#   id sections: for each (category, difficulty, type) the sorted ids of its records
+#   index: for each section its key, how many ids it has and where they start
+# Everything is little endian so that it can be read straight out of the memory map
+PACK_MAGIC = b"QPAK"
+PACK_VERSION = 1
+PACK_HEADER_FORMAT = "<4sHHIQQ"
+PACK_HEADER_SIZE = struct.calcsize(PACK_HEADER_FORMAT)
+PACK_OFFSET_FORMAT = "<Q"
+PACK_OFFSET_SIZE = struct.calcsize(PACK_OFFSET_FORMAT)
+PACK_ID_FORMAT = "<I"
+PACK_ID_SIZE = struct.calcsize(PACK_ID_FORMAT)
+PACK_KEY_LENGTH_FORMAT = "<H"
+PACK_SECTION_FORMAT = "<IQ"
+
+# Separates the category, difficulty and type in a section's key, none of them contain it
+PACK_KEY_SEPARATOR = "\x1f"
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class QuestionPack:
+    """
+    Reads an offline question pack (see create_pack()) through a memory map, so that opening a pack only reads its
+    index and picking questions only reads the questions that are picked no matter how big the pack is.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens the pack and reads its index
+
+        @param path: The file of the pack
+        @raise ValueError: If the file isn't a pack of this version
+        """
+        self.file = open(path, "rb")
+
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, index_count, self.record_count, self.offsets_start, index_start = \
+                struct.unpack_from(PACK_HEADER_FORMAT, self.data)
+        except (ValueError, struct.error):
+            self.file.close()
+            raise ValueError(f"{path} is not a question pack")
+
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {PACK_VERSION} question pack")
+
+        # The count and start of the ids of each section, keyed by (category, difficulty, type)
+        self.sections = {}
+
+        position = index_start
+        for _ in range(index_count):
+            key_length = struct.unpack_from(PACK_KEY_LENGTH_FORMAT, self.data, position)[0]
+            position += struct.calcsize(PACK_KEY_LENGTH_FORMAT)
+
+            key = tuple(self.data[position:position + key_length].decode("utf-8").split(PACK_KEY_SEPARATOR))
+            position += key_length
+
+            self.sections[key] = struct.unpack_from(PACK_SECTION_FORMAT, self.data, position)
+            position += struct.calcsize(PACK_SECTION_FORMAT)
+
+    def __enter__(self) -> "QuestionPack":
+        return self
+
+    def __exit__(self, *args: tuple) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the pack's file
+        """
+        self.data.close()
+        self.file.close()
+
+    def get_sections(self, category: str = None, difficulty: str = None, question_type: str = None) -> list:
+        """
+        Finds the sections that match, anything that is None matches every section
+
+        @param category: The category the questions must be in, as named in the game's settings (Default: None, any)
+        @param difficulty: The difficulty the questions must be, in the API's form (i.e. "easy") (Default: None, any)
+        @param question_type: The type the questions must be, in the API's form (i.e. "multiple") (Default: None,
+        any)
+        @return: The count and start of the ids of each matching section
+        """
+        wanted = (category, difficulty, question_type)
+
+        return [section for key, section in self.sections.items()
+                if all(value is None or value == part for value, part in zip(wanted, key))]
+
+    def count_questions(self, category: str = None, difficulty: str = None, question_type: str = None) -> int:
+        """
+        Count the questions in the pack that match, see get_sections()
+
+        @param category: The category the questions must be in (Default: None, any)
+        @param difficulty: The difficulty the questions must be (Default: None, any)
+        @param question_type: The type the questions must be (Default: None, any)
+        @return: How many questions match
+        """
+        return sum(count for count, _ in self.get_sections(category, difficulty, question_type))
+
+    def get_questions(self, amount: int, category: str = None, difficulty: str = None,
+                      question_type: str = None) -> list:
+        """
+        Picks random questions from the pack. The matching sections are treated as one list of ids and positions in it
+        are picked, so only the ids and records of the picked questions are read.
+
+        @param amount: How many questions to pick
+        @param category: The category the questions must be in (Default: None, any)
+        @param difficulty: The difficulty the questions must be (Default: None, any)
+        @param question_type: The type the questions must be (Default: None, any)
+        @return: The questions as dicts in the same form as the API gives them, there can be fewer than the amount if
+        there aren't enough in the pack
+        """
+        sections = self.get_sections(category, difficulty, question_type)
+        ends = list(itertools.accumulate(count for count, _ in sections))
+        total = ends[-1] if ends else 0
+
+        questions = []
+        for position in random.sample(range(total), min(amount, total)):
+
+            # Find the section the position is in and then the id at that position in the section
+            section = bisect.bisect_right(ends, position)
+            count, ids_start = sections[section]
+            index = position - (ends[section] - count)
+
+            record = struct.unpack_from(PACK_ID_FORMAT, self.data, ids_start + index * PACK_ID_SIZE)[0]
+            questions.append(self.read_record(record))
+
+        return questions
+
+    def read_record(self, record: int) -> dict:
+        """
+        Reads a question out of the pack
+
+        @param record: The id of the question's record
+        @return: The question as a dict in the same form as the API gives them
+        """
+        start_position = self.offsets_start + record * PACK_OFFSET_SIZE
+        start = struct.unpack_from(PACK_OFFSET_FORMAT, self.data, start_position)[0]
+        end = struct.unpack_from(PACK_OFFSET_FORMAT, self.data, start_position + PACK_OFFSET_SIZE)[0]
+
+        return json.loads(self.data[start:end])
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def create_pack(questions: list, path: str) -> int:
+    """
+    Writes questions to a pack that can be read by QuestionPack, any duplicate questions are only written once
+
+    @param questions: The questions as dicts in the same form as the API gives them
+    @param path: The file to write the pack to, it is replaced if it exists
+    @return: How many questions were written
+    """
+    records = []
+    hashes = set()
+
+    # The ids of the records in each section, keyed by (category, difficulty, type)
+    sections = {}
+
+    for question in questions:
+        question_hash = get_question_hash(question)
+        if question_hash in hashes:
+            continue
+        hashes.add(question_hash)
+
+        key = (get_category_name(question["category"]), question["difficulty"], question["type"])
+        sections.setdefault(key, []).append(len(records))
+        records.append(json.dumps(question, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    with open(path, "wb") as file:
+
+        # Space for the header, it is written last once the positions are known
+        file.write(bytes(PACK_HEADER_SIZE))
+        position = PACK_HEADER_SIZE
+
+        offsets = []
+        for record in records:
+            offsets.append(position)
+            file.write(record)
+            position += len(record)
+        offsets.append(position)
+
+        offsets_start = position
+        file.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        position += len(offsets) * PACK_OFFSET_SIZE
+
+        ids_starts = {}
+        for key, ids in sections.items():
+            ids_starts[key] = position
+            file.write(struct.pack(f"<{len(ids)}I", *ids))
+            position += len(ids) * PACK_ID_SIZE
+
+        index_start = position
+        for key, ids in sections.items():
+            key_bytes = PACK_KEY_SEPARATOR.join(key).encode("utf-8")
+            file.write(struct.pack(PACK_KEY_LENGTH_FORMAT, len(key_bytes)) + key_bytes)
+            file.write(struct.pack(PACK_SECTION_FORMAT, len(ids), ids_starts[key]))
+
+        file.seek(0)
+        file.write(struct.pack(PACK_HEADER_FORMAT, PACK_MAGIC, PACK_VERSION, len(sections), len(records), offsets_start,
+                               index_start))
+
+    debug_message(f"Wrote {len(records)} questions in {len(sections)} sections to {path}", "question_pack")
+    return len(records)
+
+
+def convert_json_to_pack(json_path: str, pack_path: str) -> int:
+    """
+    Converts a JSON dump of questions from the API (i.e. ProgramData/questions.json) to a pack
+
+    @param json_path: The JSON file, either a whole API response or just its list of results
+    @param pack_path: The file to write the pack to
+    @return: How many questions were written
+    """
+    with open(json_path, "r", encoding="utf-8") as file:
+        questions = json.load(file)
+
+    if isinstance(questions, dict):
+        questions = questions["results"]
+
+    return create_pack(questions, pack_path)
@@ -0,0 +1,168 @@
+# - - - - - - - Imports - - - - - - -#
+import time
+import queue
+import threading
+import collections
+
+import requests
+
+from Maxs_Modules.network import api_get_questions
+from Maxs_Modules.debug import debug_message
+
+# - - - - - - - Variables - - - - - - -#
+
+# How many question sets are kept ready for each combination of settings
+PREFETCH_BUFFER_SIZE = 2
+
+# How many combinations of settings have sets kept ready, the least recently used is dropped past this
+PREFETCH_MAX_KEYS = 4
+
+# The API only allows one request every 5 seconds from each IP, so the worker waits this long between requests
+PREFETCH_INTERVAL = 5
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class QuestionPrefetcher:
+    """
+    Downloads the questions for the next game on a background thread while the current game is played, so that starting
+    a new game (or playing again) doesn't have to wait for the API. The sets are kept in a small buffer for each
+    combination of settings (the key), see get_prefetch_key().
+    """
+
+    def __init__(self, buffer_size: int = PREFETCH_BUFFER_SIZE, max_keys: int = PREFETCH_MAX_KEYS,
+                 interval: float = PREFETCH_INTERVAL) -> None:
+        """
+        Creates the prefetcher, the worker thread is only started when the first set is requested
+
+        @param buffer_size: How many sets to keep ready for each key (Default: PREFETCH_BUFFER_SIZE)
+        @param max_keys: How many keys to keep sets for (Default: PREFETCH_MAX_KEYS)
+        @param interval: The seconds to wait between requests to the API (Default: PREFETCH_INTERVAL)
+        """
+        self.buffer_size = buffer_size
+        self.max_keys = max_keys
+        self.interval = interval
+
+        # The sets that are ready, in order of the key last used
+        self.buffers = collections.OrderedDict()
+
+        # The keys waiting to be fetched, a key is only queued once at a time
+        self.requests = queue.Queue()
+        self.pending = set()
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_fetch = 0
+
+    def request(self, key: tuple) -> None:
+        """
+        Fills the buffer for the key in the background, does nothing if it is already full or being filled
+
+        @param key: The key of the settings to fetch sets for, see get_prefetch_key()
+        """
+        with self.lock:
+            if key in self.pending or len(self.buffers.get(key, ())) >= self.buffer_size:
+                return
+
+            self.pending.add(key)
+
+            # The game has usually just fetched its own questions, so give the API time before fetching more
+            self.last_fetch = max(self.last_fetch, time.time())
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name="QuestionPrefetcher")
+                self.thread.start()
+
+        self.requests.put(key)
+
+    def take(self, key: tuple) -> list | None:
+        """
+        Takes a ready set for the key out of the buffer, call request() afterwards to replace it
+
+        @param key: The key of the settings, see get_prefetch_key()
+        @return: The questions as given by the API, or None if there isn't a set ready
+        """
+        with self.lock:
+            buffer = self.buffers.get(key)
+            questions = buffer.popleft() if buffer else None
+
+            if buffer is not None:
+                self.buffers.move_to_end(key)
+
+        debug_message(f"Prefetched questions for {key}: {'ready' if questions else 'not ready'}", "prefetch")
+        return questions
+
+    def run(self) -> None:
+        """
+        The worker thread, fetches a set for each queued key until its buffer is full
+        """
+        while True:
+            key = self.requests.get()
+
+            # Wait for the API to allow another request
+            wait = self.last_fetch + self.interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            questions = []
+            try:
+                questions = api_get_questions(*key, quiet=True)
+            except requests.RequestException as fetch_error:
+                debug_message(f"Failed to prefetch questions for {key}: {fetch_error}", "prefetch")
+            except Exception as fetch_error:
+                # Anything else (i.e. the API answering with something unexpected) mustn't stop the worker, as every
+                # later request would then be ignored
+                debug_message(f"Unexpected error prefetching questions for {key}: {fetch_error!r}", "prefetch")
+            finally:
+                self.last_fetch = time.time()
+
+                with self.lock:
+                    self.pending.discard(key)
+
+            with self.lock:
+                # Only keep full sets, a short one means the API couldn't give what the settings ask for so it isn't
+                # asked again
+                if not isinstance(questions, list) or len(questions) != key[0]:
+                    continue
+
+                self.add_questions(key, questions)
+
+                # Keep going until the buffer is full (unless it has been requested again while this set was added)
+                if len(self.buffers.get(key, ())) < self.buffer_size and key not in self.pending:
+                    self.pending.add(key)
+                    self.requests.put(key)
+
+    def add_questions(self, key: tuple, questions: list) -> None:
+        """
+        Adds a set to the buffer for the key, dropping the buffer of the least recently used key if there are too many.
+        The lock must be held.
+
+        @param key: The key of the settings the set was fetched for
+        @param questions: The questions as given by the API
+        """
+        buffer = self.buffers.setdefault(key, collections.deque(maxlen=self.buffer_size))
+        buffer.append(questions)
+        self.buffers.move_to_end(key)
+
+        while len(self.buffers) > self.max_keys:
+            self.buffers.popitem(last=False)
+
+        debug_message(f"Prefetched a set of questions for {key}, {len(buffer)} ready", "prefetch")
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def get_prefetch_key(amount: int, category: int | None, difficulty: str, question_type: str | None) -> tuple:
+    """
+    Creates the key for a combination of settings, in the same order as the arguments of api_get_questions()
+
+    @param amount: How many questions
+    @param category: The category of the questions, in the API's form (None for any)
+    @param difficulty: The difficulty of the questions
+    @param question_type: The type of the questions, in the API's form (None for any)
+    @return: The key
+    """
+    return amount, category, difficulty, question_type
+
+
+question_prefetcher = QuestionPrefetcher()
@@ -0,0 +1,245 @@
+# - - - - - - - Imports - - - - - - -#
+import base64
+import struct
+import hashlib
+
+from Maxs_Modules.network import QuizLimitExceeded
+
+# - - - - - - - Variables - - - - - - -#
+
+# Added to the client's key to make the accept key in the handshake, fixed by RFC 6455
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# A WebSocket connection starts with an HTTP GET, as a frame header this would be a length far over MAX_FRAME_SIZE so
+# it can't be mistaken for a normal client
+WEBSOCKET_REQUEST_START = b"GET "
+
+# The most the HTTP request of the handshake can be, browsers send well under this
+WEBSOCKET_MAX_REQUEST_SIZE = 8192
+
+WEBSOCKET_OPCODE_CONTINUATION = 0x0
+WEBSOCKET_OPCODE_TEXT = 0x1
+WEBSOCKET_OPCODE_BINARY = 0x2
+WEBSOCKET_OPCODE_CLOSE = 0x8
+WEBSOCKET_OPCODE_PING = 0x9
+WEBSOCKET_OPCODE_PONG = 0xA
+
+WEBSOCKET_FIN = 0x80
+WEBSOCKET_MASKED = 0x80
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class QuizWebSocketError(QuizLimitExceeded):
+    """
+    Raised when a browser breaks the WebSocket protocol (i.e. sends a frame that isn't masked), the server closes the
+    connection in the same way as when a client goes over a limit
+    """
+
+
+class QuizWebSocketBuffer:
+    """
+    The WebSocket version of QuizMessageBuffer, reassembles the frames sent by a browser into messages. Browsers mask
+    everything they send and can split a message over many frames, control frames (ping, pong and close) can arrive
+    in the middle of a split message so they are taken out on their own.
+    """
+
+    def __init__(self, max_size: int = None) -> None:
+        """
+        Creates an empty buffer
+
+        @param max_size: The biggest message in bytes that can be taken out, anything bigger raises QuizLimitExceeded
+        as soon as its header arrives (Default: None, no limit)
+        """
+        self.buffer = bytearray()
+        self.max_size = max_size
+
+        # The opcode and the parts so far of a message split over many frames
+        self.message_opcode = None
+        self.message_parts = []
+        self.message_size = 0
+
+    def feed(self, data: bytes) -> list:
+        """
+        Adds the received data to the buffer and takes out every message and control frame that is now complete
+
+        @param data: The data received from the socket
+        @return: A list of (opcode, payload) tuples in the order they were sent, split messages are joined and given
+        the opcode of their first frame
+        @raise QuizLimitExceeded: If a message is over the max size
+        @raise QuizWebSocketError: If a frame isn't masked
+        """
+        self.buffer += data
+
+        frames = []
+        offset = 0
+
+        while True:
+            frame = self.read_frame(offset)
+            if frame is None:
+                break
+
+            final, opcode, payload, offset = frame
+
+            # Control frames can't be split, so are handed out straight away
+            if opcode >= WEBSOCKET_OPCODE_CLOSE:
+                frames.append((opcode, payload))
+                continue
+
+            if opcode != WEBSOCKET_OPCODE_CONTINUATION:
+                self.message_opcode = opcode
+                self.message_parts = []
+                self.message_size = 0
+
+            self.message_parts.append(payload)
+            self.message_size += len(payload)
+            if self.max_size is not None and self.message_size > self.max_size:
+                raise QuizLimitExceeded(f"Message is over the limit of {self.max_size} bytes")
+
+            if final:
+                frames.append((self.message_opcode, b"".join(self.message_parts)))
+                self.message_parts = []
+
+        # Remove the frames that have been taken out in one go
+        if offset:
+            del self.buffer[:offset]
+
+        return frames
+
+    def read_frame(self, offset: int) -> tuple | None:
+        """
+        Reads the frame starting at the offset in the buffer
+
+        @param offset: Where the frame starts
+        @return: If it is the final frame of the message, the opcode, the unmasked payload and where the next frame
+        starts. None if the whole frame hasn't arrived yet
+        @raise QuizLimitExceeded: If the frame is over the max size
+        @raise QuizWebSocketError: If the frame isn't masked
+        """
+        if len(self.buffer) - offset < 2:
+            return None
+
+        first, second = self.buffer[offset], self.buffer[offset + 1]
+
+        # RFC 6455 says everything a client sends must be masked, and the server must close the connection if it isn't
+        if not second & WEBSOCKET_MASKED:
+            raise QuizWebSocketError("WebSocket frame isn't masked")
+
+        size = second & 0x7F
+        header_end = offset + 2
+
+        # Bigger sizes are sent after the first two bytes
+        if size == 126:
+            if len(self.buffer) < header_end + 2:
+                return None
+            size = struct.unpack_from("!H", self.buffer, header_end)[0]
+            header_end += 2
+        elif size == 127:
+            if len(self.buffer) < header_end + 8:
+                return None
+            size = struct.unpack_from("!Q", self.buffer, header_end)[0]
+            header_end += 8
+
+        if self.max_size is not None and size > self.max_size:
+            raise QuizLimitExceeded(f"Message of {size} bytes is over the limit of {self.max_size}")
+
+        mask = bytes(self.buffer[header_end:header_end + 4])
+        header_end += 4
+
+        end = header_end + size
+        if end > len(self.buffer):
+            return None
+
+        payload = unmask_payload(bytes(self.buffer[header_end:end]), mask)
+
+        return bool(first & WEBSOCKET_FIN), first & 0x0F, payload, end
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def create_handshake_response(request: bytes) -> bytes | None:
+    """
+    Creates the response to the HTTP request that opens a WebSocket connection
+
+    @param request: The request, up to and including the blank line at the end of its headers
+    @return: The 101 Switching Protocols response, or None if the request isn't a valid WebSocket request
+    """
+    try:
+        lines = request.decode("latin-1").split("\r\n")
+    except UnicodeDecodeError:
+        return None
+
+    if not lines[0].startswith("GET "):
+        return None
+
+    # Header names are case-insensitive
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    key = headers.get("sec-websocket-key")
+    if headers.get("upgrade", "").lower() != "websocket" or not key:
+        return None
+
+    return ("HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {create_accept_key(key)}\r\n\r\n").encode("latin-1")
+
+
+def create_accept_key(key: str) -> str:
+    """
+    Works out the Sec-WebSocket-Accept for the client's Sec-WebSocket-Key, which shows the client that the server
+    understood the request
+
+    @param key: The client's key
+    @return: The accept key
+    """
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def create_frame_header(size: int, opcode: int) -> bytes:
+    """
+    Creates the header of an unmasked frame (servers don't mask what they send) holding a whole message
+
+    @param size: The size of the payload in bytes
+    @param opcode: The opcode of the frame
+    @return: The header, send the payload straight after it
+    """
+    first = WEBSOCKET_FIN | opcode
+
+    if size < 126:
+        return struct.pack("!BB", first, size)
+
+    if size < 1 << 16:
+        return struct.pack("!BBH", first, 126, size)
+
+    return struct.pack("!BBQ", first, 127, size)
+
+
+def create_frame(payload: bytes, opcode: int) -> bytes:
+    """
+    Creates an unmasked frame holding a whole message, see create_frame_header()
+
+    @param payload: The payload of the frame
+    @param opcode: The opcode of the frame
+    @return: The frame
+    """
+    return create_frame_header(len(payload), opcode) + payload
+
+
+def unmask_payload(payload: bytes, mask: bytes) -> bytes:
+    """
+    Removes the mask from a payload sent by a client, each byte is XORed with the byte of the mask at the same
+    position. This is done as one big int rather than byte by byte, which is much faster for large messages.
+
+    @param payload: The masked payload
+    @param mask: The 4 byte mask
+    @return: The payload
+    """
+    repeats, extra = divmod(len(payload), 4)
+    full_mask = mask * repeats + mask[:extra]
+
+    unmasked = int.from_bytes(payload, "big") ^ int.from_bytes(full_mask, "big")
+    return unmasked.to_bytes(len(payload), "big")
@@ -0,0 +1,95 @@
+# - - - - - - - Imports - - - - - - -#
+import os
+import sys
+import json
+import random
+import timeit
+
+# Allow running from anywhere by adding the root of the project to the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from Maxs_Modules.network import QuizMessage, QuizStateTracker, MESSAGE_CODECS, COMPRESSION_THRESHOLD  # noqa: E402
+
+# - - - - - - - Variables - - - - - - -#
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ProgramData", "questions.json")
+PLAYERS = 8
+REPEATS = 200
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def create_user(name: str, questions: int) -> dict:
+    """
+    Creates the save data of a user that has answered the given number of questions
+
+    @param name: The name of the user
+    @param questions: How many questions the user has answered
+    @return: The user as it would be in the game's save data
+    """
+    answers = [random.choice(["Correct", "Incorrect", "Missed"]) for _ in range(questions)]
+    times = [round(random.uniform(0.5, 10), 2) for _ in range(questions)]
+
+    return {"player_type": "User", "name": name, "colour": None, "icon": None, "points": answers.count("Correct"),
+            "correct": answers.count("Correct"), "incorrect": answers.count("Incorrect"), "streak": 0,
+            "highest_streak": 3, "questions_missed": answers.count("Missed"), "answers": answers, "times": times,
+            "questions_answered": questions, "average_time": sum(times) / max(questions, 1),
+            "average_time_correct": 4.2, "average_time_incorrect": 6.1, "average_time_missed": 10.0,
+            "accuracy": 50.0, "is_host": False, "is_connected": True, "has_answered": True}
+
+
+def create_messages() -> dict:
+    """
+    Creates the messages sent during a game with all the questions from the questions file: the first sync_game a
+    client gets and a sync_players patch for the last question
+
+    @return: The messages for each name
+    """
+    with open(QUESTIONS_FILE, encoding="utf-8") as file:
+        questions = json.load(file)["results"]
+
+    state = {"questions": questions, "current_question": 0, "host_a_server": True, "time_limit": 10,
+             "users": [create_user(f"Player {index}", len(questions)) for index in range(PLAYERS)], "bots": []}
+
+    tracker = QuizStateTracker()
+    tracker.update(state)
+    snapshot = tracker.snapshot()
+
+    # Simulate the last question being answered
+    revision = tracker.revision
+    for user in state["users"]:
+        user["answers"][-1] = "Correct"
+        user["times"][-1] = 1.5
+        user["points"] += 1
+    tracker.update(state, ["users"])
+
+    return {
+        "sync_game": QuizMessage(snapshot, "127.0.0.1", "127.0.0.1", "sync_game"),
+        "sync_players": QuizMessage(tracker.patch(revision, ["users"]), "127.0.0.1", "127.0.0.1", "sync_players"),
+        "move_on": QuizMessage("synced so start game", "127.0.0.1", "127.0.0.1", "move_on")
+    }
+
+
+def main() -> None:
+    """
+    Encode and decode each message with each codec and print the size (with and without compression) and the time
+    taken
+    """
+    random.seed(0)
+
+    print(f"{'message':<14}{'codec':<8}{'bytes':>9}{'compressed':>12}{'encode us':>12}{'decode us':>12}")
+
+    for name, message in create_messages().items():
+        for codec in MESSAGE_CODECS:
+            data = message.to_bytes(codec)
+            compressed = message.to_frame(codec, COMPRESSION_THRESHOLD)
+
+            encode_time = timeit.timeit(lambda: message.to_bytes(codec), number=REPEATS) / REPEATS
+            decode_time = timeit.timeit(lambda: QuizMessage(None, None, None, None).from_bytes(data),
+                                        number=REPEATS) / REPEATS
+
+            print(f"{name:<14}{codec:<8}{len(data):>9}{len(compressed):>12}{encode_time * 1e6:>12.1f}"
+                  f"{decode_time * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
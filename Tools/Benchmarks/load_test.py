@@ -0,0 +1,356 @@
+# - - - - - - - Imports - - - - - - -#
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+# Allow running from anywhere by adding the root of the project to the path
+ROOT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, ROOT_FOLDER)
+
+import game  # noqa: E402
+from Maxs_Modules.network import QuizMessage, QuizMessageBuffer, get_free_port  # noqa: E402
+
+# - - - - - - - Variables - - - - - - -#
+QUESTIONS_FILE = os.path.join(ROOT_FOLDER, "ProgramData", "questions.json")
+HOST = "127.0.0.1"
+
+# How long to wait for the clients to join or answer before giving up
+JOIN_TIMEOUT = 30
+ANSWER_TIMEOUT = 30
+
+
+# - - - - - - - Classes - - - - - - - -#
+
+class CountingBuffer(QuizMessageBuffer):
+    """
+    A QuizMessageBuffer that counts the bytes received, before they are decompressed
+    """
+
+    def __init__(self) -> None:
+        """
+        Creates an empty buffer
+        """
+        super().__init__()
+        self.bytes_received = 0
+
+    def feed(self, data: bytes) -> list:
+        """
+        Count the data and then split out the frames, see QuizMessageBuffer.feed()
+
+        @param data: The data received from the socket
+        @return: A list of the complete message payloads
+        """
+        self.bytes_received += len(data)
+        return super().feed(data)
+
+
+class TimedClient:
+    """
+    Records when the client was told it has joined and counts the bytes it receives. Used with one of the client
+    classes, see TimedQuizGameClient and TimedAsyncQuizGameClient.
+    """
+
+    def __init__(self, host: str, port: int):
+        """
+        Initialise the client and swap its buffer for one that counts the bytes
+
+        @param host: The host ip to connect to
+        @param port: The port to connect to
+        """
+        super().__init__(host, port)
+
+        self.recieved_bytes = CountingBuffer()
+        self.joined_at = None
+        self.joined = threading.Event()
+
+    def handle_data_received(self, sock: object, key_data: object, recv_data: bytes) -> None:
+        """
+        Record the join and then handle the message as normal
+
+        @param sock: The socket the data came from
+        @param key_data: The key data for the socket
+        @param recv_data: The data of one complete message from the server
+        """
+        # The server picks a codec once the client has joined, so use that as the join being accepted
+        if self.joined_at is None:
+            message = QuizMessage(None, None, None, None).from_bytes(recv_data)
+            if message.message_type in ("set_codec", "set_compression"):
+                self.joined_at = time.perf_counter()
+                self.joined.set()
+
+        super().handle_data_received(sock, key_data, recv_data)
+
+
+class TimedQuizGameClient(TimedClient, game.QuizGameClient):
+    """
+    QuizGameClient that records its timings
+    """
+
+
+class TimedAsyncQuizGameClient(TimedClient, game.AsyncQuizGameClient):
+    """
+    AsyncQuizGameClient that records its timings
+    """
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Gets the value at the percentile using the nearest rank
+
+    @param values: The values (don't need to be sorted)
+    @param percent: The percentile (0 - 100)
+    @return: The value, or 0 if there are no values
+    """
+    if not values:
+        return 0
+
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def format_latencies(name: str, values: list) -> str:
+    """
+    Formats the percentiles of the latencies as a line of the report
+
+    @param name: What the latencies are of
+    @param values: The latencies in seconds
+    @return: The line of the report
+    """
+    return (f"{name:<24} p50 {percentile(values, 50) * 1000:8.1f}ms  p95 {percentile(values, 95) * 1000:8.1f}ms  "
+            f"p99 {percentile(values, 99) * 1000:8.1f}ms  max {max(values, default=0) * 1000:8.1f}ms")
+
+
+def run_client(client: object, index: int, arguments: argparse.Namespace, results: dict) -> None:
+    """
+    Play the game as one player: join, then answer every question after a random delay and wait for the server to
+    move on. Records the times that the latencies are worked out from.
+
+    @param client: The client to play as
+    @param index: The number of the client, used for the unique name
+    @param arguments: The harness arguments
+    @param results: Where to store the timings, keyed by the index
+    """
+    quiz = game.Game()
+    user = game.User()
+    user.name = f"Load {index}"
+    quiz.users = [user]
+    quiz.current_user_playing_net_name = user.name
+    quiz.backend = client
+
+    client.game = quiz
+    client.running = True
+    threading.Thread(target=client.run, daemon=True).start()
+
+    timings = {"join": None, "answered": [], "moved_on": [], "bytes": 0, "error": None}
+    results[index] = timings
+
+    # Join the game
+    quiz.prepare_save_data()
+    join_start = time.perf_counter()
+    client.send_message(client.client, quiz.save_data["users"][0], "client_join")
+    quiz.convert_all_from_save_data()
+
+    if not client.joined.wait(JOIN_TIMEOUT):
+        timings["error"] = client.error or "Timed out joining"
+        return
+    timings["join"] = client.joined_at - join_start
+
+    # Wait for the game to start
+    if not client.wait_for_move_on(JOIN_TIMEOUT):
+        timings["error"] = client.error or "Timed out waiting for the game to start"
+        return
+
+    for _ in range(arguments.questions):
+        # Think about the answer
+        time.sleep(max(0.0, random.gauss(arguments.latency, arguments.jitter)))
+
+        # Answer the question in the same way as Game.question() and Game.next_question()
+        me = quiz.users[quiz.current_user_playing]
+        me.answers.append(random.choice(["Correct", "Incorrect"]))
+        me.times.append(arguments.latency)
+        me.has_answered = True
+
+        timings["answered"].append(time.perf_counter())
+        client.send_self()
+
+        if not client.wait_for_move_on(ANSWER_TIMEOUT):
+            timings["error"] = client.error or "Timed out waiting to move on"
+            return
+        timings["moved_on"].append(time.perf_counter())
+
+        quiz.users[quiz.current_user_playing].has_answered = False
+        client.send_self()
+
+    timings["bytes"] = client.recieved_bytes.bytes_received
+    client.close_connection(client.client)
+
+
+def run_clients(port: int, arguments: argparse.Namespace, result_queue: multiprocessing.Queue) -> None:
+    """
+    Run all the simulated clients, this is run in its own process so that their CPU time isn't counted as the
+    server's
+
+    @param port: The port of the server
+    @param arguments: The harness arguments
+    @param result_queue: Where to put the timings once every client has finished
+    """
+    client_type = TimedAsyncQuizGameClient if arguments.engine == "async" else TimedQuizGameClient
+    results = {}
+    threads = []
+
+    for index in range(arguments.clients):
+        client = client_type(HOST, port)
+        thread = threading.Thread(target=run_client, args=(client, index, arguments, results), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    result_queue.put(results)
+
+
+def run_host(arguments: argparse.Namespace) -> None:
+    """
+    Host a game in this process and play it against the simulated clients, then print the report
+
+    @param arguments: The harness arguments
+    """
+    with open(QUESTIONS_FILE, encoding="utf-8") as file:
+        questions = json.load(file)["results"]
+
+    # Set up the host in the same way as Game.wait_for_players()
+    host = game.Game()
+    host_user = game.User()
+    host_user.name = "Host"
+    host.users = [host_user]
+    host.users[0].is_host = True
+    host.users[0].is_connected = True
+    host.questions = (questions * (arguments.questions // len(questions) + 1))[:arguments.questions]
+    host.bots = []
+    host.max_players = arguments.clients + 1
+    host.convert_all_from_save_data()
+
+    port = get_free_port(HOST, arguments.port)
+    server_type = game.AsyncQuizGameServer if arguments.engine == "async" else game.QuizGameServer
+    server = server_type(HOST, port)
+    server.game = host
+    server.running = True
+    host.backend = server
+    threading.Thread(target=server.run, daemon=True).start()
+
+    # Wait for the server to be ready to accept connections
+    time.sleep(0.2)
+
+    result_queue = multiprocessing.Queue()
+    clients = multiprocessing.Process(target=run_clients, args=(port, arguments, result_queue), daemon=True)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    clients.start()
+
+    # Wait for everyone to join
+    deadline = time.time() + JOIN_TIMEOUT
+    while len(host.users) < arguments.clients + 1 and time.time() < deadline:
+        time.sleep(0.01)
+    joined = len(host.users) - 1
+
+    # Start the game
+    host.game_started = True
+    server.sync_game()
+    server.send_message_to_all("synced so start game", "move_on")
+
+    late = 0
+    for question in range(arguments.questions):
+        host.users[0].answers.append("Correct")
+        host.users[0].times.append(0)
+        host.users[0].has_answered = True
+
+        # Wait on the server's answer barrier. The answers are counted rather than has_answered being checked, as a
+        # fast client can answer before its reset from the last question has arrived
+        with server.answer_condition:
+            answered = server.answer_condition.wait_for(
+                lambda: all(len(user.answers) > question for user in host.users), ANSWER_TIMEOUT)
+        if not answered:
+            late += 1
+
+        # Move on in the same way as Game.next_question()
+        host.users[0].has_answered = False
+        server.sync_players()
+        server.sync_bots()
+        server.send_message_to_all("Move on to: game finished / show scores / next question", "move_on")
+
+    results = result_queue.get()
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+    clients.join()
+    server.kill()
+
+    # Work out the latencies
+    join_latencies = [timings["join"] for timings in results.values() if timings["join"] is not None]
+    errors = [timings["error"] for timings in results.values() if timings["error"] is not None]
+    transition_latencies = []
+    for question in range(arguments.questions):
+        answered = [timings["answered"][question] for timings in results.values()
+                    if len(timings["moved_on"]) > question]
+        if not answered:
+            continue
+
+        # The server can only move on once the last answer is in, so measure from then
+        last_answer = max(answered)
+        for timings in results.values():
+            if len(timings["moved_on"]) > question:
+                transition_latencies.append(timings["moved_on"][question] - last_answer)
+
+    received = [timings["bytes"] for timings in results.values()]
+
+    print(f"Engine: {arguments.engine}, clients: {arguments.clients} ({joined} joined), questions: "
+          f"{arguments.questions}, answer latency: {arguments.latency}s +- {arguments.jitter}s")
+    print(format_latencies("Join", join_latencies))
+    print(format_latencies("Question transition", transition_latencies))
+    print(f"{'Bytes per client':<24} mean {sum(received) / max(len(received), 1):10.0f}  max {max(received, default=0)}")
+    print(f"{'Server CPU time':<24} {cpu_time:.3f}s ({cpu_time / max(arguments.questions, 1) * 1000:.1f}ms per "
+          f"question) over {wall_time:.2f}s")
+
+    if late:
+        print(f"Questions that timed out waiting for answers: {late}")
+
+    if errors:
+        print(f"Client errors ({len(errors)}): {sorted(set(errors))}")
+
+
+def main() -> None:
+    """
+    Parse the arguments and run the load test in a temporary folder, so the games don't touch the real user data
+    """
+    parser = argparse.ArgumentParser(description="Play a game against simulated clients and report how the server "
+                                                 "performed")
+    parser.add_argument("--clients", type=int, default=20, help="How many clients to simulate (Default: 20)")
+    parser.add_argument("--questions", type=int, default=10, help="How many questions to play (Default: 10)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Mean time in seconds each client takes to answer (Default: 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.1,
+                        help="Standard deviation of the time to answer in seconds (Default: 0.1)")
+    parser.add_argument("--engine", choices=("selector", "async"), default="selector",
+                        help="Which network engine to use (Default: selector)")
+    parser.add_argument("--port", type=int, default=4500, help="The port to start looking for a free port at "
+                                                               "(Default: 4500)")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, game.GAME_STORED_LOCATION))
+        os.chdir(folder)
+        run_host(arguments)
+
+
+if __name__ == "__main__":
+    main()
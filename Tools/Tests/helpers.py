@@ -0,0 +1,107 @@
+import socket
+import struct
+import time
+
+import game
+from Maxs_Modules.network import QuizMessage, QuizMessageBuffer
+from Maxs_Modules.websocket_network import unmask_payload
+
+# The example key from RFC 6455
+WEBSOCKET_REQUEST = (b"GET / HTTP/1.1\r\nHost: quiz\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+
+
+def create_question(text, category="Science: Computers", difficulty="easy", question_type="boolean"):
+    return {"category": category, "type": question_type, "difficulty": difficulty, "question": text,
+            "correct_answer": "True", "incorrect_answers": ["False"]}
+
+
+def create_game(host_name):
+    quiz = game.Game()
+    quiz.users = [game.User()]
+    quiz.users[0].load({"name": host_name})
+    quiz.users[0].is_host = True
+    quiz.users[0].is_connected = True
+    return quiz
+
+
+def connect(address, message_type, message, room=None):
+    sock = socket.create_connection(address, timeout=2)
+    send(sock, message_type, message, room)
+    return sock
+
+
+def send(sock, message_type, message, room=None):
+    quiz_message = QuizMessage(message, None, None, message_type)
+    quiz_message.room = room
+    sock.sendall(quiz_message.to_frame())
+
+
+def receive(sock, wait=0.3):
+    buffer = QuizMessageBuffer()
+    messages = []
+
+    sock.settimeout(wait)
+    try:
+        while data := sock.recv(65536):
+            for payload in buffer.feed(data):
+                messages.append(QuizMessage(None, None, None, None).from_bytes(payload))
+    except socket.timeout:
+        pass
+
+    return messages
+
+
+def wait_for(check, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting")
+        time.sleep(0.01)
+
+
+def create_masked_frame(payload, opcode, final=True):
+    mask = b"\x01\x02\x03\x04"
+    return bytes([(0x80 if final else 0) | opcode, 0x80 | len(payload)]) + mask + unmask_payload(payload, mask)
+
+
+def open_websocket(address):
+    sock = socket.create_connection(address, timeout=2)
+    sock.sendall(WEBSOCKET_REQUEST)
+
+    response = b""
+    while b"\r\n\r\n" not in response:
+        response += sock.recv(1)
+
+    return sock, response
+
+
+def send_websocket(sock, message_type, message, room=None):
+    quiz_message = QuizMessage(message, None, None, message_type)
+    quiz_message.room = room
+    sock.sendall(create_masked_frame(quiz_message.to_bytes(), 0x1))
+
+
+def receive_websocket(sock, wait=0.3):
+    data = b""
+
+    sock.settimeout(wait)
+    try:
+        while chunk := sock.recv(65536):
+            data += chunk
+    except socket.timeout:
+        pass
+
+    # The server's frames are never masked or split
+    frames = []
+    while data:
+        opcode, size, start = data[0] & 0x0F, data[1] & 0x7F, 2
+        if size == 126:
+            size, start = struct.unpack_from("!H", data, 2)[0], 4
+        elif size == 127:
+            size, start = struct.unpack_from("!Q", data, 2)[0], 10
+
+        frames.append((opcode, data[start:start + size]))
+        data = data[start + size:]
+
+    return frames
@@ -0,0 +1,45 @@
+import asyncio
+import socket
+import threading
+from unittest import TestCase
+
+from Maxs_Modules.async_network import AsyncQuizClient
+
+
+class ReconnectingClient(AsyncQuizClient):
+
+    def __init__(self, host, port):
+        super().__init__(host, port)
+        self.reconnecting = threading.Event()
+        self.reconnected = None
+
+    def handle_error(self, sock, key_data, error_response):
+        self.close_connection(sock)
+        self.reconnecting.set()
+        self.reconnected = self.reconnect()
+
+
+class TestAsyncNetwork(TestCase):
+
+    def test_reconnect_off_the_loop(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        client = ReconnectingClient(*listener.getsockname())
+        client.reconnect_attempts = 3
+        client.reconnect_delay = 0.2
+
+        thread = threading.Thread(target=client.run, daemon=True)
+        thread.start()
+        client.ready.wait(2)
+
+        # Lose the connection with nothing listening any more, so every attempt to reconnect fails
+        connection, _ = listener.accept()
+        listener.close()
+        connection.close()
+        self.assertTrue(client.reconnecting.wait(2))
+
+        # The loop still runs other work while the attempts are waited between
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), client.loop).result(0.1)
+
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(client.reconnected)
@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import game
+from Maxs_Modules.question_bank import QuestionBank, load_seen_questions, remember_questions
+from helpers import create_question
+
+
+class TestGame(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.folder.name)
+        os.makedirs(game.GAME_STORED_LOCATION)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    @patch("game.render_text")
+    @patch("game.question_prefetcher")
+    @patch("Maxs_Modules.network.api_get_questions")
+    def test_default_game_uses_question_bank(self, api_get_questions, question_prefetcher, render_text):
+        question_prefetcher.take.return_value = None
+
+        with QuestionBank() as bank:
+            bank.add_questions([create_question(str(number)) for number in range(15)])
+
+        quiz = game.Game()
+        quiz.get_questions()
+
+        self.assertEqual(len(quiz.questions), quiz.question_amount)
+        self.assertTrue(all(isinstance(question, game.Question) for question in quiz.questions))
+        api_get_questions.assert_not_called()
+
+        # The next game only gets the questions that haven't been played
+        self.assertEqual(len(load_seen_questions()), quiz.question_amount)
+
+        played = {question.question for question in quiz.questions}
+
+        quiz = game.Game()
+        quiz.question_amount = 5
+        quiz.get_questions()
+
+        self.assertEqual({question.question for question in quiz.questions} & played, set())
+        self.assertEqual(len(load_seen_questions()), 15)
+
+    @patch("game.render_text")
+    @patch("game.question_prefetcher")
+    def test_played_matching_questions_before_other_settings(self, question_prefetcher, render_text):
+        question_prefetcher.take.return_value = None
+
+        # Every question that matches the settings has been played, the ones that haven't are in another category
+        matching = [create_question(f"Computers {number}") for number in range(10)]
+        other = [create_question(f"Books {number}", category="Entertainment: Books") for number in range(10)]
+        os.makedirs("ProgramData")
+        with open("ProgramData/questions.json", "w") as file:
+            json.dump({"results": matching + other}, file)
+        remember_questions(matching)
+
+        quiz = game.Game()
+        quiz.online_enabled = False
+        quiz.quiz_category = "Computers"
+        quiz.get_questions()
+
+        self.assertEqual(sorted(question.question for question in quiz.questions),
+                         sorted(question["question"] for question in matching))
+
+        # Only once the matching ones run out are other questions used, new ones first
+        quiz = game.Game()
+        quiz.online_enabled = False
+        quiz.quiz_category = "Computers"
+        quiz.question_amount = 15
+        quiz.get_questions()
+
+        questions = [question.question for question in quiz.questions]
+        self.assertEqual(len(questions), 15)
+        self.assertEqual(len(set(questions)), 15)
+        self.assertEqual(sum(question.startswith("Computers") for question in questions), 10)
@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import game
+from Maxs_Modules.network import QuizGameServer, QuizGameClient
+from Maxs_Modules.websocket_network import create_frame
+from helpers import create_game, connect, send, receive, wait_for, create_masked_frame, open_websocket, \
+    send_websocket, receive_websocket
+
+
+class TestGameServer(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.folder.name)
+        os.makedirs(game.GAME_STORED_LOCATION)
+
+        self.game = create_game("Host")
+        self.server = QuizGameServer("127.0.0.1", 0)
+        self.server.game = self.game
+        self.server.running = True
+        self.game.backend = self.server
+        self.address = self.server.server.getsockname()
+        threading.Thread(target=self.server.run, daemon=True).start()
+        self.sockets = []
+
+    def tearDown(self):
+        # Close the server first, closing a client with data still unread resets the connection
+        self.server.kill()
+        for sock in self.sockets:
+            sock.close()
+
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    def join(self, name):
+        sock = connect(self.address, "client_join", {"name": name})
+        self.sockets.append(sock)
+        wait_for(lambda: name in self.server.client_names)
+        receive(sock)
+        return sock
+
+    def start_client(self):
+        client = QuizGameClient(*self.address)
+        client.running = True
+        threading.Thread(target=client.run, daemon=True).start()
+        wait_for(lambda: len(self.server.clients) == 1)
+        return client
+
+    def assert_rejected(self, sock, reason):
+        messages = receive(sock, 2)
+        self.assertEqual([(message.message_type, message.message) for message in messages],
+                         [("server_error", reason)])
+
+    def test_malformed_sync_player(self):
+        player = self.join("Player")
+        self.join("Other Player")
+
+        for malformed in ("Player", {"points": 3}, {"name": "Player", "answers": 5}):
+            send(player, "sync_player", malformed)
+            self.assert_rejected(player, "Malformed sync_player")
+
+            # Only the client that sent it is closed, the game carries on
+            wait_for(lambda: self.server.client_names == ["Other Player"])
+            self.assertTrue(self.server.running)
+            self.assertEqual([user.name for user in self.game.users], ["Host", "Other Player"])
+
+            player = self.join("Player")
+
+    def test_malformed_client_join(self):
+        self.join("Player")
+
+        for malformed in (["Player"], {"name": 3}, {"name": ""}):
+            sock = connect(self.address, "client_join", malformed)
+            self.sockets.append(sock)
+            self.assert_rejected(sock, "Malformed client_join")
+
+        wait_for(lambda: self.server.client_names == ["Player"])
+        self.assertTrue(self.server.running)
+        self.assertEqual([user.name for user in self.game.users], ["Host", "Player"])
+
+    def test_move_on_before_wait(self):
+        client = self.start_client()
+        self.server.send_message_to_all("", "move_on")
+        wait_for(lambda: client.move_on_count == 1)
+
+        # It was counted, so it isn't missed by waiting after it arrived
+        self.assertTrue(client.wait_for_move_on(0))
+        self.assertEqual(client.move_on_count, 0)
+        self.assertFalse(client.wait_for_move_on(0.1))
+
+    def test_move_on_wakes_wait(self):
+        client = self.start_client()
+        threading.Timer(0.1, self.server.send_message_to_all, ("", "move_on")).start()
+
+        start = time.monotonic()
+        self.assertTrue(client.wait_for_move_on(2))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_stop_wakes_wait(self):
+        client = self.start_client()
+        threading.Timer(0.1, client.stop).start()
+
+        start = time.monotonic()
+        self.assertFalse(client.wait_for_move_on(2))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def answer(self, sock, name):
+        send(sock, "sync_player", {"name": name, "has_answered": True})
+
+    def test_answers_deadline(self):
+        self.game.users[0].has_answered = True
+        player = self.join("Player")
+        self.join("Late Player")
+
+        deadline = time.monotonic() + 0.5
+        threading.Timer(0.1, self.answer, (player, "Player")).start()
+
+        # Returns as soon as someone answers so the caller can show who is left
+        self.assertEqual(self.server.wait_for_answers(deadline, ["Player", "Late Player"]), ["Late Player"])
+        self.assertLess(time.monotonic(), deadline)
+
+        # The late player never answers, so it gives up at the deadline
+        self.assertEqual(self.server.wait_for_answers(deadline, ["Late Player"]), ["Late Player"])
+        self.assertGreaterEqual(time.monotonic(), deadline)
+
+    def test_answers_last_player(self):
+        self.game.users[0].has_answered = True
+        player = self.join("Player")
+        threading.Timer(0.1, self.answer, (player, "Player")).start()
+
+        start = time.monotonic()
+        self.assertEqual(self.server.wait_for_answers(None, ["Player"]), [])
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_answers_player_leaves(self):
+        self.game.users[0].has_answered = True
+        player = self.join("Player")
+        threading.Timer(0.1, player.close).start()
+
+        # A player that disconnects won't be answering, so it doesn't hold up the question
+        self.assertEqual(self.server.wait_for_answers(time.monotonic() + 2, ["Player"]), [])
+
+    def join_browser(self, name):
+        sock, response = open_websocket(self.address)
+        self.sockets.append(sock)
+        self.assertTrue(response.startswith(b"HTTP/1.1 101"))
+        self.assertIn(b"Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=", response)
+
+        send_websocket(sock, "client_join", {"name": name})
+        wait_for(lambda: name in self.server.client_names)
+        return sock
+
+    def test_browser_joins(self):
+        browser = self.join_browser("Browser")
+        self.assertEqual([user.name for user in self.game.users], ["Host", "Browser"])
+
+        # The messages are the same JSON as the Python clients get, one per WebSocket text frame
+        frames = receive_websocket(browser)
+        self.assertEqual({opcode for opcode, payload in frames}, {0x1})
+        self.assertIn("set_session", [json.loads(payload)["message_type"] for opcode, payload in frames])
+
+        browser.sendall(create_masked_frame(b"beat", 0x9))
+        self.assertEqual(receive_websocket(browser), [(0xA, b"beat")])
+
+        # The browser closing the WebSocket removes the player, and the server closes it back
+        browser.sendall(create_masked_frame(b"", 0x8))
+        self.assertEqual(receive_websocket(browser, 2), [(0x8, b"")])
+        wait_for(lambda: self.server.client_names == [])
+        self.assertTrue(self.server.running)
+
+    def test_browser_unmasked_frame(self):
+        browser = self.join_browser("Browser")
+        receive_websocket(browser)
+
+        browser.sendall(create_frame(b"{}", 0x1))
+        frames = receive_websocket(browser, 2)
+        self.assertEqual([opcode for opcode, payload in frames], [0x1, 0x8])
+        self.assertEqual(json.loads(frames[0][1])["message"], "WebSocket frame isn't masked")
+
+        wait_for(lambda: self.server.client_names == [])
+        self.assertTrue(self.server.running)
@@ -0,0 +1,275 @@
+import os
+import socket
+import tempfile
+import threading
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import game
+from Maxs_Modules.lobby_network import QuizLobbyServer, QuizRoomHost, get_lobby, running_lobbies, can_hand_off
+from Maxs_Modules.network import QuizGameServer, QuizMessage, format_network_stats
+from helpers import create_game, connect, send, receive, wait_for
+
+
+class TestLobbyNetwork(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.folder.name)
+        os.makedirs(game.GAME_STORED_LOCATION)
+
+        self.lobby = QuizLobbyServer("127.0.0.1", 0)
+        self.lobby_thread = threading.Thread(target=self.lobby.run, daemon=True)
+        self.lobby_thread.start()
+        self.servers = []
+        self.hosts = []
+        self.sockets = []
+
+    def tearDown(self):
+        # Close the servers first, closing a client with data still unread resets the connection. The lobby is killed
+        # on its own thread, as it may still be closing a client.
+        self.lobby.stop()
+        self.lobby_thread.join(2)
+        for host in self.hosts:
+            host.close()
+        for server in self.servers:
+            server.kill()
+        for sock in self.sockets:
+            sock.close()
+
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    def connect(self, message_type, message, room):
+        sock = connect((self.lobby.host, self.lobby.port), message_type, message, room)
+        self.sockets.append(sock)
+        return sock
+
+    def start_server(self, host_name):
+        server = QuizGameServer("127.0.0.1", 0)
+        server.game = create_game(host_name)
+        server.running = True
+        threading.Thread(target=server.run, daemon=True).start()
+        self.servers.append(server)
+        return server
+
+    def host_room(self, server, room_id=None, handoff=True):
+        # Without the handover the lobby is reached over TCP and passes the clients along, as it would on Windows
+        with patch("Maxs_Modules.lobby_network.can_hand_off", return_value=handoff and can_hand_off()), \
+                patch("Maxs_Modules.lobby_network.ROOM_HEALTH_INTERVAL", 0.2):
+            host = QuizRoomHost(server, self.lobby.host, self.lobby.port, server.server.getsockname()[1], room_id)
+
+        self.hosts.append(host)
+        return host
+
+    def test_rooms_only_reach_their_clients(self):
+        room_a = self.lobby.create_room(create_game("Host A"), "AAAA")
+        room_b = self.lobby.create_room(create_game("Host B"), "bbbb")
+        self.assertEqual(room_b.room_id, "BBBB")
+
+        player_a = self.connect("client_join", {"name": "Player A"}, "aaaa")
+        player_b = self.connect("client_join", {"name": "Player B"}, "BBBB")
+        wait_for(lambda: room_a.client_names == ["Player A"] and room_b.client_names == ["Player B"])
+        self.assertEqual([user.name for user in room_a.game.users], ["Host A", "Player A"])
+        self.assertEqual([user.name for user in room_b.game.users], ["Host B", "Player B"])
+
+        # Both have joined, so drop the session and ping sent to each
+        receive(player_a)
+        receive(player_b)
+
+        room_a.send_message_to_all("Room A", "move_on")
+        messages = receive(player_a)
+        self.assertEqual([(message.message_type, message.message) for message in messages], [("move_on", "Room A")])
+
+        messages = receive(player_b)
+        self.assertEqual(messages, [])
+
+    def test_join_counted_once(self):
+        room = self.lobby.create_room(create_game("Host"), "AAAA")
+        self.connect("client_join", {"name": "Player"}, "AAAA")
+        wait_for(lambda: room.client_names == ["Player"])
+
+        # The lobby passes the join on to the room without checking it, so only the room takes it from the bucket
+        limiter = self.lobby.get_connection_data(room.clients[0]).limiter
+        bucket = limiter.type_buckets["client_join"]
+        self.assertLess(bucket.capacity - bucket.tokens - 1, 0.5)
+
+    def test_unknown_room(self):
+        self.lobby.create_room(create_game("Host"), "AAAA")
+
+        sock = self.connect("client_join", {"name": "Player"}, "ZZZZ")
+        messages = receive(sock)
+
+        self.assertEqual([(message.message_type, message.message) for message in messages],
+                         [("server_error", "Room ZZZZ not found")])
+        self.assertEqual(self.lobby.client_rooms, {})
+
+    def test_remove_room_closes_clients(self):
+        room = self.lobby.create_room(create_game("Host"), "AAAA")
+        other_room = self.lobby.create_room(create_game("Other Host"), "BBBB")
+
+        player = self.connect("client_join", {"name": "Player"}, "AAAA")
+        self.connect("client_join", {"name": "Other Player"}, "BBBB")
+        wait_for(lambda: room.client_names == ["Player"] and other_room.client_names == ["Other Player"])
+        receive(player)
+
+        self.lobby.remove_room("AAAA")
+
+        self.assertNotIn("AAAA", self.lobby.rooms)
+        self.assertEqual(room.clients, [])
+        self.assertEqual(list(self.lobby.client_rooms.values()), [other_room])
+
+        # The server closing the connection is seen as the end of the stream, after anything still queued
+        player.settimeout(2)
+        while player.recv(65536):
+            pass
+        self.assertEqual(len(other_room.clients), 1)
+
+    def test_games_share_a_lobby(self):
+        lobby = get_lobby(0)
+        self.assertIs(get_lobby(0), lobby)
+
+        lobby.create_room(create_game("Host"), "AAAA")
+        lobby.create_room(create_game("Other Host"), "BBBB")
+        self.assertEqual(sorted(lobby.rooms), ["AAAA", "BBBB"])
+
+        lobby.kill()
+        self.assertEqual(lobby.rooms, {})
+        self.assertNotIn(0, running_lobbies)
+
+
+    def test_remote_room(self):
+        server = self.start_server("Remote Host")
+        host = self.host_room(server, "cccc", handoff=False)
+        self.assertEqual(host.room_id, "CCCC")
+
+        # The player only knows the lobby, it is passed on to the other process's server
+        player = self.connect("client_join", {"name": "Player"}, "CCCC")
+        wait_for(lambda: server.client_names == ["Player"])
+        self.assertEqual([user.name for user in server.game.users], ["Remote Host", "Player"])
+        self.assertIn("set_session", [message.message_type for message in receive(player)])
+
+        server.send_message_to_all("Remote", "move_on")
+        messages = receive(player)
+        self.assertEqual([(message.message_type, message.message) for message in messages], [("move_on", "Remote")])
+
+        # Closing the host's connection removes the room and the player's connections through it
+        host.close()
+        wait_for(lambda: "CCCC" not in self.lobby.rooms)
+        wait_for(lambda: server.client_names == [])
+        player.settimeout(2)
+        while player.recv(65536):
+            pass
+        self.assertEqual(self.lobby.client_rooms, {})
+
+    @skipUnless(can_hand_off(), "Connections can't be handed to another process on this platform")
+    def test_remote_room_handoff(self):
+        server = self.start_server("Remote Host")
+        host = self.host_room(server, "CCCC")
+        self.assertTrue(host.handoff)
+
+        # Part of the next message arrives with the join, it is handed over along with the connection
+        join = QuizMessage({"name": "Player"}, None, None, "client_join")
+        join.room = "CCCC"
+        sync = QuizMessage({"name": "Player", "points": 5}, None, None, "sync_player").to_frame()
+        player = socket.create_connection((self.lobby.host, self.lobby.port))
+        self.sockets.append(player)
+        player.sendall(join.to_frame() + sync[:10])
+
+        wait_for(lambda: server.client_names == ["Player"])
+        room = self.lobby.rooms["CCCC"]
+        self.assertEqual(room.handed_off, 1)
+        self.assertEqual(room.clients, [])
+        self.assertEqual(self.lobby.client_rooms, {room.host: room})
+
+        # The rest goes straight to the server, the lobby is no longer in between
+        player.sendall(sync[10:])
+        wait_for(lambda: server.game.users[1].points == 5)
+
+        server.send_message_to_all("Remote", "move_on")
+        self.assertIn(("move_on", "Remote"), [(message.message_type, message.message) for message in receive(player)])
+
+        # The player is the host's now, so it stays connected when the room is removed
+        host.close()
+        wait_for(lambda: "CCCC" not in self.lobby.rooms)
+        send(player, "ping", None)
+        self.assertEqual(server.client_names, ["Player"])
+
+    def test_remote_room_taken(self):
+        self.lobby.create_room(create_game("Host"), "AAAA")
+        server = self.start_server("Remote Host")
+
+        with self.assertRaises(ConnectionError):
+            self.host_room(server, "AAAA")
+
+        self.assertEqual(list(self.lobby.rooms), ["AAAA"])
+
+    def test_remote_room_server_gone(self):
+        server = self.start_server("Remote Host")
+        self.host_room(server, "CCCC", handoff=False)
+        self.servers.remove(server)
+        server.kill()
+
+        player = self.connect("client_join", {"name": "Player"}, "CCCC")
+        messages = receive(player)
+        self.assertEqual([(message.message_type, message.message) for message in messages],
+                         [("server_error", "Room CCCC is not answering")])
+
+    def test_lobby_health(self):
+        room = self.lobby.create_room(create_game("Host"), "AAAA")
+        self.connect("client_join", {"name": "Player"}, "AAAA")
+        wait_for(lambda: room.client_names == ["Player"])
+
+        server = self.start_server("Remote Host")
+        self.host_room(server, "CCCC")
+        self.connect("client_join", {"name": "Remote Player"}, "CCCC")
+        wait_for(lambda: server.client_names == ["Remote Player"])
+
+        # The host sends its health when the room is created, and again after each interval
+        wait_for(lambda: self.lobby.rooms["CCCC"].health.get("pid") == os.getpid())
+        self.lobby.rooms["CCCC"].health.clear()
+        wait_for(lambda: self.lobby.get_health()["players"] == 2)
+
+        health = self.lobby.get_health()
+        self.assertEqual((health["rooms"], health["players"], health["processes"]), (2, 2, 1))
+        self.assertEqual(health["room_health"]["AAAA"]["players"], 1)
+        self.assertEqual(health["room_health"]["CCCC"]["pid"], os.getpid())
+
+        # Anything can ask the lobby for its health, and it is shown in the debug CLI's server -stats
+        sock = self.connect("lobby_health", None, None)
+        messages = receive(sock)
+        self.assertEqual([message.message_type for message in messages], ["lobby_health"])
+        self.assertEqual(messages[0].message["rooms"], 2)
+        self.assertIn(" Rooms: 2, players 2, processes 1", format_network_stats([self.lobby.get_stats()]))
+
+    def test_last_room_stops_lobby(self):
+        lobby = get_lobby(0)
+        quiz = create_game("Host")
+        quiz.lobby = lobby
+        other_quiz = create_game("Other Host")
+        other_quiz.lobby = lobby
+
+        room = lobby.create_room(quiz, "AAAA")
+        other_room = lobby.create_room(other_quiz, "BBBB")
+
+        room.kill()
+        self.assertIsNone(quiz.lobby)
+        self.assertIs(other_quiz.lobby, lobby)
+        self.assertIs(get_lobby(0), lobby)
+
+        other_room.kill()
+        self.assertIsNone(other_quiz.lobby)
+        self.assertNotIn(0, running_lobbies)
+
+        lobby.thread.join(2)
+        self.assertFalse(lobby.thread.is_alive())
+        self.assertEqual(lobby.server.fileno(), -1)
+
+    def test_lobby_port_in_use(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            sock.listen()
+
+            # Another process has the port, so the game adds a room to its lobby instead (see QuizRoomHost)
+            self.assertIsNone(get_lobby(sock.getsockname()[1]))
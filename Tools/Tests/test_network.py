@@ -0,0 +1,249 @@
+import itertools
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from Maxs_Modules.network import QuizMessage, QuizMessageBuffer, QuizStateTracker, QuizTimingWheel, QuizSession, \
+    QuizClockEstimate, QuizTimeHistogram, QuizConnectionStats, QuizIngressLimiter, QuizLimitExceeded, \
+    QuizSpectatorFeed, frame_bytes, apply_patch, get_changed_events, api_get_questions, get_message_numbers, \
+    MESSAGE_CODECS
+from Maxs_Modules.discovery_network import parse_response
+from Maxs_Modules.websocket_network import QuizWebSocketBuffer, QuizWebSocketError, create_accept_key, create_frame
+from helpers import create_masked_frame
+
+
+class TestNetwork(TestCase):
+
+    def test_message_round_trip(self):
+        message = QuizMessage({"name": "Max"}, "127.0.0.1", "127.0.0.1", "client_join")
+        result = QuizMessage(None, None, None, None).from_bytes(message.to_bytes())
+        self.assertEqual(result.message, {"name": "Max"})
+        self.assertEqual(result.message_type, "client_join")
+
+    def test_binary_round_trip(self):
+        data = {"revision": 3, "set": [[["users", 0, "points"], -2], [["users", 0, "name"], "Max"]],
+                "remove": [], "snapshot": {"time_limit": 1.5, "host": True, "quiz": None, "name": "Max"}}
+        message = QuizMessage(data, "127.0.0.1", "127.0.0.1", "sync_players")
+        result = QuizMessage(None, None, None, None).from_bytes(message.to_bytes("binary"))
+        self.assertEqual(result.message, data)
+        self.assertEqual(result.message_type, "sync_players")
+
+    def test_binary_unknown_type(self):
+        message = QuizMessage([2 ** 40, "é"], "127.0.0.1", None, "new_type")
+        result = QuizMessage(None, None, None, None).from_bytes(message.to_bytes("binary"))
+        self.assertEqual(result.message, [2 ** 40, "é"])
+        self.assertEqual(result.message_type, "new_type")
+
+    def test_codecs_offered_on_join(self):
+        message = QuizMessage({"name": "Max"}, "127.0.0.1", "127.0.0.1", "client_join")
+        message.codecs = list(MESSAGE_CODECS)
+        result = QuizMessage(None, None, None, None).from_bytes(message.to_bytes())
+        self.assertEqual(result.codecs, ["binary", "json"])
+
+    def test_buffer_many_frames(self):
+        buffer = QuizMessageBuffer()
+        result = buffer.feed(frame_bytes(b"one") + frame_bytes(b"two") + frame_bytes(b""))
+        self.assertEqual(result, [b"one", b"two", b""])
+
+    def test_buffer_partial_frame(self):
+        buffer = QuizMessageBuffer()
+        data = frame_bytes(b"hello world")
+        self.assertEqual(buffer.feed(data[:3]), [])
+        self.assertEqual(buffer.feed(data[3:8]), [])
+        self.assertEqual(buffer.feed(data[8:] + frame_bytes(b"next")[:2]), [b"hello world"])
+        self.assertEqual(buffer.feed(frame_bytes(b"next")[2:]), [b"next"])
+
+    def test_buffer_compressed_frame(self):
+        buffer = QuizMessageBuffer()
+        payload = b"question " * 100
+        data = frame_bytes(payload, 512) + frame_bytes(b"move_on", 512)
+        self.assertLess(len(data), len(payload))
+        self.assertEqual(buffer.feed(data), [payload, b"move_on"])
+
+    def test_compressed_binary_frame(self):
+        data = {"users": [{"name": f"Player {number}", "points": number, "answers": []} for number in range(50)]}
+        message = QuizMessage(data, "127.0.0.1", "127.0.0.1", "sync_players")
+        frame = message.to_frame("binary", 512)
+        self.assertLess(len(frame), len(message.to_bytes("binary")))
+
+        payload, = QuizMessageBuffer().feed(frame)
+        self.assertEqual(payload, message.to_bytes("binary"))
+        self.assertEqual(QuizMessage(None, None, None, None).from_bytes(payload).message, data)
+
+    def test_buffer_max_size(self):
+        buffer = QuizMessageBuffer(1000)
+        self.assertEqual(buffer.feed(frame_bytes(b"a" * 1000)), [b"a" * 1000])
+        with self.assertRaises(QuizLimitExceeded):
+            buffer.feed(frame_bytes(b"a" * 1001)[:10])
+        with self.assertRaises(QuizLimitExceeded):
+            QuizMessageBuffer(1000).feed(frame_bytes(b"a" * 5000, 512))
+
+    def test_ingress_limiter(self):
+        limiter = QuizIngressLimiter(10, 3, {"sync_player": (1, 2)})
+        now = limiter.bucket.updated
+        self.assertEqual([limiter.allow("sync_player", now) for _ in range(3)], [True, True, False])
+        self.assertFalse(limiter.allow("pong", now))
+        self.assertTrue(limiter.allow("pong", now + 0.1))
+        self.assertTrue(limiter.allow("sync_player", now + 2))
+
+    def test_websocket_accept_key(self):
+        # The example from RFC 6455
+        self.assertEqual(create_accept_key("dGhlIHNhbXBsZSBub25jZQ=="), "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=")
+
+    def test_websocket_buffer(self):
+        first = create_masked_frame(b'{"a', 0x1, False)
+        second = create_masked_frame(b'":1', 0x0, False)
+        buffer = QuizWebSocketBuffer()
+        self.assertEqual(buffer.feed(first + create_masked_frame(b"hi", 0x9) + second[:4]), [(0x9, b"hi")])
+        self.assertEqual(buffer.feed(second[4:] + create_masked_frame(b"}", 0x0)), [(0x1, b'{"a":1}')])
+        with self.assertRaises(QuizLimitExceeded):
+            QuizWebSocketBuffer(100).feed(create_masked_frame(b"a" * 120, 0x1))
+
+    def test_websocket_unmasked_frame(self):
+        # Only servers send unmasked frames, a client sending one has to be disconnected
+        with self.assertRaises(QuizWebSocketError):
+            QuizWebSocketBuffer().feed(create_frame(b"hi", 0x1))
+
+    def test_timing_wheel(self):
+        wheel = QuizTimingWheel(1, 4, now=0)
+        wheel.schedule("soon", 2)
+        wheel.schedule("later", 9)
+        wheel.schedule("cancelled", 2)
+        wheel.cancel("cancelled")
+        self.assertEqual(wheel.advance(1.5), [])
+        self.assertEqual(wheel.advance(2), ["soon"])
+        self.assertEqual(wheel.advance(8), [])
+        self.assertEqual(wheel.advance(9), ["later"])
+        self.assertEqual(wheel.timers, {})
+
+    def test_clock_estimate(self):
+        estimate = QuizClockEstimate(4)
+
+        # The client's clock is 100s ahead, each way takes 0.05s (or 0.25s when held up) and replying takes 0.01s
+        estimate.add_sample(10, 110.25, 110.26, 10.31)
+        estimate.add_sample(20, 120.05, 120.06, 20.11)
+        self.assertAlmostEqual(estimate.offset, 100)
+        self.assertAlmostEqual(estimate.samples[-1][0], 0.1)
+        self.assertAlmostEqual(estimate.to_server_time(125), 25)
+        self.assertTrue(estimate.needs_sample(21))
+
+    def test_connection_stats(self):
+        stats = QuizConnectionStats()
+        stats.record_in("client_join", 40)
+        stats.record_out("sync_game", 100)
+        stats.record_out("sync_game", 50)
+        result = stats.to_dict(stats.created + 10, 25)
+        self.assertEqual((result["bytes_in"], result["bytes_out"], result["messages_out"]), (40, 150, 2))
+        self.assertEqual(result["types_out"], {"sync_game": {"messages": 2, "bytes": 150}})
+        self.assertAlmostEqual(result["rate_out"], 0.2)
+        self.assertEqual(result["queued"], 25)
+
+        times = QuizTimeHistogram()
+        times.add(0.00002)
+        times.add(1)
+        result = times.to_dict()
+        self.assertEqual((result["count"], result["max"]), (2, 1))
+        self.assertEqual((result["buckets"]["5e-05"], result["buckets"]["inf"]), (1, 1))
+
+    def test_session_missed(self):
+        session = QuizSession("Max", 2)
+        for message_type in ("move_on", "ping", "sync_players", "move_on"):
+            session.record(QuizMessage(None, None, None, message_type))
+        self.assertEqual(session.sent, 3)
+        self.assertEqual([message.message_type for message in session.missed(1)], ["sync_players", "move_on"])
+        self.assertEqual(session.missed(3), [])
+        self.assertIsNone(session.missed(0))
+
+    def test_discovery_response(self):
+        response = b'{"type": "server", "id": "ab12", "name": "Max", "players": 2, "max_players": 4, "port": 1234}'
+        self.assertEqual(parse_response(response, "ab12", "10.0.0.2"),
+                         {"ip": "10.0.0.2", "port": 1234, "name": "Max", "players": 2, "max_players": 4})
+        self.assertIsNone(parse_response(response, "cd34", "10.0.0.2"))
+        self.assertIsNone(parse_response(response.replace(b"1234", b'"1234"'), "ab12", "10.0.0.2"))
+        self.assertIsNone(parse_response(b"\xff", "ab12", "10.0.0.2"))
+
+    def test_spectator_changed_events(self):
+        sent = {"spectate_scores": [["Max", 1]], "spectate_question": {"number": 1}}
+        events = {"spectate_scores": [["Max", 2]], "spectate_answers": {"answered": 0}, "spectate_question": {"number": 1}}
+        self.assertEqual(get_changed_events(events, sent), [("spectate_answers", {"answered": 0}),
+                                                            ("spectate_scores", [["Max", 2]])])
+        self.assertEqual(get_changed_events(events, events), [])
+
+    def test_spectator_feed_idle_without_spectators(self):
+        server = SimpleNamespace(spectators=[])
+        feed = QuizSpectatorFeed(server)
+
+        feed.publish()
+        self.assertIsNone(feed.thread)
+        self.assertFalse(feed.pending)
+
+        server.spectators.append(object())
+        feed.start()
+        feed.start()
+        thread = feed.thread
+        self.assertTrue(thread.is_alive())
+
+        feed.stop()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+    def test_state_patch_only_changes(self):
+        tracker = QuizStateTracker()
+        state = {"users": [{"name": "Max", "points": 0, "answers": []}], "time_limit": 10}
+        tracker.update(state)
+        revision = tracker.revision
+
+        state["users"][0]["points"] = 1
+        state["users"][0]["answers"].append("Correct")
+        tracker.update(state, ["users"])
+
+        result = tracker.patch(revision)
+        self.assertCountEqual(result["set"], [[["users", 0, "points"], 1], [["users", 0, "answers", "#len"], 1],
+                                              [["users", 0, "answers", 0], "Correct"]])
+
+    def test_state_patch_apply(self):
+        tracker = QuizStateTracker()
+        state = {"users": [{"name": "Max", "answers": ["Correct"]}, {"name": "Bob", "answers": []}]}
+        tracker.update(state)
+        synced = {}
+        apply_patch(synced, tracker.snapshot())
+        revision = tracker.revision
+
+        state["users"].pop(0)
+        state["users"][0]["answers"].append("Incorrect")
+        tracker.update(state)
+        apply_patch(synced, tracker.patch(revision))
+        self.assertEqual(synced, state)
+
+    @patch("Maxs_Modules.network.UserData")
+    @patch("Maxs_Modules.network.get_api_token", return_value=None)
+    @patch("Maxs_Modules.network.api_request")
+    def test_api_chunks_and_duplicates(self, api_request, get_api_token, user_data):
+        user_data.return_value.question_bank_store = False
+        sizes = []
+        numbers = itertools.count()
+
+        # The first chunks all start with the same question, so the duplicates have to be asked for again
+        def request(amount, parameters):
+            sizes.append(amount)
+            numbers_used = ["first"] if len(sizes) <= 3 else [str(next(numbers))]
+            numbers_used += [str(next(numbers)) for _ in range(amount - 1)]
+            return {"response_code": 0, "results": [{"question": number, "correct_answer": "True"}
+                                                    for number in numbers_used]}
+
+        api_request.side_effect = request
+        questions = api_get_questions(120, None, "Any", None, quiet=True)
+
+        self.assertEqual(sorted(sizes[:3]), [20, 50, 50])
+        self.assertEqual(sizes[3:], [2])
+        self.assertEqual(len(questions), 120)
+        self.assertEqual(len({question["question"] for question in questions}), 120)
+
+    def test_message_numbers(self):
+        self.assertEqual(get_message_numbers({"sent": 1, "received": 2.5, "replied": 3}, "sent", "received", "replied"),
+                         (1, 2.5, 3))
+        self.assertIsNone(get_message_numbers(1.5, "sent"))
+        self.assertIsNone(get_message_numbers({"sent": 1}, "sent", "received"))
+        self.assertIsNone(get_message_numbers({"revision": "3"}, "revision"))
+        self.assertIsNone(get_message_numbers({"revision": True}, "revision"))
+        self.assertIsNone(get_message_numbers({"revision": float("nan")}, "revision"))
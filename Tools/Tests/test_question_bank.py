@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from Maxs_Modules.question_bank import QuestionBank, QuestionSelection, get_question_hash, create_filter
+from helpers import create_question
+
+
+class TestQuestionBank(TestCase):
+
+    def setUp(self):
+        self.bank = QuestionBank(":memory:")
+
+    def tearDown(self):
+        self.bank.close()
+
+    def test_add_questions_skips_duplicates(self):
+        self.assertEqual(self.bank.add_questions([create_question("A"), create_question("B")]), 2)
+        self.assertEqual(self.bank.add_questions([create_question("B"), create_question("C")]), 1)
+        self.assertEqual(self.bank.count_questions(), 3)
+
+    def test_get_questions_filtered(self):
+        self.bank.add_questions([create_question("A"), create_question("B", difficulty="hard"),
+                                 create_question("C", category="Entertainment: Books"),
+                                 create_question("D", question_type="multiple")])
+
+        questions = self.bank.get_questions(10, "Computers", "easy", "boolean")
+        self.assertEqual([question["question"] for question in questions], ["A"])
+
+        self.assertEqual(self.bank.count_questions(category="Books"), 1)
+        self.assertEqual(len(self.bank.get_questions(2)), 2)
+
+        self.bank.clear()
+        self.assertEqual(self.bank.get_questions(10), [])
+
+    def test_filters_use_an_index(self):
+        for filters in (("Computers", "easy", "boolean"), ("Computers", None, None), (None, "easy", None),
+                        (None, "easy", "boolean"), (None, None, "boolean"), ("Computers", None, "boolean")):
+            where, parameters = create_filter(*filters, unseen=True)
+            plan = self.bank.connection.execute("EXPLAIN QUERY PLAN SELECT rowid FROM questions" + where,
+                                                parameters).fetchall()
+            self.assertTrue(plan[0][-1].startswith("SEARCH questions USING COVERING INDEX"), plan)
+
+    def test_get_questions_unseen(self):
+        self.bank.add_questions([create_question("A"), create_question("B"), create_question("C")])
+        self.bank.add_seen([get_question_hash(create_question("A")), get_question_hash(create_question("C"))])
+
+        questions = self.bank.get_questions(10, unseen=True)
+        self.assertEqual([question["question"] for question in questions], ["B"])
+
+        self.bank.clear_seen()
+        self.assertEqual(len(self.bank.get_questions(10, unseen=True)), 3)
+
+    def test_selection_prefers_new_questions(self):
+        selection = QuestionSelection(3, {get_question_hash(create_question("A"))})
+        selection.add([create_question("A"), create_question("B"), create_question("B")])
+        self.assertEqual(selection.get_needed(), 2)
+
+        selection.add([create_question("C"), create_question("D"), create_question("E")])
+        self.assertEqual([question["question"] for question in selection.get_questions()], ["B", "C", "D"])
+
+        selection = QuestionSelection(2, {get_question_hash(create_question("A"))})
+        selection.add([create_question("A"), create_question("B")])
+        self.assertEqual([question["question"] for question in selection.get_questions()], ["B", "A"])
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from Maxs_Modules.question_pack import QuestionPack, create_pack
+from helpers import create_question
+
+
+class TestQuestionPack(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "questions.pack")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_pack_round_trip(self):
+        questions = [create_question("A"), create_question("B", difficulty="hard"), create_question("A"),
+                     create_question("C", category="Entertainment: Books"),
+                     create_question("D", question_type="multiple")]
+        self.assertEqual(create_pack(questions, self.path), 4)
+
+        with QuestionPack(self.path) as pack:
+            self.assertEqual(pack.count_questions(), 4)
+            self.assertEqual(pack.count_questions(category="Computers"), 3)
+
+            questions = pack.get_questions(10, "Computers", "easy", "boolean")
+            self.assertEqual(questions, [create_question("A")])
+
+            questions = pack.get_questions(10)
+            self.assertEqual(sorted(question["question"] for question in questions), ["A", "B", "C", "D"])
+            self.assertEqual(len(pack.get_questions(2, category="Computers")), 2)
+            self.assertEqual(pack.get_questions(10, category="Film"), [])
+
+    def test_not_a_pack(self):
+        with open(self.path, "wb") as file:
+            file.write(b"{\"results\": []}" + bytes(32))
+
+        with self.assertRaises(ValueError):
+            QuestionPack(self.path)
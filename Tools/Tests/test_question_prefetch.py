@@ -0,0 +1,61 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from Maxs_Modules.question_prefetch import QuestionPrefetcher, get_prefetch_key
+
+
+class TestQuestionPrefetcher(TestCase):
+
+    def wait_for_buffer(self, prefetcher, key, size):
+        deadline = time.time() + 5
+        while len(prefetcher.buffers.get(key, ())) < size and time.time() < deadline:
+            time.sleep(0.01)
+
+    @patch("Maxs_Modules.question_prefetch.api_get_questions")
+    def test_request_fills_buffer(self, api_get_questions):
+        api_get_questions.side_effect = lambda amount, *args, quiet: [{"question": str(amount)}] * amount
+        prefetcher = QuestionPrefetcher(buffer_size=2, interval=0)
+        key = get_prefetch_key(3, None, "Any", None)
+
+        self.assertIsNone(prefetcher.take(key))
+
+        prefetcher.request(key)
+        self.wait_for_buffer(prefetcher, key, 2)
+
+        self.assertEqual(len(prefetcher.take(key)), 3)
+        self.assertEqual(len(prefetcher.take(key)), 3)
+        self.assertIsNone(prefetcher.take(key))
+        self.assertEqual(api_get_questions.call_count, 2)
+
+    @patch("Maxs_Modules.question_prefetch.api_get_questions")
+    def test_short_sets_are_dropped(self, api_get_questions):
+        api_get_questions.return_value = [{"question": "A"}]
+        prefetcher = QuestionPrefetcher(interval=0)
+        key = get_prefetch_key(10, 9, "Easy", "boolean")
+
+        prefetcher.request(key)
+        deadline = time.time() + 5
+        while key in prefetcher.pending and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertIsNone(prefetcher.take(key))
+        self.assertEqual(api_get_questions.call_count, 1)
+
+    @patch("Maxs_Modules.question_prefetch.api_get_questions")
+    def test_unexpected_error_keeps_worker(self, api_get_questions):
+        api_get_questions.side_effect = [KeyError("response_code"), [{"question": "A"}, {"question": "B"}]]
+        prefetcher = QuestionPrefetcher(buffer_size=1, interval=0)
+        key = get_prefetch_key(2, None, "Easy", None)
+
+        prefetcher.request(key)
+        deadline = time.time() + 5
+        while (api_get_questions.call_count < 1 or key in prefetcher.pending) and time.time() < deadline:
+            time.sleep(0.01)
+
+        # The worker is still running, so the key can be requested again
+        prefetcher.request(key)
+        self.wait_for_buffer(prefetcher, key, 1)
+
+        self.assertEqual(prefetcher.take(key), [{"question": "A"}, {"question": "B"}])
+        self.assertTrue(prefetcher.thread.is_alive())
@@ -0,0 +1,92 @@
+import selectors
+import socket
+from unittest import TestCase
+from unittest.mock import patch
+
+from Maxs_Modules.network import QuizServer
+
+
+class TestServerQueue(TestCase):
+
+    def setUp(self):
+        # The server thread isn't started, each test does what it would do one step at a time
+        self.server = QuizServer("127.0.0.1", 0)
+        self.connection, self.client = socket.socketpair()
+        self.client.settimeout(1)
+        self.data = self.server.add_connection(self.connection, "test")
+
+    def tearDown(self):
+        self.server.kill()
+        self.client.close()
+
+    def get_events(self):
+        return self.server.selector.get_key(self.connection).events
+
+    def test_write_only_while_queued(self):
+        self.assertEqual(self.get_events(), selectors.EVENT_READ)
+
+        self.server.queue_frame(self.connection, b"frame")
+        self.assertEqual(self.get_events(), selectors.EVENT_READ)
+        self.assertEqual(self.server.pending_clients, {self.connection})
+
+        self.server.handle_wakeup()
+        self.assertEqual(self.get_events(), selectors.EVENT_READ | selectors.EVENT_WRITE)
+        self.assertEqual(self.server.pending_clients, set())
+
+        self.server.handle_data_send(self.connection, self.data, self.data.send_bytes)
+        self.assertEqual(self.data.send_bytes, b"")
+        self.assertEqual(self.get_events(), selectors.EVENT_READ)
+        self.assertEqual(self.client.recv(64), b"frame")
+
+    def test_queue_keeps_order(self):
+        self.server.queue_frame(self.connection, b"first ")
+        self.server.queue_frame(self.connection, b"second")
+
+        # Only the first frame needs the server thread to start watching for writes
+        self.assertEqual(self.server.pending_clients, {self.connection})
+        self.assertEqual(self.data.send_bytes, b"first second")
+
+    def test_slow_client_dropped_message(self):
+        self.server.high_water_mark = 100
+        self.server.slow_client_policy = "drop"
+
+        with patch.object(self.server, "handle_dropped_message") as handle_dropped_message:
+            self.server.queue_frame(self.connection, b"a" * 80)
+            self.server.queue_frame(self.connection, b"b" * 80)
+
+        handle_dropped_message.assert_called_once_with(self.connection)
+        self.assertEqual(self.data.send_bytes, b"a" * 80)
+        self.assertFalse(self.data.closing)
+
+        self.server.handle_wakeup()
+        self.server.handle_data_send(self.connection, self.data, self.data.send_bytes)
+        self.assertIn(self.connection, self.server.clients)
+        self.assertEqual(self.client.recv(256), b"a" * 80)
+
+    def test_slow_client_disconnected(self):
+        self.server.high_water_mark = 100
+        self.server.slow_client_policy = "disconnect"
+
+        with patch.object(self.server, "handle_dropped_message") as handle_dropped_message:
+            self.server.queue_frame(self.connection, b"a" * 80)
+            self.server.queue_frame(self.connection, b"b" * 80)
+
+        handle_dropped_message.assert_not_called()
+        self.assertTrue(self.data.closing)
+        self.assertEqual(self.data.send_bytes, b"")
+
+        # Nothing more is queued once it is closing
+        self.server.queue_frame(self.connection, b"c")
+        self.assertEqual(self.data.send_bytes, b"")
+
+        # The connection is closed on the server thread
+        self.server.handle_wakeup()
+        self.assertNotIn(self.connection, self.server.clients)
+        self.assertEqual(self.client.recv(256), b"")
+
+    def test_large_frame_on_empty_queue(self):
+        self.server.high_water_mark = 100
+
+        self.server.queue_frame(self.connection, b"a" * 150)
+        self.assertEqual(len(self.data.send_bytes), 150)
+        self.assertFalse(self.data.closing)
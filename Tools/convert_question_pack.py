@@ -0,0 +1,42 @@
+# - - - - - - - Imports - - - - - - -#
+import os
+import sys
+import time
+import argparse
+
+# Allow running from anywhere by adding the root of the project to the path
+ROOT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT_FOLDER)
+
+from Maxs_Modules.question_pack import QuestionPack, convert_json_to_pack  # noqa: E402
+
+# - - - - - - - Variables - - - - - - -#
+QUESTIONS_JSON = os.path.join(ROOT_FOLDER, "ProgramData", "questions.json")
+QUESTIONS_PACK = os.path.join(ROOT_FOLDER, "ProgramData", "questions.pack")
+
+
+# - - - - - - - Functions - - - - - - -#
+
+def main() -> None:
+    """
+    Parse the arguments, convert the JSON dump to a pack and show what is in the pack
+    """
+    parser = argparse.ArgumentParser(description="Convert a JSON dump of questions from the Open Trivia Database to "
+                                                 "an offline question pack")
+    parser.add_argument("--input", default=QUESTIONS_JSON,
+                        help="The JSON dump to convert (Default: ProgramData/questions.json)")
+    parser.add_argument("--output", default=QUESTIONS_PACK,
+                        help="The pack to write (Default: ProgramData/questions.pack)")
+    arguments = parser.parse_args()
+
+    start = time.perf_counter()
+    written = convert_json_to_pack(arguments.input, arguments.output)
+    print(f"Wrote {written} questions to {arguments.output} in {time.perf_counter() - start:.2f} seconds")
+
+    with QuestionPack(arguments.output) as pack:
+        for (category, difficulty, question_type), (count, _) in sorted(pack.sections.items()):
+            print(f" {category}, {difficulty}, {question_type}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,12 @@ import random
 
 from Maxs_Modules.files import SaveFile, load_questions_from_file, UserData
 from Maxs_Modules.network import get_ip, QuizGameServer, QuizGameClient, get_free_port
+from Maxs_Modules.async_network import AsyncQuizGameServer, AsyncQuizGameClient
+from Maxs_Modules.discovery_network import QuizDiscoveryResponder
+from Maxs_Modules.lobby_network import QuizRoomHost, get_lobby
+from Maxs_Modules.question_bank import QuestionSelection, load_bank_questions, load_seen_questions, \
+    remember_questions, get_question_hash
+from Maxs_Modules.question_prefetch import question_prefetcher, get_prefetch_key
 from Maxs_Modules.tools import try_convert, set_if_none, string_bool, sort_multi_array
 from Maxs_Modules.debug import debug_message, error
 from Maxs_Modules.renderer import Menu, Colour, print_text_on_same_line, clear, render_text, get_input, \
@@ -15,13 +21,20 @@ from Maxs_Modules.renderer import Menu, Colour, print_text_on_same_line, clear,
 # - - - - - - - Variables - - - - - - -#
 GAME_STORED_LOCATION = "UserData/Games/"
 CATEGORY_OFFSET_API = 9
-MAX_NUMBER_OF_QUESTIONS = 50
+
+# The API gives at most 50 questions per request, more are fetched in chunks (see api_get_questions())
+MAX_NUMBER_OF_QUESTIONS = 500
 quiz_categories = ("General Knowledge", "Books", "Film", "Music", "Musicals & Theatres", "Television", "Video Games",
                    "Board Games", "Science & Nature", "Computers", "Mathematics", "Mythology", "Sports", "Geography",
                    "History", "Politics", "Art", "Celebrities", "Animals", "Vehicles", "Comics", "Gadgets",
                    "Japanese Anime & Manga", "Cartoon & Animations")
 HOST_SERVER_BY_DEFAULT = False
 MAX_NUMBER_OF_PLAYERS = 10
+USE_ASYNC_NETWORKING = False
+
+# How long after the time limit the server waits for players to answer, covers the time given to read the answer and
+# the network
+ANSWER_DEADLINE_GRACE = 5
 
 
 # - - - - - - - Functions - - - - - - -#
@@ -379,6 +392,7 @@ class Game(SaveFile):
     bot_difficulty = None
     server_name = None
     server_port = None
+    host_in_room = None
     max_players = None
     how_many_players = None
     how_many_bots = None
@@ -408,6 +422,8 @@ class Game(SaveFile):
     bots = None
     backend = None
     server_thread = None
+    lobby = None
+    room_host = None
     user_reference = User
     bot_reference = Bot
 
@@ -466,6 +482,7 @@ class Game(SaveFile):
         self.bot_difficulty = try_convert(self.save_data.get("bot_difficulty"), int)
         self.server_name = try_convert(self.save_data.get("server_name"), str)
         self.server_port = try_convert(self.save_data.get("server_port"), int)
+        self.host_in_room = try_convert(self.save_data.get("host_in_room"), bool)
         self.max_players = try_convert(self.save_data.get("max_players"), int)
         self.how_many_players = try_convert(self.save_data.get("how_many_players"), int)
         self.how_many_bots = try_convert(self.save_data.get("how_many_bots"), int)
@@ -506,6 +523,7 @@ class Game(SaveFile):
         self.bot_difficulty = set_if_none(self.bot_difficulty, 50)
         self.server_name = set_if_none(self.server_name, "Quiz Game Server")
         self.server_port = set_if_none(self.server_port, 1234)
+        self.host_in_room = set_if_none(self.host_in_room, False)
         self.max_players = set_if_none(self.max_players, 4)
         self.how_many_players = set_if_none(self.how_many_players, 1)
         self.how_many_bots = set_if_none(self.how_many_bots, 0)
@@ -602,12 +620,28 @@ class Game(SaveFile):
 
     def get_questions(self) -> None:
         """
-        Gets the questions from the API or from the file depending on the online_enabled setting. Afterward it converts
-        the questions into Question objects and then shuffles the questions if the randomise_questions setting is True.
-        Finally, it saves the questions to the file.
+        Gets the questions from a set fetched in the background or the local question bank if they have enough that
+        match the settings, otherwise from the API or from the file depending on the online_enabled setting. Questions
+        that have been played before are left out unless there aren't enough new ones. Afterward it converts the
+        questions into Question objects and starts fetching the next game's questions in the background.
         """
-        # Check if the user is online
+        # Convert the settings to the api syntax, the question bank uses the same syntax
+        self.convert_question_settings_to_api()
+        prefetch_key = get_prefetch_key(self.question_amount, self.api_category, self.quiz_difficulty, self.api_type)
+
+        seen = load_seen_questions()
+        selection = QuestionSelection(self.question_amount, seen)
+
+        # Use a set fetched in the background if one is ready
         if self.online_enabled:
+            selection.add(question_prefetcher.take(prefetch_key) or [])
+
+        # Then try the question bank as it doesn't need the internet
+        if selection.get_needed() and UserData().question_bank_use:
+            selection.add(load_bank_questions(self.question_amount, *self.get_question_filters()))
+
+        # Check if the user is online
+        if selection.get_needed() and self.online_enabled:
 
             render_text("Getting questions from the internet...")
 
@@ -615,25 +649,51 @@ class Game(SaveFile):
             # if the user is offline and don't want to run the requests installation
             from Maxs_Modules.network import api_get_questions
 
-            # Convert the settings to the api syntax
-            self.convert_question_settings_to_api()
+            # Use the api to get the rest of the questions
+            selection.add(api_get_questions(selection.get_needed(), self.api_category, self.quiz_difficulty,
+                                            self.api_type, exclude=selection.get_excluded()))
 
-            # Use the api to get the questions
-            self.questions = api_get_questions(self.question_amount, self.api_category, self.quiz_difficulty,
-                                               self.api_type)
-
-        else:
+        # If that fails then make do with the saved questions that match the settings
+        if selection.get_needed():
 
             render_text("Loading questions from file...")
 
             # Load the question from the saved questions
-            self.questions = load_questions_from_file()
+            selection.add(load_questions_from_file(self.question_amount, *self.get_question_filters()))
+
+        self.questions = selection.get_questions()
+
+        # Only once the played questions that match have been used as well, fill the game up with any saved questions
+        # (new ones first). This is a separate selection so that these can't be picked ahead of the ones that match.
+        if len(self.questions) < self.question_amount:
+            picked = {get_question_hash(question) for question in self.questions}
+            fallback = QuestionSelection(self.question_amount - len(self.questions), seen, picked)
+            fallback.add(load_questions_from_file(self.question_amount + len(picked)))
+            self.questions += fallback.get_questions()
+        remember_questions(self.questions)
 
         debug_message("Questions: " + str(self.questions), "Game")
 
         # Convert the data into a list of Question objects
         self.convert_to_object(self.questions, Question)
 
+        # Fetch the questions for the next game (or playing again) while this one is played
+        if self.online_enabled:
+            question_prefetcher.request(prefetch_key)
+
+    def get_question_filters(self) -> tuple:
+        """
+        Converts the question settings into the filters used by the question bank and the question pack (only
+        questions that match and haven't been played are taken from the bank), call convert_question_settings_to_api()
+        first
+
+        @return: The category, difficulty and type, each None if it is "Any"
+        """
+        category = None if self.quiz_category == "Any" else self.quiz_category
+        difficulty = None if self.quiz_difficulty == "Any" else self.quiz_difficulty.lower()
+
+        return category, difficulty, self.api_type
+
     def convert_question_settings_to_api(self) -> None:
         """
         Since the API uses indices for the categories and lowercase strings for the types, this function converts the
@@ -646,6 +706,8 @@ class Game(SaveFile):
 
             # Add the offset to the index. This is because the api starts at 9 and not 0 (ends at 32)
             self.api_category = category_index + CATEGORY_OFFSET_API
+        else:
+            self.api_category = None
 
         # Convert the type if it is not any
         if self.question_type != "Any":
@@ -655,6 +717,8 @@ class Game(SaveFile):
                     self.api_type = "multiple"
                 case "True/False":
                     self.api_type = "boolean"
+        else:
+            self.api_type = None
 
     # __ GAME FUNCTIONS __
 
@@ -943,12 +1007,19 @@ class Game(SaveFile):
         # Don't clear the screen as information is printed before the menu
         question_menu.clear_screen = False
 
-        # Timings
-        start_time = time.time()
+        # Timings, on the monotonic clock so changing the computer's clock doesn't change them
+        start_time = time.monotonic()
+
+        # Players get the time limit to answer from when the question is shown, after that (and the grace period) the
+        # server moves on without them
+        answer_deadline = None
+        if self.time_limit is not None:
+            answer_deadline = start_time + self.time_limit + ANSWER_DEADLINE_GRACE
 
         # Show the question and get the user input
         question_menu.time_limit = self.time_limit
         question_menu.get_input()
+        answered_time = time.monotonic()
 
         if question_menu.user_input is not None:
             # As the user didn't miss then just leave the preheader blank
@@ -979,10 +1050,14 @@ class Game(SaveFile):
             render_text("\nTime's up!")
 
         # Store the time data
-        end_time = time.time() - start_time
+        end_time = answered_time - start_time
         debug_message("Time taken: " + str(end_time) + " seconds", "Game")
         current_user.times.append(end_time)
 
+        # The server works the time out again on its own clock, so that the players' times can be compared fairly
+        if isinstance(self.backend, QuizGameClient):
+            self.backend.send_answer_stamp(self.current_question, start_time, answered_time)
+
         # Make the bots answer
         if self.current_user_playing == 0:
             for bot in self.bots:
@@ -1002,14 +1077,17 @@ class Game(SaveFile):
         time.sleep(3)
 
         # Move onto the next question
-        self.next_question()
+        self.next_question(answer_deadline)
 
-    def next_question(self) -> None:
+    def next_question(self, answer_deadline: float = None) -> None:
         """
         Increases the current question by 1 and then checks if the game is over or not. If the game is over then it
         will run the game_end() function. If the game is not over then it show the scores if specified so in
         show_score_after_question_or_game and then will run the next question. If this is a network game then it will
         wait for all the players to answer or for the server to move on.
+
+        @param answer_deadline: The time.monotonic() the server stops waiting for the players to answer at, stamped
+        when the question was shown. If None then the server waits for everyone (Default: None)
         """
         # Move onto the next question
         self.current_question += 1
@@ -1026,38 +1104,28 @@ class Game(SaveFile):
         if is_server:
             render_text("Waiting for all players to answer...")
 
-            # Wait for all players to answer
-            loading_amount = 1
-            while True:
-                waiting = False
-                users_waiting = []
+            # Wait for all players to answer, the backend wakes up as soon as a player answers
+            users_waiting = self.backend.wait_for_answers(answer_deadline)
+            while users_waiting:
+                print_text_on_same_line("Waiting for: " + ", ".join(users_waiting) + " to answer...")
+                users_waiting_now = self.backend.wait_for_answers(answer_deadline, users_waiting)
 
-                # Loop through the users until one is found that hasn't answered
-                for user in self.users:
-                    if user.has_answered is False:
-                        waiting = True
-                        users_waiting.append(user.name)
-
-                if not waiting:
+                # The deadline has passed
+                if users_waiting_now == users_waiting:
+                    render_text("\nOut of time, moving on without: " + ", ".join(users_waiting))
+                    debug_message(f"Players late to answer: {users_waiting}", "Game")
                     break
-                else:
-                    print_text_on_same_line(
-                        "Waiting for: " + ", ".join(users_waiting) + " to answer" + "." * loading_amount)
-                    loading_amount += 1
-                    if loading_amount > 3:
-                        loading_amount = 1
-                    time.sleep(.5)
+
+                users_waiting = users_waiting_now
 
             debug_message("All players have answered", "Game")
 
             # Moved on so reset question state
             self.users[self.current_user_playing].has_answered = False
 
-            # Sync the players and bots (.5 seconds so the messages are separate)
+            # Sync the players and bots, messages are framed so they can be sent straight after each other
             self.backend.sync_players()
-            time.sleep(.5)
             self.backend.sync_bots()
-            time.sleep(.5)
             self.backend.send_message_to_all("Move on to: game finished / show scores / next question", "move_on")
 
         # If this is a client then wait for the server to sync and all players to answer
@@ -1159,7 +1227,8 @@ class Game(SaveFile):
     def reset(self) -> None:
         """
         Resets the game back to a state that allows the game to be played again from the start. This will clear all user
-         data but all settings and questions will be kept. The questions will be reshuffled is specified so
+         data but all settings will be kept. If a new set of questions has been fetched in the background then that is
+         used, otherwise the questions are kept and reshuffled if specified so
         """
 
         # Reset the current question
@@ -1173,6 +1242,21 @@ class Game(SaveFile):
         for bot in self.bots:
             bot.reset()
 
+        # Use fresh questions if they are ready, a joined game gets its questions from the server
+        if self.online_enabled and not self.joined_game:
+            prefetch_key = get_prefetch_key(self.question_amount, self.api_category, self.quiz_difficulty,
+                                            self.api_type)
+            questions = question_prefetcher.take(prefetch_key)
+
+            if questions:
+                selection = QuestionSelection(self.question_amount, load_seen_questions())
+                selection.add(questions)
+
+                self.questions = selection.get_questions()
+                remember_questions(self.questions)
+                self.convert_to_object(self.questions, Question)
+                question_prefetcher.request(prefetch_key)
+
         # Shuffle the questions
         if self.randomise_questions:
             random.shuffle(self.questions)
@@ -1220,6 +1304,16 @@ class Game(SaveFile):
         except KeyError:
             pass
 
+        try:
+            del self.save_data["lobby"]
+        except KeyError:
+            pass
+
+        try:
+            del self.save_data["room_host"]
+        except KeyError:
+            pass
+
     def save(self) -> None:
         """
         Saves the game data to the file. Calls the prepare_save_data() function so the game can be in any-state when
@@ -1273,9 +1367,9 @@ class Game(SaveFile):
         """
         while True:
 
-            networking_menu_options = ["Server Name", "Server Port", "Max Players", "Next", "Back"]
-            networking_menu_values = [str(self.server_name), str(self.server_port), str(self.max_players),
-                                      "Waiting for players", "Gameplay Settings"]
+            networking_menu_options = ["Server Name", "Server Port", "Host in a room", "Max Players", "Next", "Back"]
+            networking_menu_values = [str(self.server_name), str(self.server_port), str(self.host_in_room),
+                                      str(self.max_players), "Waiting for players", "Gameplay Settings"]
 
             networking_menu = Menu("Game Settings: Networking", [networking_menu_options, networking_menu_values], True)
 
@@ -1286,7 +1380,15 @@ class Game(SaveFile):
 
                 case "Server Port":
                     self.server_port = networking_menu.get_input_option(int, "Server Port (1-65535)", range(1, 65535))
-                    self.server_port = get_free_port(get_ip(), self.server_port)
+
+                    # Rooms share the port with the other games in the lobby, so it doesn't have to be free
+                    if not self.host_in_room:
+                        self.server_port = get_free_port(get_ip(), self.server_port)
+
+                case "Host in a room":
+                    self.host_in_room = networking_menu.get_input_option(string_bool, "Host in a room, so other games "
+                                                                                      "can share the port "
+                                                                                      "(True/False)")
 
                 case "Max Players":
                     self.max_players = networking_menu.get_input_option(int, f"Max Players (max "
@@ -1347,7 +1449,9 @@ class Game(SaveFile):
                     self.time_limit = gameplay_menu.get_input_option(int, "Time limit (seconds) (max 60)", range(1, 61))
 
                 case "Question Amount":
-                    self.question_amount = gameplay_menu.get_input_option(int, "Question Amount (1-50)", range(1, 51))
+                    self.question_amount = gameplay_menu.get_input_option(int, "Question Amount (1-"
+                                                                          f"{MAX_NUMBER_OF_QUESTIONS})",
+                                                                          range(1, MAX_NUMBER_OF_QUESTIONS + 1))
 
                 case "Category":
                     category_menu = Menu("Category", quiz_categories)
@@ -1427,8 +1531,23 @@ class Game(SaveFile):
         shown, showing all the players currently in the game, it refreshes itself every 3 seconds via manipulation
         of the time_limit in the Menu class. When the host decides to start the game any old unconnected users will
         be removed from the game and the game will start. The server will then sync the game data with the clients
-        and play() will be called.
-        """
+        and play() will be called. If the game is hosted in a room then a room in the lobby on the server port is used
+        instead of a new server (see get_lobby()). If another process is running the lobby then the game gets its own
+        server and adds a room for it to that lobby (see QuizRoomHost). Otherwise the server is advertised on the
+        LAN while waiting (see QuizDiscoveryResponder).
+        """
+
+        discovery = None
+        room_id = None
+
+        # Get the lobby to host the room in, it is started if no other game is using the port yet (None if another
+        # process is, see below)
+        if self.host_in_room and self.lobby is None:
+            try:
+                self.lobby = get_lobby(self.server_port)
+            except OSError:
+                error("Could not create a lobby (most likely already running on ip/port). Please try again.")
+                return
 
         # Set up the host (if there isn't one already) (host is always the first user in the list)
         if len(self.users) == 0:
@@ -1436,35 +1555,76 @@ class Game(SaveFile):
         self.users[0].is_host = True
         self.users[0].is_connected = True
 
-        # Create a socket
-        try:
-            self.server_port = get_free_port(get_ip(), self.server_port)
-            self.backend = QuizGameServer(get_ip(), self.server_port)
-            self.backend.game = self
-        except OSError:
-            error("Could not create a server (most likely already running on ip/port). Please try again.")
-            return
+        # Host in a room of the lobby, the lobby is already running so there is no socket or thread to create
+        if self.lobby is not None:
+            self.server_port = self.lobby.port
+            self.backend = self.lobby.create_room(self)
+            room_id = self.backend.room_id
+            debug_message(f"Hosting in room {room_id} on port {self.server_port}", "game_server")
 
-        # Thread the server
-        self.server_thread = threading.Thread(target=self.backend.run)
-        self.server_thread.start()
+        else:
+            # Create a socket (if another process's lobby is on the server port then the next free one is used)
+            try:
+                server_port = get_free_port(get_ip(), self.server_port)
+                server_type = AsyncQuizGameServer if USE_ASYNC_NETWORKING else QuizGameServer
+                self.backend = server_type(get_ip(), server_port)
+                self.backend.game = self
+            except OSError:
+                error("Could not create a server (most likely already running on ip/port). Please try again.")
+                return
+
+            # Thread the server
+            self.server_thread = threading.Thread(target=self.backend.run)
+            self.server_thread.start()
+
+            debug_message("Server started on " + get_ip() + ":" + str(server_port) + "!", "game_server")
+
+        if self.lobby is None and self.host_in_room:
+            # The players join through the other process's lobby, it passes them on to this game's server
+            try:
+                self.room_host = QuizRoomHost(self.backend, get_ip(), self.server_port, server_port)
+                room_id = self.room_host.room_id
+            except OSError as e:
+                self.kill_server()
+                error(f"Could not add a room to the lobby on port {self.server_port} ({e}). Please try again.")
+                return
+
+            debug_message(f"Hosting in room {room_id} of the lobby on port {self.server_port}", "game_server")
+
+        elif self.lobby is None:
+            self.server_port = server_port
 
-        debug_message("Server started on " + get_ip() + ":" + str(self.server_port) + "!", "game_server")
+            # Let players on the LAN find the game while it is waiting for them
+            discovery = QuizDiscoveryResponder(self, self.server_port)
+            try:
+                discovery.start()
+            except OSError as e:
+                debug_message(f"Could not advertise the server: {e}", "game_server")
+                discovery = None
 
         # Wait for players to join
         self.game_started = False
         self.backend.running = True
         while True:
             ip_text = f"Server IP: {get_ip()}:{self.server_port}"
+            if room_id is not None:
+                ip_text += f" Room: {room_id}"
             players = [ip_text]
 
             # Convert any users that have been added in
             self.convert_to_object(self.users, User)
 
+            # Show the round trip time of each player that has been measured, so the host can see who has a bad
+            # connection
+            clock_diagnostics = self.backend.get_clock_diagnostics()
+
             # Loop through all the users
             for user in self.users:
                 # Add them to the list
-                players.append(user.styled_name())
+                if user.name in clock_diagnostics:
+                    players.append(f"{user.styled_name()} ({clock_diagnostics[user.name]['rtt'] * 1000:.0f}ms)")
+                else:
+                    players.append(user.styled_name())
             players.append("Start game")
             players.append("Back")
 
@@ -1480,9 +1640,15 @@ class Game(SaveFile):
 
                 case "Back":
                     # Kill the server
-                    self.backend.kill()
+                    if discovery is not None:
+                        discovery.stop()
+                    self.kill_server()
                     return
 
+        # The game can't be joined once it has started, so stop advertising it
+        if discovery is not None:
+            discovery.stop()
+
         # Wait loop has broken so the game has started
         self.game_started = True
         self.users[0].is_connected = True
@@ -1496,7 +1662,6 @@ class Game(SaveFile):
         self.backend.sync_game()
 
         # Send the start game message after syncing
-        time.sleep(0.5)
         self.backend.send_message_to_all("synced so start game", "move_on")
 
         if self.check_server_error():
@@ -1513,18 +1678,34 @@ class Game(SaveFile):
             return
 
         # Kill the server
+        self.kill_server()
+
+    def kill_server(self):
+        """
+        Kills the server, if the game has a room in another process's lobby then the room is removed from it as well
+        """
         self.backend.kill()
 
-    def join_game(self, ip, port):
+        if self.room_host is not None:
+            self.room_host.close()
+            self.room_host = None
+
+    def join_game(self, ip, port, room=None):
         """
         Joins a game, by creating a socket and connecting to the server on the given ip and port. The game is then
         ran when the server is ready. May return prematurely if an error occurs.
+
+        @param ip: The ip of the server
+        @param port: The port of the server
+        @param room: The room to join if the server is hosting many games, None if it isn't (Default: None)
         """
         # Create a socket
         try:
             render_text("Connecting to server...")
-            self.backend = QuizGameClient(ip, port)
+            client_type = AsyncQuizGameClient if USE_ASYNC_NETWORKING else QuizGameClient
+            self.backend = client_type(ip, port)
             self.backend.game = self
+            self.backend.room = room
         except OSError:
             error("Could not connect (socket not created). Please try again.")
             return
@@ -1,13 +1,16 @@
 # - - - - - - - Imports - - - - - - -#
 import os
 import sys
+import threading
 
 from natsort import natsorted
 
-from Maxs_Modules.debug import debug_message, init_debug, close_debug_session, handle_arg
+from Maxs_Modules.debug import debug_message, init_debug, close_debug_session, handle_arg, error
 from Maxs_Modules.files import UserData
-from game import get_saved_games, Game
-from Maxs_Modules.network import get_ip
+from game import get_saved_games, Game, USE_ASYNC_NETWORKING
+from Maxs_Modules.network import get_ip, QuizSpectatorClient
+from Maxs_Modules.async_network import AsyncQuizSpectatorClient
+from Maxs_Modules.discovery_network import discover_servers
 from Maxs_Modules.renderer import Menu, clear, render_text, get_input, init_gui, gui_close
 from Maxs_Modules.tools import string_bool, ip_address
 
@@ -122,39 +125,139 @@ def new_game() -> None:
 def join_game() -> None:
     """
     Shows the user a menu to join a game, the user can enter the ip and port of the server to join. The default values
-    are the local ip and port 1234 as that is the default port for the server.
+    are the local ip and port 1234 as that is the default port for the server. The room only needs to be entered if the
+    server is hosting many games.
     """
     # Set the default server values, this makes it easier for joining a local game
     ip = get_ip()
     port = 1234
+    room = None
 
     # Show the join game menu
-    join_menu_options = ["IP", "Port", "Join Game", "Back"]
-    join_menu_values = [str(ip), str(port), "Join Game", "Main Menu"]
+    join_menu_options = ["Find Games", "IP", "Port", "Room", "Join Game", "Spectate", "Back"]
+    join_menu_values = ["Search the LAN", str(ip), str(port), str(room), "Join Game", "Watch the scores",
+                        "Main Menu"]
     join_menu = Menu("Join Game", [join_menu_options, join_menu_values], True)
 
     while True:
         # Make sure that if the values were updated that they are still in string form for the menu
-        join_menu_values[0] = str(ip)
-        join_menu_values[1] = str(port)
+        join_menu_values[1] = str(ip)
+        join_menu_values[2] = str(port)
+        join_menu_values[3] = str(room)
 
         # Get the user to input the ip and port
         match join_menu.get_input():
+            case "Find Games":
+                server = find_games()
+                if server is not None:
+                    ip = server["ip"]
+                    port = server["port"]
+
             case "IP":
                 ip = join_menu.get_input_option(ip_address, "Please enter the IP: ")
 
             case "Port":
                 port = join_menu.get_input_option(int, "Please enter the port: (1-65535)", range(1, 65535))
 
+            case "Room":
+                room = join_menu.get_input_option(str, "Please enter the room (leave blank if there isn't one): ")
+                room = (room or "").strip().upper() or None
+
             case "Join Game":
                 # Create a new game object and join the game
                 quiz = Game()
-                quiz.join_game(ip, port)
+                quiz.join_game(ip, port, room)
+
+            case "Spectate":
+                spectate_game(ip, port, room)
 
             case "Back":
                 break
 
 
+def spectate_game(ip: str, port: int, room: str = None) -> None:
+    """
+    Watch a game without playing in it, the question, how many players have answered and the scores are shown and
+    refreshed every 3 seconds until the user goes back or the server closes
+
+    @param ip: The ip of the server
+    @param port: The port of the server
+    @param room: The room to watch if the server is hosting many games, None if it isn't (Default: None)
+    """
+    try:
+        render_text("Connecting to server...")
+        client_type = AsyncQuizSpectatorClient if USE_ASYNC_NETWORKING else QuizSpectatorClient
+        client = client_type(ip, port)
+        client.room = room
+    except OSError:
+        error("Could not connect (socket not created). Please try again.")
+        return
+
+    client.running = True
+    threading.Thread(target=client.run, daemon=True).start()
+    client.join()
+
+    while client.running:
+        lines = ["Waiting for the game to start"]
+
+        question = client.question
+        if question is not None and question["finished"]:
+            lines = ["Game finished"]
+        elif question is not None and question["started"]:
+            lines = [f"Question {question['number']} of {question['total']}: {question['question']}"]
+
+        if client.answers is not None:
+            lines.append(f"Answered: {client.answers['answered']} of {client.answers['players']}")
+
+        for name, points in client.scores:
+            lines.append(f"{name}: {points}")
+
+        lines.append("Back")
+        spectate_menu = Menu("Spectating", lines)
+        spectate_menu.time_limit = 3
+
+        if spectate_menu.get_input() == "Back":
+            break
+
+    if client.error is not None:
+        error(client.error)
+
+    if client.running:
+        client.stop()
+        client.close_connection(client.client)
+
+
+def find_games() -> dict | None:
+    """
+    Shows the user a menu of the games waiting for players on the LAN, fastest first, so they can pick one to join
+    instead of typing the ip and port
+
+    @return: The server picked (see discover_servers()), or None if the user went back
+    """
+    while True:
+        render_text("Searching for games...")
+        servers = discover_servers()
+
+        # Name each server with its address, as many servers can have the same name
+        server_options = {f"{server['name']} ({server['ip']}:{server['port']})": server for server in servers}
+        server_values = [f"{server['players']}/{server['max_players']} players, {server['rtt'] * 1000:.0f}ms"
+                         for server in servers]
+
+        find_menu_options = list(server_options) + ["Refresh", "Back"]
+        find_menu_values = server_values + ["Search again", "Join Game"]
+        find_menu = Menu("Find Games", [find_menu_options, find_menu_values], True)
+
+        match find_menu.get_input():
+            case "Refresh":
+                continue
+
+            case "Back":
+                return None
+
+            case server_name:
+                return server_options[server_name]
+
+
 def settings() -> None:
     """
     Show the user a menu that allows them to change their already specified settings
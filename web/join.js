@@ -0,0 +1,161 @@
+// Plays a hosted game in the browser using QuizSocket, the questions are marked here in the same way as mark_question()
+// in game.py and the player is synced to the server after each one
+
+const output_div = document.getElementById("output")
+const join_form = document.getElementById("join_form")
+
+let quiz_socket = null
+let question_index = null
+let question_timer = null
+let shown_time = null
+
+function join_game(){
+    const server = document.getElementById("server").value.trim()
+    const room = document.getElementById("room").value.trim()
+    const name = document.getElementById("name").value.trim()
+
+    if (!server || !name){
+        show_message("Enter the server and your name")
+        return
+    }
+
+    quiz_socket = new QuizSocket(`ws://${server}`, name, room || null)
+    quiz_socket.on("move_on", move_on)
+    quiz_socket.on("server_error", (message) => show_message(`Server error: ${message}`))
+    quiz_socket.on("close", () => {
+        if (question_index === null || question_index < quiz_socket.game.questions.length){
+            show_message("Disconnected from the server")
+        }
+    })
+
+    join_form.style.display = "none"
+    show_message("Waiting for the host to start the game...")
+}
+
+function move_on(){
+    const user = quiz_socket.user
+
+    // The first move on starts the game, after that each one is the next question
+    if (question_index === null){
+        question_index = quiz_socket.game.current_question
+    } else {
+        question_index += 1
+        user.has_answered = false
+        quiz_socket.sync_user()
+    }
+
+    if (question_index >= quiz_socket.game.questions.length){
+        show_scores()
+    } else {
+        show_question()
+    }
+}
+
+function show_question(){
+    const game = quiz_socket.game
+    const question = game.questions[question_index]
+
+    const options = question.incorrect_answers.concat([question.correct_answer])
+    if (game.randomise_answer_placement){
+        options.sort(() => Math.random() - 0.5)
+    }
+
+    output_div.innerHTML = ""
+    add_line("p", `Question ${question_index + 1} of ${game.questions.length} | User: ${quiz_socket.user.name}`,
+             "question-header")
+    add_line("h2", question.question, "menu-title")
+
+    for (const option of options){
+        const button = document.createElement("button")
+        button.textContent = option
+        button.onclick = () => answer(option)
+
+        const container = document.createElement("div")
+        container.className = "menu-option"
+        container.appendChild(button)
+        output_div.appendChild(container)
+    }
+
+    shown_time = performance.now() / 1000
+    if (game.time_limit){
+        question_timer = setTimeout(() => answer(null), game.time_limit * 1000)
+    }
+}
+
+function answer(option){
+    const game = quiz_socket.game
+    const user = quiz_socket.user
+    const question = game.questions[question_index]
+    const answered_time = performance.now() / 1000
+
+    // The time limit may have run out just as an option was picked
+    if (user.has_answered){
+        return
+    }
+
+    clearTimeout(question_timer)
+
+    if (option === null){
+        user.answers.push("Missed_Incorrect")
+        user.points += game.points_for_no_answer
+        user.questions_missed += 1
+        show_message("Time's up!")
+
+    } else if (option === question.correct_answer){
+        let point = game.points_for_correct_answer
+        if (user.streak > 0){
+            point = game.points_multiplier_for_a_streak * user.streak
+        }
+
+        user.answers.push("Correct")
+        user.points += point
+        user.streak += 1
+        user.highest_streak = Math.max(user.highest_streak, user.streak)
+        user.correct += 1
+        show_message("Correct!")
+
+    } else {
+        user.answers.push("Incorrect")
+        user.points += game.points_for_incorrect_answer
+        user.streak = 0
+        user.incorrect += 1
+        show_message(`Incorrect. The correct answer was: ${question.correct_answer}`)
+    }
+
+    user.times.push(answered_time - shown_time)
+    user.has_answered = true
+
+    // The server works the time out again on its own clock, the same as for the Python clients
+    quiz_socket.send("answer_stamp", {"question": question_index, "shown": shown_time, "answered": answered_time})
+    quiz_socket.sync_user()
+
+    add_line("p", "Waiting for the other players...")
+}
+
+function show_scores(){
+    const users = (quiz_socket.game.users || []).slice().sort((a, b) => b.points - a.points)
+
+    output_div.innerHTML = ""
+    add_line("h2", "Game finished", "menu-title")
+    for (const user of users){
+        add_line("p", `${user.name}: ${user.points} points (${user.correct} correct, ${user.incorrect} incorrect)`)
+    }
+}
+
+function show_message(text){
+    output_div.innerHTML = ""
+    add_line("p", text)
+}
+
+function add_line(tag, text, class_name = ""){
+    // Text from the server is only ever set as text, never as HTML
+    const line = document.createElement(tag)
+    line.textContent = text
+    line.className = class_name
+    output_div.appendChild(line)
+}
+
+// The server can be filled in from the link, i.e. join.html?server=192.168.1.2:1234&room=ABCD
+const parameters = new URLSearchParams(window.location.search)
+document.getElementById("server").value = parameters.get("server") || ""
+document.getElementById("room").value = parameters.get("room") || ""
@@ -0,0 +1,131 @@
+// Lets a browser join a hosted game without the Python client (see join.html). The server accepts WebSockets on the
+// same port as the Python clients and sends the same messages, as JSON
+
+const LIST_LENGTH_KEY = "#len"
+
+class QuizSocket {
+
+    constructor(url, name, room = null){
+        // The player, sent when joining and then whenever it changes (see sync_user)
+        this.user = create_user(name)
+        this.room = room
+
+        // The server's game data, kept up to date by the syncs
+        this.game = {}
+        this.handlers = {}
+
+        this.socket = new WebSocket(url)
+        this.socket.onopen = () => this.send("client_join", this.user, {"codecs": ["json"], "room": this.room})
+        this.socket.onmessage = (event) => this.handle_message(JSON.parse(event.data), performance.now() / 1000)
+        this.socket.onclose = () => this.emit("close", null)
+    }
+
+    on(message_type, handler){
+        // Call the handler with each message of this type, after it has been applied to the game
+        this.handlers[message_type] = handler
+    }
+
+    emit(message_type, message){
+        const handler = this.handlers[message_type]
+        if (handler){
+            handler(message, this)
+        }
+    }
+
+    send(message_type, message, extra = {}){
+        this.socket.send(JSON.stringify({"message": message, "sender": null, "recipient": null,
+                                         "message_type": message_type, ...extra}))
+    }
+
+    sync_user(){
+        // Let the server know the player has changed (i.e. answered a question)
+        this.send("sync_player", this.user)
+    }
+
+    handle_message(message, received){
+        switch (message.message_type){
+            case "ping":
+                // The times are on this page's clock in seconds, the server works out the offset to its own clock
+                this.send("pong", {"sent": message.message, "received": received, "replied": performance.now() / 1000})
+                break
+
+            case "sync_game":
+            case "sync_players":
+            case "sync_bots":
+                apply_patch(this.game, message.message)
+                this.send("sync_ack", {"revision": message.message.revision})
+                break
+
+            case "server_error":
+                this.socket.close()
+                break
+        }
+
+        this.emit(message.message_type, message.message)
+    }
+}
+
+function create_user(name){
+    // The same values as a new User in the Python client
+    return {"name": name, "colour": null, "icon": null, "points": 0, "correct": 0, "incorrect": 0, "streak": 0,
+            "highest_streak": 0, "questions_missed": 0, "answers": [], "times": [], "has_answered": false}
+}
+
+function apply_patch(root, patch){
+    // Apply a patch from the server in the same way as apply_patch() in network.py
+
+    // A snapshot replaces the sections
+    for (const [key, value] of Object.entries(patch.snapshot || {})){
+        root[key] = structuredClone(value)
+    }
+
+    for (const [path, value] of patch.set || []){
+        set_patch_value(root, path, value)
+    }
+
+    // Removed list items are handled by the length changing, so only keys need removing
+    for (const path of patch.remove || []){
+        const parent = get_patch_parent(root, path, false)
+        if (parent && !Array.isArray(parent)){
+            delete parent[path[path.length - 1]]
+        }
+    }
+}
+
+function set_patch_value(root, path, value){
+    const parent = get_patch_parent(root, path, true)
+    const key = path[path.length - 1]
+
+    // Resize the list to the new length, new items are null until they are set
+    if (key === LIST_LENGTH_KEY){
+        const old_length = parent.length
+        parent.length = value
+        parent.fill(null, old_length)
+        return
+    }
+
+    parent[key] = value
+}
+
+function get_patch_parent(root, path, create){
+    let container = root
+
+    for (let index = 0; index < path.length - 1; index++){
+        let child = container[path[index]]
+
+        if (child === undefined || child === null){
+            if (!create){
+                return null
+            }
+
+            // The next key says if it should be a list or a dict
+            const next_key = path[index + 1]
+            child = (typeof next_key === "number" || next_key === LIST_LENGTH_KEY) ? [] : {}
+            container[path[index]] = child
+        }
+
+        container = child
+    }
+
+    return container
+}